@@ -0,0 +1,316 @@
+import json
+import logging
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import connection
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from .models import CartSnapshot
+
+logger = logging.getLogger(__name__)
+
+CART_COOKIE = "pos_cart"
+
+
+class CartConflict(Exception):
+    """The cart changed since the version the client last saw."""
+
+    def __init__(self, cart):
+        super().__init__(f"Cart is at version {cart.version}")
+        self.cart = cart
+
+
+class CartLine:
+    __slots__ = (
+        "medicine_id",
+        "name",
+        "batch_number",
+        "expiry_date",
+        "price",
+        "gst",
+        "quantity",
+    )
+
+    def __init__(
+        self, medicine_id, name, batch_number, expiry_date, price, gst, quantity
+    ):
+        self.medicine_id = medicine_id
+        self.name = name
+        self.batch_number = batch_number
+        self.expiry_date = expiry_date
+        self.price = Decimal(price)
+        self.gst = Decimal(gst)
+        self.quantity = quantity
+
+    @property
+    def base(self):
+        return self.price * self.quantity
+
+    @property
+    def tax(self):
+        return self.base * self.gst / Decimal(100)
+
+    @property
+    def total(self):
+        return self.base + self.tax
+
+    def to_list(self):
+        return [
+            self.medicine_id,
+            self.name,
+            self.batch_number,
+            self.expiry_date,
+            str(self.price),
+            str(self.gst),
+            self.quantity,
+        ]
+
+
+class Cart:
+    """
+    Cart lines keyed by medicine id with exact running totals. Every mutation
+    adjusts the totals by the changed line only, so nothing is re-summed.
+    """
+
+    __slots__ = ("key", "lines", "subtotal", "tax_total", "version")
+
+    def __init__(self, key, lines=(), version=0):
+        self.key = key
+        self.lines = {}
+        self.subtotal = Decimal(0)
+        self.tax_total = Decimal(0)
+        self.version = version
+        for line in lines:
+            self.lines[str(line.medicine_id)] = line
+            self._count(line, 1)
+
+    @property
+    def grand_total(self):
+        return self.subtotal + self.tax_total
+
+    def __len__(self):
+        return len(self.lines)
+
+    def items(self):
+        return self.lines.items()
+
+    def get(self, medicine_id):
+        return self.lines.get(str(medicine_id))
+
+    def add(self, line):
+        existing = self.get(line.medicine_id)
+        if existing is not None:
+            self.set_quantity(line.medicine_id, existing.quantity + line.quantity)
+        else:
+            self.lines[str(line.medicine_id)] = line
+            self._count(line, 1)
+
+    def set_quantity(self, medicine_id, quantity):
+        line = self.get(medicine_id)
+        if line is None or quantity < 1:
+            return
+        self._count(line, -1)
+        line.quantity = quantity
+        self._count(line, 1)
+
+    def remove(self, medicine_id):
+        line = self.lines.pop(str(medicine_id), None)
+        if line is not None:
+            self._count(line, -1)
+
+    def clear(self):
+        self.lines = {}
+        self.subtotal = Decimal(0)
+        self.tax_total = Decimal(0)
+
+    def checkout_items(self):
+        # The shape billing.services.create_invoice expects
+        return {key: {"quantity": line.quantity} for key, line in self.lines.items()}
+
+    def to_data(self):
+        return [line.to_list() for line in self.lines.values()]
+
+    @classmethod
+    def from_data(cls, key, data, version):
+        return cls(key, (CartLine(*row) for row in data), version)
+
+    def _count(self, line, sign):
+        self.subtotal += sign * line.base
+        self.tax_total += sign * line.tax
+
+
+class BaseCartStore:
+    """
+    Where carts live between requests. `mutate` applies a change to the cart
+    stored under `key` and bumps its version; when `expected_version` is given
+    and the cart has moved on, it raises CartConflict instead.
+    """
+
+    def load(self, key):
+        raise NotImplementedError
+
+    def mutate(self, key, change, expected_version=None):
+        raise NotImplementedError
+
+
+class LRUCartStore(BaseCartStore):
+    """
+    Keeps the most recently used carts in process memory and writes changed
+    ones to CartSnapshot from a background thread every `flush_interval`
+    seconds, so a click never waits on the database.
+    """
+
+    def __init__(self, capacity=500, flush_interval=2.0):
+        self.capacity = capacity
+        self.flush_interval = flush_interval
+        self._carts = OrderedDict()
+        self._dirty = {}
+        self._flushing = {}
+        self._lock = threading.RLock()
+        self._flusher = None
+
+    def load(self, key):
+        with self._lock:
+            return self._get(key)
+
+    def mutate(self, key, change, expected_version=None):
+        with self._lock:
+            cart = self._get(key)
+            if expected_version is not None and expected_version != cart.version:
+                # The client may have been served by another process since
+                # this one cached the cart; a settled cart is re-read
+                if key not in self._dirty and key not in self._flushing:
+                    self._forget(key)
+                    cart = self._get(key)
+                if expected_version != cart.version:
+                    raise CartConflict(cart)
+            change(cart)
+            cart.version += 1
+            self._dirty[key] = cart
+            self._start_flusher()
+            return cart
+
+    def flush(self):
+        with self._lock:
+            dirty, self._dirty = self._dirty, {}
+            self._flushing = dirty
+            snapshots = [
+                (key, cart.version, cart.to_data()) for key, cart in dirty.items()
+            ]
+        if not snapshots:
+            return
+        try:
+            written = self._write_snapshots(snapshots)
+        except Exception:
+            logger.warning("Could not persist POS carts", exc_info=True)
+            with self._lock:
+                # Retry on the next pass unless they changed again meanwhile
+                for key, cart in dirty.items():
+                    self._dirty.setdefault(key, cart)
+        else:
+            with self._lock:
+                # Another process has saved these carts at a version at least
+                # as new as ours: drop our copies so the next request reads
+                # theirs from CartSnapshot instead of overwriting it
+                for key in dirty:
+                    if key not in written:
+                        self._forget(key)
+        finally:
+            with self._lock:
+                self._flushing = {}
+
+    def _write_snapshots(self, snapshots):
+        # Upsert that only ever moves a snapshot forward. Returns the keys
+        # whose row was written; a key missing from it lost to a newer row.
+        # A cleared cart is kept as an empty row so its version survives.
+        table = connection.ops.quote_name(CartSnapshot._meta.db_table)
+        now = connection.ops.adapt_datetimefield_value(timezone.now())
+        rows = ", ".join(["(%s, %s, %s, %s)"] * len(snapshots))
+        params = []
+        for key, version, data in snapshots:
+            params += [key, version, json.dumps(data), now]
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'INSERT INTO {table} ("key", "version", "data", "updated_at") '
+                f"VALUES {rows} "
+                'ON CONFLICT ("key") DO UPDATE SET "version" = excluded."version", '
+                '"data" = excluded."data", "updated_at" = excluded."updated_at" '
+                f'WHERE {table}."version" < excluded."version" '
+                'RETURNING "key"',
+                params,
+            )
+            return {key for (key,) in cursor.fetchall()}
+
+    def _forget(self, key):
+        self._carts.pop(key, None)
+        self._dirty.pop(key, None)
+
+    def _get(self, key):
+        cart = self._carts.get(key)
+        if cart is not None:
+            self._carts.move_to_end(key)
+            return cart
+
+        cart = self._dirty.get(key)
+        if cart is None:
+            cart = self._flushing.get(key)
+        if cart is None:
+            snapshot = CartSnapshot.objects.filter(key=key).first()
+            if snapshot is not None:
+                cart = Cart.from_data(key, snapshot.data, snapshot.version)
+            else:
+                cart = Cart(key)
+        self._carts[key] = cart
+        # Evicted carts that are still dirty stay in _dirty until flushed
+        while len(self._carts) > self.capacity:
+            self._carts.popitem(last=False)
+        return cart
+
+    def _start_flusher(self):
+        if self._flusher is not None:
+            return
+        self._flusher = threading.Thread(
+            target=self._flush_loop, name="pos-cart-flusher", daemon=True
+        )
+        self._flusher.start()
+
+    def _flush_loop(self):
+        while True:
+            time.sleep(self.flush_interval)
+            self.flush()
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_cart_store():
+    global _store
+    with _store_lock:
+        if _store is None:
+            config = settings.POS_CART_STORE
+            _store = import_string(config["BACKEND"])(**config.get("OPTIONS", {}))
+        return _store
+
+
+def close_cart_store():
+    """Write out the carts changed since the last flush, if any were."""
+    with _store_lock:
+        store = _store
+    if store is not None and hasattr(store, "flush"):
+        store.flush()
+
+
+def get_cart_key(request):
+    return request.COOKIES.get(CART_COOKIE) or uuid.uuid4().hex
+
+
+def remember_cart_key(response, key):
+    response.set_cookie(CART_COOKIE, key, httponly=True, samesite="Lax")
+    return response
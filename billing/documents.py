@@ -0,0 +1,156 @@
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import ExitStack
+
+import django
+from django.template.loader import render_to_string
+from django.utils import timezone
+
+from .models import Invoice, InvoiceDocument, InvoiceItem
+
+FORMATS = {"html": "html", "text": "txt"}  # stored field -> file extension
+TEXT_WIDTH = 40
+
+# Below this many missing documents, rendering in-process beats starting a pool
+POOL_THRESHOLD = 20
+CHUNK_SIZE = 200
+
+
+def document_data(invoice, items):
+    # Plain data for the templates, so rendering can happen in another process
+    return {
+        "invoice": {
+            "invoice_number": invoice.invoice_number,
+            "created_at": invoice.created_at,
+            "customer": {"name": invoice.customer.name} if invoice.customer else None,
+            "payment_method": invoice.payment_method,
+            "total_amount": invoice.total_amount,
+            "gst_amount": invoice.gst_amount,
+            "grand_total": invoice.grand_total,
+        },
+        "items": [
+            {
+                "medicine": {"name": item.medicine.name},
+                "batch": {"batch_number": item.batch.batch_number},
+                "quantity": item.quantity,
+                "unit_price": item.unit_price,
+                "gst_percent": item.gst_percent,
+                "gst_amount": item.gst_amount,
+                "total_amount": item.total_amount,
+            }
+            for item in items
+        ],
+    }
+
+
+def render_text(data):
+    invoice = data["invoice"]
+    created_at = timezone.localtime(invoice["created_at"])
+    rule = "-" * TEXT_WIDTH
+    rows = [
+        "PharmaFlow Pharmacy".center(TEXT_WIDTH),
+        rule,
+        f"Invoice: {invoice['invoice_number']}",
+        f"Date: {created_at:%Y-%m-%d %H:%M}",
+        f"Customer: {(invoice['customer'] or {}).get('name', 'Walking Customer')}",
+        rule,
+    ]
+    for item in data["items"]:
+        rows.append(item["medicine"]["name"][:TEXT_WIDTH])
+        quantity = f"  {item['quantity']} x {item['unit_price']:.2f}"
+        quantity += f" +{item['gst_percent']:.2f}%"
+        rows.append(
+            f"{quantity}{item['total_amount']:>{TEXT_WIDTH - len(quantity)}.2f}"
+        )
+    rows.append(rule)
+    for label, amount in (
+        ("Subtotal", invoice["total_amount"]),
+        ("GST", invoice["gst_amount"]),
+        ("Grand Total", invoice["grand_total"]),
+    ):
+        rows.append(f"{label}{amount:>{TEXT_WIDTH - len(label)}.2f}")
+    rows.append(f"Paid by {invoice['payment_method']}")
+    return "\n".join(rows) + "\n"
+
+
+def render_document(data):
+    """(html, text), both zlib-compressed, for document_data() output."""
+    html = render_to_string("billing/print_invoice.html", data)
+    return zlib.compress(html.encode()), zlib.compress(render_text(data).encode())
+
+
+def save_invoice_document(invoice, items):
+    html, text = render_document(document_data(invoice, items))
+    document, _ = InvoiceDocument.objects.update_or_create(
+        invoice=invoice, defaults={"html": html, "text": text}
+    )
+    return document
+
+
+def get_invoice_document(invoice):
+    # The stored document; invoices saved before documents existed get theirs now
+    document = InvoiceDocument.objects.filter(invoice=invoice).first()
+    if document is None:
+        document = save_invoice_document(
+            invoice, invoice.items.select_related("medicine", "batch")
+        )
+    return document
+
+
+def document_content(document, fmt="html"):
+    return zlib.decompress(bytes(getattr(document, fmt))).decode()
+
+
+def _render_missing(invoice_ids, pool):
+    invoices = Invoice.objects.filter(pk__in=invoice_ids).select_related("customer")
+    items = {}
+    for item in InvoiceItem.objects.filter(invoice_id__in=invoice_ids).select_related(
+        "medicine", "batch"
+    ):
+        items.setdefault(item.invoice_id, []).append(item)
+    invoices = list(invoices)
+    payloads = [
+        document_data(invoice, items.get(invoice.pk, [])) for invoice in invoices
+    ]
+    if pool is None:
+        rendered = map(render_document, payloads)
+    else:
+        rendered = pool.map(render_document, payloads, chunksize=10)
+    documents = [
+        InvoiceDocument(invoice=invoice, html=html, text=text)
+        for invoice, (html, text) in zip(invoices, rendered)
+    ]
+    InvoiceDocument.objects.bulk_create(documents, ignore_conflicts=True)
+    return documents
+
+
+def iter_invoice_documents(invoices, fmt="html", workers=None, use_pool=False):
+    """
+    (file name, content) for each invoice in `invoices`, in order. Stored
+    documents are read a chunk at a time; missing ones are rendered and
+    stored for next time. They are rendered in this process unless
+    `use_pool`, which starts a process pool when enough are missing: not
+    from a web worker, where forking a pool per request is too costly.
+    """
+    invoice_numbers = list(invoices.values_list("pk", "invoice_number"))
+    with ExitStack() as stack:
+        pool = None
+        for start in range(0, len(invoice_numbers), CHUNK_SIZE):
+            chunk = invoice_numbers[start : start + CHUNK_SIZE]
+            stored = dict(
+                InvoiceDocument.objects.filter(
+                    invoice_id__in=[pk for pk, _ in chunk]
+                ).values_list("invoice_id", fmt)
+            )
+            missing = [pk for pk, _ in chunk if pk not in stored]
+            if use_pool and len(missing) >= POOL_THRESHOLD and pool is None:
+                pool = stack.enter_context(
+                    ProcessPoolExecutor(max_workers=workers, initializer=django.setup)
+                )
+            for document in _render_missing(missing, pool) if missing else ():
+                stored[document.invoice_id] = getattr(document, fmt)
+            for pk, invoice_number in chunk:
+                yield (
+                    f"{invoice_number}.{FORMATS[fmt]}",
+                    zlib.decompress(bytes(stored[pk])),
+                )
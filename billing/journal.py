@@ -0,0 +1,433 @@
+import json
+import logging
+import os
+import threading
+from collections import Counter, deque
+from contextlib import contextmanager
+from decimal import Decimal
+from pathlib import Path
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from inventory.models import StockMovement
+from inventory.services import get_action
+from inventory.stock import refresh_medicine_stock
+from medicines.models import Batch
+from medicines.signals import notify_batches_changed
+from reports.rollups import record_sales
+
+from .documents import save_invoice_document
+from .models import Invoice, InvoiceItem
+from .numbering import next_invoice_number, release_invoice_number
+from .services import allocate_stock_fefo, check_quote, invoice_item, invoice_totals
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+logger = logging.getLogger(__name__)
+
+
+class JournalBusy(Exception):
+    """Another process is already draining the journal."""
+
+
+@contextmanager
+def _file_lock(path, blocking=True):
+    # An exclusive lock shared by every process on this machine
+    with open(path, "a+b") as handle:
+        if fcntl is not None:
+            flags = fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB
+            try:
+                fcntl.flock(handle, flags)
+            except BlockingIOError:
+                raise JournalBusy(path) from None
+        else:
+            handle.seek(0)
+            mode = msvcrt.LK_LOCK if blocking else msvcrt.LK_NBLCK
+            try:
+                msvcrt.locking(handle.fileno(), mode, 1)
+            except OSError:
+                raise JournalBusy(path) from None
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(handle, fcntl.LOCK_UN)
+            else:
+                handle.seek(0)
+                msvcrt.locking(handle.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+def _write_durably(path, data):
+    # Replace `path` atomically: a crash leaves either the old or new content
+    tmp = path.with_suffix(".tmp")
+    with open(tmp, "wb") as handle:
+        handle.write(data)
+        handle.flush()
+        os.fsync(handle.fileno())
+    os.replace(tmp, path)
+
+
+class CheckoutJournal:
+    """
+    Append-only file of checked-out sales that are not posted to the database
+    yet, one JSON record per line. A record is on disk (fsynced) before the
+    cashier sees its provisional invoice.
+
+    The checkpoint file holds the byte offset up to which records are posted.
+    Records past it are pending: their batch quantities count as reserved,
+    so a later checkout cannot sell the same stock twice. Once everything is
+    posted the file is emptied and the checkpoint's generation moves on.
+    """
+
+    def __init__(self, directory):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.path = self.directory / "journal.jsonl"
+        self.checkpoint_path = self.directory / "checkpoint.json"
+        self.rejected_path = self.directory / "rejected.jsonl"
+        self._lock_path = self.directory / "journal.lock"
+        self._drain_lock_path = self.directory / "drain.lock"
+        self.path.touch()
+
+        # Pending records this process has read, oldest first
+        self._thread_lock = threading.Lock()
+        self._generation = None
+        self._read_to = 0
+        self._pending = deque()  # (end offset, [(batch id, quantity)])
+        self._reserved = Counter()
+
+    @contextmanager
+    def locked(self):
+        with self._thread_lock, _file_lock(self._lock_path):
+            yield
+
+    def draining(self):
+        # Only one committer at a time; a second one fails fast
+        return _file_lock(self._drain_lock_path, blocking=False)
+
+    def checkpoint(self):
+        try:
+            data = json.loads(self.checkpoint_path.read_bytes())
+        except FileNotFoundError:
+            return 0, 0
+        return data["generation"], data["offset"]
+
+    def set_checkpoint(self, generation, offset):
+        _write_durably(
+            self.checkpoint_path,
+            json.dumps({"generation": generation, "offset": offset}).encode(),
+        )
+
+    def append(self, record):
+        # Call while holding locked()
+        data = (json.dumps(record, separators=(",", ":")) + "\n").encode()
+        with open(self.path, "r+b") as handle:
+            end = self._complete_end(handle)
+            handle.seek(end)
+            try:
+                handle.write(data)
+                handle.flush()
+                os.fsync(handle.fileno())
+            except Exception:
+                # Leave no half-written record behind a failed checkout
+                handle.truncate(end)
+                raise
+
+    def reserved(self):
+        """
+        {batch_id: quantity} promised to pending records. Call while holding
+        locked(), and before reading batch stock: a record posted in between
+        is then counted twice (refusing a sale at worst), never not at all.
+        """
+        generation, offset = self.checkpoint()
+        if generation != self._generation or self.path.stat().st_size < self._read_to:
+            self._generation = generation
+            self._read_to = offset
+            self._pending.clear()
+            self._reserved.clear()
+
+        for record, end in self.read(self._read_to):
+            quantities = [(line[1], line[2]) for line in record["lines"]]
+            self._pending.append((end, quantities))
+            for batch_id, quantity in quantities:
+                self._reserved[batch_id] += quantity
+            self._read_to = end
+
+        while self._pending and self._pending[0][0] <= offset:
+            _, quantities = self._pending.popleft()
+            for batch_id, quantity in quantities:
+                self._reserved[batch_id] -= quantity
+        return {batch_id: qty for batch_id, qty in self._reserved.items() if qty > 0}
+
+    def read(self, offset):
+        # (record, end offset) for every complete line from `offset` on
+        with open(self.path, "rb") as handle:
+            handle.seek(offset)
+            for line in handle:
+                if not line.endswith(b"\n"):
+                    break  # torn write of a checkout that never answered
+                offset += len(line)
+                yield json.loads(line), offset
+
+    def reject(self, records):
+        # Keep sales that could not be posted for someone to resolve by hand
+        if not records:
+            return
+        seen = set()
+        if self.rejected_path.exists():
+            with open(self.rejected_path, "rb") as handle:
+                seen = {json.loads(line)["invoice_number"] for line in handle}
+        with open(self.rejected_path, "ab") as handle:
+            for record in records:
+                if record["invoice_number"] not in seen:
+                    handle.write((json.dumps(record) + "\n").encode())
+            handle.flush()
+            os.fsync(handle.fileno())
+
+    def compact(self):
+        # Empty the file once every record in it is posted
+        with self.locked():
+            generation, offset = self.checkpoint()
+            with open(self.path, "r+b") as handle:
+                if offset < self._complete_end(handle):
+                    return False
+                # Checkpoint first: a crash in between replays posted records,
+                # which the committer skips by invoice number.
+                self.set_checkpoint(generation + 1, 0)
+                handle.truncate(0)
+                os.fsync(handle.fileno())
+            return True
+
+    @staticmethod
+    def _complete_end(handle):
+        # End of the last complete record, ignoring a torn trailing write
+        size = handle.seek(0, os.SEEK_END)
+        if size == 0:
+            return 0
+        handle.seek(size - 1)
+        if handle.read(1) == b"\n":
+            return size
+        handle.seek(0)
+        content = handle.read()
+        return content.rfind(b"\n") + 1
+
+
+_journal = None
+_journal_lock = threading.Lock()
+
+
+def get_checkout_journal():
+    global _journal
+    with _journal_lock:
+        if _journal is None:
+            _journal = CheckoutJournal(settings.POS_CHECKOUT_JOURNAL["DIR"])
+        return _journal
+
+
+def journal_checkout(
+    user, cart_items, customer=None, payment_method="CASH", expected_total=None
+):
+    """
+    Check the cart out against stock minus pending reservations and append
+    the sale to the journal. Returns the provisional (unsaved) invoice and
+    its lines; drain_checkout_journal() posts it later under the same number.
+    `expected_total` is checked as by create_invoice().
+    """
+    if not cart_items:
+        raise ValidationError("Cart is empty")
+    quantities = {
+        int(medicine_id_str): int(items_data["quantity"])
+        for medicine_id_str, items_data in cart_items.items()
+    }
+
+    journal = get_checkout_journal()
+    invoice_id = next_invoice_number()
+    try:
+        with journal.locked():
+            reserved = journal.reserved()
+            with transaction.atomic():
+                allocations = allocate_stock_fefo(quantities, reserved=reserved)
+            lines = [
+                invoice_item(
+                    allocation["batch"],
+                    allocation["quantity"],
+                    allocation["batch"].sale_price,
+                    allocation["batch"].medicine.gst_percent or Decimal("0.00"),
+                )
+                for allocation in allocations
+            ]
+            invoice = Invoice(
+                invoice_number=invoice_id,
+                customer=customer,
+                created_by=user,
+                created_at=timezone.now(),
+                payment_method=payment_method,
+                payment_status="PAID",
+                **check_quote(lines, expected_total),
+            )
+            journal.append(_to_record(invoice, lines))
+    except Exception:
+        release_invoice_number(invoice_id)
+        raise
+    return invoice, lines
+
+
+def _to_record(invoice, lines):
+    return {
+        "invoice_number": invoice.invoice_number,
+        "created_at": invoice.created_at.isoformat(),
+        "created_by": invoice.created_by_id,
+        "customer": invoice.customer_id,
+        "payment_method": invoice.payment_method,
+        "lines": [
+            [
+                line.medicine_id,
+                line.batch_id,
+                line.quantity,
+                str(line.unit_price),
+                str(line.gst_percent),
+            ]
+            for line in lines
+        ],
+    }
+
+
+def drain_checkout_journal(batch_size=None):
+    """
+    Post pending journal records to the database, `batch_size` sales per
+    transaction, moving the checkpoint after each commit. Safe to run again
+    after a crash: records whose invoice number is already in the database
+    were posted before the checkpoint moved and are skipped.
+    Returns (posted, rejected) counts.
+    """
+    journal = get_checkout_journal()
+    batch_size = batch_size or settings.POS_CHECKOUT_JOURNAL["BATCH_SIZE"]
+    posted = rejected = 0
+    with journal.draining():
+        generation, offset = journal.checkpoint()
+        records = []
+        for record, end in journal.read(offset):
+            records.append(record)
+            if len(records) >= batch_size:
+                done, failed = _post_records(journal, records)
+                journal.set_checkpoint(generation, end)
+                posted, rejected, records = posted + done, rejected + failed, []
+            offset = end
+        if records:
+            done, failed = _post_records(journal, records)
+            journal.set_checkpoint(generation, offset)
+            posted, rejected = posted + done, rejected + failed
+        journal.compact()
+    return posted, rejected
+
+
+def _post_records(journal, records):
+    with transaction.atomic():
+        posted_numbers = set(
+            Invoice.objects.filter(
+                invoice_number__in=[record["invoice_number"] for record in records]
+            ).values_list("invoice_number", flat=True)
+        )
+        records = [r for r in records if r["invoice_number"] not in posted_numbers]
+        batches = (
+            Batch.objects.select_for_update(of=("self",))
+            .select_related("medicine")
+            .in_bulk({line[1] for record in records for line in record["lines"]})
+        )
+
+        accepted = []
+        failed = []
+        for record in records:
+            needed = Counter()
+            for _, batch_id, quantity, _, _ in record["lines"]:
+                needed[batch_id] += quantity
+            # Stock changed behind the journal's back (e.g. an adjustment)
+            if any(
+                batch_id not in batches or batches[batch_id].current_quantity < qty
+                for batch_id, qty in needed.items()
+            ):
+                failed.append(record)
+                continue
+            for batch_id, qty in needed.items():
+                batches[batch_id].current_quantity -= qty
+            accepted.append(record)
+
+        invoices = []
+        lines = []
+        for record in accepted:
+            invoice_lines = [
+                invoice_item(batches[batch_id], quantity, Decimal(price), Decimal(gst))
+                for _, batch_id, quantity, price, gst in record["lines"]
+            ]
+            invoices.append(
+                Invoice(
+                    invoice_number=record["invoice_number"],
+                    customer_id=record["customer"],
+                    created_by_id=record["created_by"],
+                    payment_method=record["payment_method"],
+                    payment_status="PAID",
+                    **invoice_totals(invoice_lines),
+                )
+            )
+            lines.append(invoice_lines)
+        Invoice.objects.bulk_create(invoices)
+
+        # Invoices and movements carry the time of sale, not of posting
+        sale_action = get_action("Sale")
+        movements = []
+        for record, invoice, invoice_lines in zip(accepted, invoices, lines):
+            invoice.created_at = parse_datetime(record["created_at"])
+            for line in invoice_lines:
+                line.invoice = invoice
+                movements.append(
+                    StockMovement(
+                        medicine_id=line.medicine_id,
+                        batch_id=line.batch_id,
+                        action=sale_action,
+                        quantity=-line.quantity,
+                        invoice_number=invoice,
+                        store_id=batches[line.batch_id].store_id,
+                    )
+                )
+        Invoice.objects.bulk_update(invoices, ["created_at"])
+        InvoiceItem.objects.bulk_create([line for group in lines for line in group])
+        record_sales(zip(invoices, lines))
+        movements = StockMovement.objects.bulk_create(movements)
+        for movement in movements:
+            movement.created_on = movement.invoice_number.created_at
+        StockMovement.objects.bulk_update(movements, ["created_on"])
+
+        changed = {line.batch_id for group in lines for line in group}
+        Batch.objects.bulk_update(
+            [batches[batch_id] for batch_id in changed], ["current_quantity"]
+        )
+        medicine_ids = {batches[batch_id].medicine_id for batch_id in changed}
+        refresh_medicine_stock(medicine_ids)
+        # Logs the change with the sales: the web processes, not this one,
+        # hold the barcode index and search cache it makes stale
+        notify_batches_changed(medicine_ids)
+
+    for invoice, invoice_lines in zip(invoices, lines):
+        try:
+            save_invoice_document(invoice, invoice_lines)
+        except Exception:
+            logger.warning(
+                "Could not store invoice %s", invoice.invoice_number, exc_info=True
+            )
+
+    if failed:
+        logger.error(
+            "Could not post %d journaled sales, kept in %s",
+            len(failed),
+            journal.rejected_path,
+        )
+        journal.reject(failed)
+    return len(accepted), len(failed)
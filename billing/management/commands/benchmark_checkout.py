@@ -0,0 +1,85 @@
+import time
+from datetime import timedelta
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from billing.models import Staff
+from billing.services import create_invoice
+from medicines.models import Batch, Medicine, PackType, Supplier
+
+
+class _Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = (
+        "Run checkouts of increasing size against throwaway stock and report "
+        "the SQL statement count and time for each. Nothing is kept."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--lines",
+            type=int,
+            nargs="+",
+            default=[1, 5, 10, 25, 50, 100],
+            help="Cart sizes (number of lines) to benchmark.",
+        )
+
+    def handle(self, *args, **options):
+        sizes = options["lines"]
+        results = []
+        try:
+            with transaction.atomic():
+                staff = Staff.objects.create(name="Benchmark", position="Bench")
+                batches = self._make_batches(max(sizes))
+                for size in sizes:
+                    cart = {
+                        str(batch.medicine_id): {"quantity": 1}
+                        for batch in batches[:size]
+                    }
+                    with CaptureQueriesContext(connection) as ctx:
+                        started = time.perf_counter()
+                        create_invoice(user=staff, cart_items=cart)
+                        elapsed = time.perf_counter() - started
+                    results.append((size, len(ctx.captured_queries), elapsed))
+                raise _Rollback
+        except _Rollback:
+            pass
+
+        self.stdout.write(f"{'lines':>6} {'statements':>11} {'ms':>9}")
+        for size, statements, elapsed in results:
+            self.stdout.write(f"{size:>6} {statements:>11} {elapsed * 1000:>9.2f}")
+
+    def _make_batches(self, count):
+        pack_type, _ = PackType.objects.get_or_create(name="Strip")
+        supplier = Supplier.objects.create(name="Benchmark Supplier")
+        medicines = Medicine.objects.bulk_create(
+            Medicine(
+                name=f"Benchmark Medicine {i}",
+                pack_size=10,
+                pack_type=pack_type,
+                hsn_code="3004",
+                gst_percent=Decimal("12.00"),
+            )
+            for i in range(count)
+        )
+        expiry = timezone.localdate() + timedelta(days=365)
+        return Batch.objects.bulk_create(
+            Batch(
+                batch_number=f"BENCH-{i}",
+                medicine=medicine,
+                initial_quantity=1000,
+                current_quantity=1000,
+                purchase_price=Decimal("5.00"),
+                sale_price=Decimal("8.50"),
+                expiration_date=expiry,
+                supplier=supplier,
+            )
+            for i, medicine in enumerate(medicines)
+        )
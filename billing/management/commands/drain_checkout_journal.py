@@ -0,0 +1,46 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from billing.journal import JournalBusy, drain_checkout_journal
+
+
+class Command(BaseCommand):
+    help = (
+        "Post sales from the checkout journal to the database in group-committed "
+        "batches. Run it after a crash to replay whatever was not posted yet."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=settings.POS_CHECKOUT_JOURNAL["BATCH_SIZE"],
+            help="Sales posted per transaction.",
+        )
+        parser.add_argument(
+            "--follow",
+            action="store_true",
+            help="Keep running and drain the journal every --interval seconds.",
+        )
+        parser.add_argument(
+            "--interval",
+            type=float,
+            default=1.0,
+            help="Seconds between drains with --follow.",
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            try:
+                posted, rejected = drain_checkout_journal(options["batch_size"])
+            except JournalBusy:
+                raise CommandError("Another committer is draining the journal.")
+            if posted or rejected or not options["follow"]:
+                self.stdout.write(f"Posted {posted} sales, rejected {rejected}.")
+            if rejected:
+                self.stderr.write("Rejected sales are kept in rejected.jsonl.")
+            if not options["follow"]:
+                return
+            time.sleep(options["interval"])
@@ -0,0 +1,45 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+
+from billing.documents import FORMATS, iter_invoice_documents
+from billing.services import invoices_between
+from pharmacy_project.streaming import stream_zip
+
+
+class Command(BaseCommand):
+    help = (
+        "Write every invoice of a date range to one zip archive, rendering "
+        "documents that are not stored yet on a process pool."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("date_from", type=date.fromisoformat)
+        parser.add_argument("date_to", type=date.fromisoformat)
+        parser.add_argument("output", help="Path of the zip archive to write.")
+        parser.add_argument("--format", choices=sorted(FORMATS), default="html")
+        parser.add_argument(
+            "--workers", type=int, default=None, help="Renderer processes."
+        )
+
+    def handle(self, *args, **options):
+        if options["date_to"] < options["date_from"]:
+            raise CommandError("date_to is before date_from.")
+        invoices = invoices_between(options["date_from"], options["date_to"])
+        documents = iter_invoice_documents(
+            invoices.order_by("invoice_number"),
+            options["format"],
+            options["workers"],
+            use_pool=True,
+        )
+        count = 0
+
+        def counted(documents):
+            nonlocal count
+            for document in documents:
+                count += 1
+                yield document
+
+        with open(options["output"], "wb") as archive:
+            archive.writelines(stream_zip(counted(documents)))
+        self.stdout.write(f"Wrote {count} invoices to {options['output']}.")
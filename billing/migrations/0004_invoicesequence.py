@@ -0,0 +1,38 @@
+# Generated by Django 5.2.10 on 2026-10-17 22:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("billing", "0003_invoice_grand_total_invoice_gst_amount_and_more"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="InvoiceSequence",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("day", models.DateField()),
+                ("terminal", models.CharField(max_length=2)),
+                ("last_reserved", models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("day", "terminal"),
+                        name="unique_invoice_sequence_per_terminal",
+                    )
+                ],
+            },
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.2.10 on 2026-10-17 22:53
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("billing", "0004_invoicesequence"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="CartSnapshot",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("key", models.CharField(max_length=64, unique=True)),
+                ("version", models.PositiveIntegerField(default=0)),
+                ("data", models.JSONField(default=list)),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+            ],
+        ),
+    ]
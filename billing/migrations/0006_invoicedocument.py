@@ -0,0 +1,32 @@
+# Generated by Django 5.2.10 on 2026-10-17 23:02
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("billing", "0005_cartsnapshot"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="InvoiceDocument",
+            fields=[
+                (
+                    "invoice",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        primary_key=True,
+                        related_name="document",
+                        serialize=False,
+                        to="billing.invoice",
+                    ),
+                ),
+                ("html", models.BinaryField()),
+                ("text", models.BinaryField()),
+                ("rendered_at", models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+    ]
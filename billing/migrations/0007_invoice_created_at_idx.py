@@ -0,0 +1,17 @@
+# Generated by Django 5.2.10 on 2026-10-17 23:17
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("billing", "0006_invoicedocument"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="invoice",
+            index=models.Index(fields=["created_at"], name="invoice_created_at_idx"),
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 5.2.10 on 2026-10-17 23:39
+
+import django.db.models.deletion
+import medicines.models
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("billing", "0007_invoice_created_at_idx"),
+        ("medicines", "0008_store"),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name="invoice",
+            name="invoice_created_at_idx",
+        ),
+        migrations.AddField(
+            model_name="invoice",
+            name="store",
+            field=models.ForeignKey(
+                default=medicines.models.current_store_id,
+                on_delete=django.db.models.deletion.PROTECT,
+                related_name="+",
+                to="medicines.store",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="invoice",
+            index=models.Index(
+                fields=["store", "created_at"], name="invoice_created_at_idx"
+            ),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.10 on 2026-10-18 00:14
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("billing", "0008_invoice_store"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="VoidedInvoiceNumber",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("invoice_number", models.CharField(max_length=20, unique=True)),
+                ("voided_at", models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+    ]
@@ -1,5 +1,5 @@
 from django.db import models
-from medicines.models import Medicine, Batch
+from medicines.models import Medicine, Batch, Store, StoreQuerySet, current_store_id
 from decimal import Decimal
 
 
@@ -41,6 +41,17 @@ class Invoice(models.Model):
     total_amount = models.DecimalField(max_digits=12, decimal_places=2, default=0)
     gst_amount = models.DecimalField(max_digits=12, decimal_places=2, default=0)
     grand_total = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    store = models.ForeignKey(
+        Store, on_delete=models.PROTECT, related_name="+", default=current_store_id
+    )
+
+    objects = StoreQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # Date-range reads of one store: dashboard, reports, reprints
+            models.Index(fields=["store", "created_at"], name="invoice_created_at_idx"),
+        ]
 
     # @property
     # def total(self):
@@ -55,6 +66,48 @@ class Invoice(models.Model):
     #     return self.total + self.gst
 
 
+# Highest invoice sequence number handed out to a terminal on a given day.
+# Terminals reserve numbers in blocks, so this row is only touched once per block.
+class InvoiceSequence(models.Model):
+    day = models.DateField()
+    terminal = models.CharField(max_length=2)
+    last_reserved = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["day", "terminal"], name="unique_invoice_sequence_per_terminal"
+            )
+        ]
+
+
+# An invoice number handed out to a checkout that rolled back after a later
+# number was taken, so it can't be given back to the counter. Recorded so
+# every number of a day's sequence is either an invoice or voided.
+class VoidedInvoiceNumber(models.Model):
+    invoice_number = models.CharField(max_length=20, unique=True)
+    voided_at = models.DateTimeField(auto_now_add=True)
+
+
+# Last persisted state of a POS cart; written behind by billing.cart
+class CartSnapshot(models.Model):
+    key = models.CharField(max_length=64, unique=True)
+    version = models.PositiveIntegerField(default=0)
+    data = models.JSONField(default=list)
+    updated_at = models.DateTimeField(auto_now=True)
+
+
+# An invoice rendered once when it is saved, zlib-compressed. Invoices don't
+# change afterwards, so prints and reprints are served from here.
+class InvoiceDocument(models.Model):
+    invoice = models.OneToOneField(
+        Invoice, on_delete=models.CASCADE, primary_key=True, related_name="document"
+    )
+    html = models.BinaryField()
+    text = models.BinaryField()  # fixed-width receipt for thermal printers
+    rendered_at = models.DateTimeField(auto_now_add=True)
+
+
 class InvoiceItem(models.Model):
     invoice = models.ForeignKey(Invoice, on_delete=models.PROTECT, related_name="items")
     medicine = models.ForeignKey(Medicine, on_delete=models.PROTECT)
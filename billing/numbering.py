@@ -0,0 +1,214 @@
+import logging
+import threading
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db import transaction
+from django.utils import timezone
+
+from .models import Invoice, InvoiceSequence, VoidedInvoiceNumber
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+logger = logging.getLogger(__name__)
+
+
+# Invoice numbers look like INV20260117-01-00042: day, terminal, sequence.
+# Fixed-width fields keep them sortable, so one day is one contiguous range
+# of the unique index on Invoice.invoice_number.
+def invoice_number_prefix(day):
+    return f"INV{day.strftime('%Y%m%d')}-"
+
+
+def format_invoice_number(day, terminal, sequence):
+    return f"{invoice_number_prefix(day)}{terminal}-{sequence:05d}"
+
+
+def invoices_for_day(day):
+    prefix = invoice_number_prefix(day)
+    # "." sorts right after "-", so this is a range scan over the day's prefix
+    return Invoice.objects.filter(
+        invoice_number__gte=prefix, invoice_number__lt=prefix[:-1] + "."
+    )
+
+
+class InvoiceNumberAllocator:
+    """
+    Hands out invoice numbers for one terminal from blocks reserved in the
+    InvoiceSequence counter table, so a checkout only touches the counter
+    row once every `block_size` invoices. Numbers go out in order.
+
+    A number released by a failed checkout is taken back if no later number
+    of the block has been handed out; otherwise it is recorded as a
+    VoidedInvoiceNumber when the day rolls over or the allocator closes.
+    The unused tail of the block is given back to the counter then, or
+    voided too if another process reserved past it, so each number of a
+    day's sequence ends up an invoice or voided, unless the process is
+    killed mid-block.
+    """
+
+    def __init__(self, terminal, block_size):
+        self.terminal = terminal
+        self.block_size = block_size
+        self._lock = threading.Lock()
+        self._day = None
+        self._start = 0  # first number of the reserved block
+        self._next = 0
+        self._limit = 0  # first number past the reserved block
+        self._released = set()
+
+    def allocate(self):
+        with self._lock:
+            today = timezone.localdate()
+            if today != self._day:
+                self._close_day()
+                self._day = today
+                self._start = self._next = self._limit = 0
+
+            if self._next >= self._limit:
+                self._reserve_block()
+            sequence = self._next
+            self._next += 1
+            return format_invoice_number(today, self.terminal, sequence)
+
+    def release(self, invoice_number):
+        # Give back a number whose checkout rolled back
+        with self._lock:
+            if self._day is None:
+                return
+            prefix = f"{invoice_number_prefix(self._day)}{self.terminal}-"
+            if not invoice_number.startswith(prefix):
+                return
+            self._released.add(int(invoice_number[len(prefix) :]))
+            # Step back over released numbers at the end of what went out
+            while self._next > self._start and self._next - 1 in self._released:
+                self._next -= 1
+                self._released.discard(self._next)
+
+    def close(self):
+        with self._lock:
+            self._close_day()
+
+    def _reserve_block(self):
+        with transaction.atomic():
+            sequence, _ = InvoiceSequence.objects.select_for_update().get_or_create(
+                day=self._day, terminal=self.terminal
+            )
+            start = sequence.last_reserved + 1
+            sequence.last_reserved += self.block_size
+            sequence.save(update_fields=["last_reserved"])
+        self._start = self._next = start
+        self._limit = start + self.block_size
+
+    def _close_day(self):
+        if self._day is None:
+            return
+        self._return_unused()
+        if self._released:
+            try:
+                VoidedInvoiceNumber.objects.bulk_create(
+                    [
+                        VoidedInvoiceNumber(
+                            invoice_number=format_invoice_number(
+                                self._day, self.terminal, sequence
+                            )
+                        )
+                        for sequence in sorted(self._released)
+                    ],
+                    ignore_conflicts=True,
+                )
+            except Exception:
+                logger.warning("Could not void released invoice numbers", exc_info=True)
+            self._released = set()
+
+    def _return_unused(self):
+        if self._next >= self._limit:
+            return
+        try:
+            # Only shrink the counter if nobody reserved after our block;
+            # otherwise the tail is voided with the released numbers
+            returned = InvoiceSequence.objects.filter(
+                day=self._day,
+                terminal=self.terminal,
+                last_reserved=self._limit - 1,
+            ).update(last_reserved=self._next - 1)
+            if not returned:
+                self._released.update(range(self._next, self._limit))
+        except Exception:
+            logger.warning("Could not return unused invoice numbers", exc_info=True)
+        self._next = self._limit
+
+
+def hold_terminal_lock(path, terminal):
+    """
+    Take the exclusive lock on `path` for as long as the returned file stays
+    open. Blocks are reserved per process, so two processes billing one
+    terminal would interleave its numbers: the second one is refused.
+    """
+    handle = open(path, "a+b")
+    try:
+        if fcntl is not None:
+            fcntl.flock(handle, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        else:
+            handle.seek(0)
+            msvcrt.locking(handle.fileno(), msvcrt.LK_NBLCK, 1)
+    except OSError:
+        handle.close()
+        raise ImproperlyConfigured(
+            f"Terminal {terminal} is already billed by another process. Run one "
+            "worker per POS_TERMINAL_ID, or give each worker its own."
+        ) from None
+    return handle
+
+
+_allocator = None
+_terminal_lock = None
+_allocator_lock = threading.Lock()
+
+
+def get_allocator():
+    global _allocator, _terminal_lock
+    with _allocator_lock:
+        if _allocator is None:
+            terminal = str(settings.POS_TERMINAL_ID).zfill(2)
+            if len(terminal) != 2:
+                raise ImproperlyConfigured(
+                    "POS_TERMINAL_ID must be at most two characters."
+                )
+            if _terminal_lock is None:
+                # Held for the life of the process, even if the allocator
+                # is dropped and made again
+                _terminal_lock = hold_terminal_lock(
+                    settings.BASE_DIR / f".pos-terminal-{terminal}.lock", terminal
+                )
+            _allocator = InvoiceNumberAllocator(
+                terminal, settings.INVOICE_NUMBER_BLOCK_SIZE
+            )
+        return _allocator
+
+
+def close_allocator():
+    """
+    Give back the numbers this process reserved but never handed out, and
+    void the released ones. Call it where the POS process shuts down; it
+    does nothing in a process that never allocated a number.
+    """
+    global _allocator, _terminal_lock
+    with _allocator_lock:
+        if _allocator is None:
+            return
+        _allocator.close()
+        _terminal_lock.close()
+        _allocator = _terminal_lock = None
+
+
+def next_invoice_number():
+    return get_allocator().allocate()
+
+
+def release_invoice_number(invoice_number):
+    get_allocator().release(invoice_number)
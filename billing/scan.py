@@ -0,0 +1,144 @@
+import threading
+
+from django.utils import timezone
+
+from medicines.models import Medicine
+from medicines.signals import last_stock_change, stock_changes_since
+
+from .cart import CartLine
+from .services import get_fefo_batch, sellable_batches_fefo
+
+
+class BarcodeIndex:
+    """
+    In-process map of barcode -> the cart line a scan of it should add, i.e.
+    the medicine priced from its best FEFO batch. It is loaded with one pass
+    over the catalogue on the first scan of the day, as batches expire at
+    midnight. Each scan first reads the StockChange log past the last change
+    it saw, so entries of medicines changed by any process are dropped and
+    looked up again by exact barcode.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._warm = False
+        self._loaded_on = None
+        self._seen = 0  # last StockChange id applied
+        self._lines = {}
+        self._barcodes = {}  # medicine id -> barcode
+        self._generation = 0  # bumped by every invalidation
+
+    def resolve(self, barcode):
+        with self._lock:
+            if not self._warm or self._loaded_on != timezone.localdate():
+                self._load_all()
+            else:
+                self._seen, changed = stock_changes_since(self._seen)
+                self._invalidate(changed)
+            if barcode in self._lines:
+                return self._lines[barcode]
+            generation = self._generation
+
+        line = self._lookup(barcode)
+        with self._lock:
+            # Don't keep a line that went stale while it was being looked up
+            if line is not None and generation == self._generation:
+                self._remember(barcode, line)
+        return line
+
+    def invalidate(self, medicine_ids):
+        with self._lock:
+            self._invalidate(medicine_ids)
+
+    def _invalidate(self, medicine_ids):
+        if not medicine_ids:
+            return
+        self._generation += 1
+        for medicine_id in medicine_ids:
+            barcode = self._barcodes.pop(medicine_id, None)
+            if barcode is not None:
+                self._lines.pop(barcode, None)
+
+    def clear(self):
+        with self._lock:
+            self._warm = False
+            self._lines = {}
+            self._barcodes = {}
+
+    def _load_all(self):
+        self._lines = {}
+        self._barcodes = {}
+        self._generation += 1
+        # Read first: a change committed during the load is applied again
+        self._seen = last_stock_change()
+        self._loaded_on = timezone.localdate()
+        medicines = {
+            row["id"]: row
+            for row in Medicine.objects.filter(
+                is_active=True, barcode__isnull=False
+            ).values("id", "name", "barcode", "gst_percent")
+        }
+        batches = sellable_batches_fefo().filter(medicine_id__in=medicines)
+        for batch in batches.values(
+            "medicine_id", "batch_number", "expiration_date", "sale_price"
+        ):
+            medicine = medicines.get(batch["medicine_id"])
+            if medicine is None or medicine["barcode"] in self._lines:
+                continue  # not the first (best) batch of this medicine
+            self._remember(
+                medicine["barcode"],
+                _line(
+                    medicine["id"],
+                    medicine["name"],
+                    medicine["gst_percent"],
+                    batch["batch_number"],
+                    batch["expiration_date"],
+                    batch["sale_price"],
+                ),
+            )
+        self._warm = True
+
+    def _lookup(self, barcode):
+        medicine = (
+            Medicine.objects.filter(barcode=barcode, is_active=True).only("id").first()
+        )
+        if medicine is None:
+            return None
+        batch = get_fefo_batch(medicine.id)
+        if batch is None:
+            return None
+        return _line(
+            batch.medicine_id,
+            batch.medicine.name,
+            batch.medicine.gst_percent,
+            batch.batch_number,
+            batch.expiration_date,
+            batch.sale_price,
+        )
+
+    def _remember(self, barcode, line):
+        self._lines[barcode] = line
+        self._barcodes[line.medicine_id] = barcode
+
+
+def _line(medicine_id, name, gst_percent, batch_number, expiration_date, price):
+    return CartLine(
+        medicine_id=medicine_id,
+        name=name,
+        batch_number=batch_number,
+        expiry_date=expiration_date.isoformat(),
+        price=price,
+        gst=gst_percent or 0,
+        quantity=1,
+    )
+
+
+barcode_index = BarcodeIndex()
+
+
+def resolve_barcode(barcode):
+    # A fresh copy: the cart keeps and mutates the line it is given
+    line = barcode_index.resolve(barcode.strip())
+    if line is None:
+        return None
+    return CartLine(*line.to_list())
@@ -0,0 +1,106 @@
+import hashlib
+import re
+import threading
+from collections import Counter
+
+from django.core.cache import cache
+from django.utils import timezone
+
+from medicines.signals import last_stock_change
+
+CACHE_PREFIX = "pos-search"
+CACHE_TIMEOUT = 300
+
+_stats = Counter()
+_stats_lock = threading.Lock()
+
+
+def normalize_query(query):
+    return " ".join(query.lower().split())
+
+
+def current_version():
+    # The latest StockChange, kept in the database so every process sees a
+    # change together, whichever made it: each one makes every result cached
+    # before it unreachable at once
+    return last_stock_change()
+
+
+def _cache_key(version, query):
+    digest = hashlib.sha1(query.encode()).hexdigest()
+    return f"{CACHE_PREFIX}:{version}:{timezone.localdate().isoformat()}:{digest}"
+
+
+def _count(event):
+    with _stats_lock:
+        _stats[event] += 1
+
+
+def _words(text):
+    return re.findall(r"\w+", text.lower())
+
+
+def row_matches(row, query, mode):
+    # The same test the database applied, so a narrowed result equals what
+    # the query would have returned: word prefixes for the full-text index,
+    # substrings for the icontains fallback.
+    if mode == "fts":
+        row_words = _words(row["search_text"])
+        return all(
+            any(word.startswith(term) for word in row_words) for term in _words(query)
+        )
+    return query in row["search_text"].lower()
+
+
+def cached_search(query, search):
+    """
+    Results for `query`, computed by `search(query)` on a miss. `search`
+    returns (rows, complete, mode); rows are plain dicts with a "search_text"
+    key and `complete` says nothing was cut off. A query extending a cached,
+    complete prefix is answered by filtering that prefix's rows in memory.
+    """
+    query = normalize_query(query)
+    version = current_version()
+
+    entry = cache.get(_cache_key(version, query))
+    if entry is not None:
+        _count("hits")
+        return entry["rows"]
+
+    for length in range(len(query) - 1, 1, -1):
+        prefix = normalize_query(query[:length])
+        prefix_entry = cache.get(_cache_key(version, prefix))
+        if prefix_entry is None or not prefix_entry["complete"]:
+            continue
+        mode = prefix_entry["mode"]
+        rows = [row for row in prefix_entry["rows"] if row_matches(row, query, mode)]
+        cache.set(
+            _cache_key(version, query),
+            {"rows": rows, "complete": True, "mode": mode},
+            CACHE_TIMEOUT,
+        )
+        _count("narrowed")
+        return rows
+
+    _count("misses")
+    rows, complete, mode = search(query)
+    cache.set(
+        _cache_key(version, query),
+        {"rows": rows, "complete": complete, "mode": mode},
+        CACHE_TIMEOUT,
+    )
+    return rows
+
+
+def stats():
+    with _stats_lock:
+        counts = dict(_stats)
+    lookups = sum(counts.values())
+    served = counts.get("hits", 0) + counts.get("narrowed", 0)
+    return {
+        "hits": counts.get("hits", 0),
+        "narrowed": counts.get("narrowed", 0),
+        "misses": counts.get("misses", 0),
+        "hit_ratio": round(served / lookups, 4) if lookups else None,
+        "version": current_version(),
+    }
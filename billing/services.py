@@ -1,141 +1,257 @@
-import uuid
+from collections import defaultdict
+from datetime import datetime, time, timedelta
 from django.utils import timezone
-from datetime import datetime
-from medicines.models import Medicine, Batch
-from inventory.models import StockMovement, Action
+from medicines.models import SELLABLE, Batch, current_store_id
+from medicines.signals import notify_batches_changed
+from inventory.models import MedicineStock, StockMovement
+from inventory.services import get_action
+from inventory.stock import refresh_expired_stock, refresh_medicine_stock
+from reports.rollups import record_sales
 from .models import Invoice, InvoiceItem
-from django.db.models import Sum
+from .documents import save_invoice_document
+from .numbering import next_invoice_number, release_invoice_number
 from django.db import transaction
 from django.core.exceptions import ValidationError
 from decimal import Decimal
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def invoices_between(date_from, date_to):
+    # Invoices created on local dates date_from..date_to, both included, as
+    # a created_at range the index can serve (a __date lookup can't)
+    start = timezone.make_aware(datetime.combine(date_from, time.min))
+    end = timezone.make_aware(datetime.combine(date_to + timedelta(days=1), time.min))
+    return Invoice.objects.for_store().filter(created_at__gte=start, created_at__lt=end)
 
 
 # function for finding Total quantity of the medicine
 def get_available_stock_for_display(medicine_id):
-    try:
-        medicine = Medicine.objects.get(id=medicine_id)
-        total_quantity = (
-            medicine.batches.filter(
-                current_quantity__gt=0, expiration_date__gte=timezone.now().date()
-            ).aggregate(total=Sum("current_quantity"))["total"]
-            or 0
+    refresh_expired_stock()
+    stock = MedicineStock.objects.for_store().filter(medicine_id=medicine_id).first()
+    return stock.sellable_quantity if stock else 0
+
+
+# This store's sellable batches in the order they should be sold: grouped
+# by medicine, first-expiry-first-out, oldest batch first on a tie.
+def sellable_batches_fefo():
+    # Read through the partial batch_sellable_fefo_idx, already in this order
+    return (
+        Batch.objects.for_store()
+        .filter(SELLABLE, expiration_date__gte=timezone.localdate())
+        .order_by("medicine_id", "expiration_date", "id")
+    )
+
+
+def get_fefo_batch(medicine_id):
+    # This store's stock summary already knows it: one unique-key lookup,
+    # no sort
+    refresh_expired_stock()
+    return (
+        Batch.objects.filter(
+            fefo_of__store_id=current_store_id(), fefo_of__medicine_id=medicine_id
         )
-        return total_quantity
-    except Medicine.DoesNotExist:
-        return 0
-
-
-# allocate batches with quantity based on FIFO
-# def allocate_stock_fifo(batches, quantity_needed):
-#     remaining = quantity_needed
-#     allocations = []
-#     for batch in batches:
-#         if remaining <= 0:
-#             break
-#         allocate_quantity = min(batch.current_quantity, remaining)
-#         allocations.append({"batch": batch, "quantity": allocate_quantity})
-#         remaining -= allocate_quantity
+        .select_related("medicine")
+        .first()
+    )
+
+
+# allocate batches with quantity based on FEFO (first expiry, first out).
+# Call inside transaction.atomic(): the batches stay locked until commit.
+# `reserved` ({batch_id: qty}) is stock already promised to sales that are
+# not posted yet and is treated as sold.
+def allocate_stock_fefo(quantities, reserved=None):
+    reserved = reserved or {}
+    # One ordered, locked range read covers every requested medicine
+    batches = (
+        sellable_batches_fefo()
+        .select_for_update(of=("self",))
+        .select_related("medicine")
+        .filter(medicine_id__in=quantities)
+    )
+    batches_by_medicine = defaultdict(list)
+    for batch in batches:
+        batches_by_medicine[batch.medicine_id].append(batch)
+
+    allocations = []
+    for medicine_id, quantity_needed in quantities.items():
+        candidates = batches_by_medicine.get(medicine_id)
+        if not candidates:
+            raise ValidationError(f"Medicine {medicine_id} not available.")
+
+        remaining = quantity_needed
+        for batch in candidates:
+            if remaining <= 0:
+                break
+            available = batch.current_quantity - reserved.get(batch.id, 0)
+            if available <= 0:
+                continue
+            allocate_quantity = min(available, remaining)
+            allocations.append({"batch": batch, "quantity": allocate_quantity})
+            remaining -= allocate_quantity
+
+        if remaining > 0:
+            raise ValidationError(
+                f"Insufficient stock for {candidates[0].medicine.name}. "
+                f"Available {quantity_needed - remaining}"
+            )
 
-#     return allocations
+    return allocations
 
 
-# output:[{'batch': batch_obj, 'qty': 10}, {'batch': batch_obj, 'qty': 5}]
+# input: {medicine_id: 15}
+# output:[{'batch': batch_obj, 'quantity': 10}, {'batch': batch_obj, 'quantity': 5}]
 
 
 def deduct_stock(allocations, invoice_obj):
-    sale_action = Action.objects.get(name="Sale")
+    # Set-based: one UPDATE for every batch and one INSERT for every movement,
+    # however many lines the invoice has.
+    sale_action = get_action("Sale")
+    batches = []
+    movements = []
     for allocation in allocations:
         batch = allocation["batch"]
         qty = allocation["quantity"]
         batch.current_quantity -= qty
-        batch.save()
-        StockMovement.objects.create(
-            medicine=batch.medicine,
-            batch=batch,
-            action=sale_action,
-            quantity=qty,
-            invoice_number=invoice_obj,
+        batches.append(batch)
+        movements.append(
+            StockMovement(
+                medicine_id=batch.medicine_id,
+                batch=batch,
+                action=sale_action,
+                quantity=-qty,
+                invoice_number=invoice_obj,
+                store_id=batch.store_id,
+            )
         )
+    Batch.objects.bulk_update(batches, ["current_quantity"])
+    StockMovement.objects.bulk_create(movements)
+    refresh_medicine_stock(batch.medicine_id for batch in batches)
+    notify_batches_changed(batch.medicine_id for batch in batches)
     return True
 
 
-# [{'medicine_id': 1, 'qty': 10}, {'medicine_id': 2, 'qty': 5}]
+class PriceChanged(ValidationError):
+    """
+    The batches a sale is allocated from bring it to another total than the
+    cart showed: a medicine's quantity spans batches sold at different
+    prices, or prices changed since it was added.
+    """
 
-
-def create_invoice(user, cart_items, customer=None, payment_method="CASH"):
-    with transaction.atomic():
-        if not cart_items:
-            raise ValidationError("Cart is empty")
-
-        invoice_id = f"INV{datetime.now().strftime('%Y%m%d')}-{str(uuid.uuid4())[:8]}"
-
-        invoice = Invoice.objects.create(
-            invoice_number=invoice_id,
-            customer=customer,
-            created_by=user,
-            payment_method=payment_method,
-            payment_status="PAID",
-            total_amount=0,
-            gst_amount=0,
-            grand_total=0,
+    def __init__(self, grand_total, expected_total):
+        super().__init__(
+            f"The bill comes to ₹{grand_total:.2f}, not ₹{expected_total:.2f}: "
+            "some items are sold from batches at different prices."
         )
+        self.grand_total = grand_total
+        self.expected_total = expected_total
 
-        running_total_amount = Decimal("0.00")
-        running_gst_amount = Decimal("0.00")
 
-        # Process Cart
-        for batch_id_str, items_data in cart_items.items():
-            batch_id = int(batch_id_str)
-            qty_needed = int(items_data["quantity"])
+def check_quote(lines, expected_total):
+    # Totals of the allocated lines, if they are what the customer was shown
+    totals = invoice_totals(lines)
+    if expected_total is not None and totals["grand_total"] != expected_total:
+        raise PriceChanged(totals["grand_total"], expected_total)
+    return totals
 
-            today = timezone.localdate()
 
-            try:
-                batch = Batch.objects.select_for_update().get(
-                    id=batch_id, expiration_date__gte=today, current_quantity__gt=0
-                )
+# cart_items: {'<medicine_id>': {'quantity': 10, ...}, ...}
+# With `expected_total`, the sale is rejected (PriceChanged) unless its
+# allocated lines come to exactly that grand total.
 
-            except Batch.DoesNotExist:
-                raise ValidationError(f"Batch {batch_id} not available.")
 
-            if batch.current_quantity < qty_needed:
-                raise ValidationError(
-                    f"Insufficient stock for {batch.medicine.name}. "
-                    f"Available {batch.current_quantity}"
-                )
+def create_invoice(
+    user, cart_items, customer=None, payment_method="CASH", expected_total=None
+):
+    if not cart_items:
+        raise ValidationError("Cart is empty")
 
-            allocations = [{"batch": batch, "quantity": qty_needed}]
-            deduct_stock(allocations, invoice)
+    # Taken outside the transaction: the counter table is only written when
+    # this terminal runs out of reserved numbers.
+    invoice_id = next_invoice_number()
+    try:
+        invoice, lines = _create_invoice(
+            user, cart_items, customer, payment_method, invoice_id, expected_total
+        )
+    except Exception:
+        release_invoice_number(invoice_id)
+        raise
 
-            medicine = batch.medicine
-            price = batch.sale_price
-            gst_pct = medicine.gst_percent or Decimal("0.00")
+    # Rendered once the sale is committed; prints are served from it
+    try:
+        save_invoice_document(invoice, lines)
+    except Exception:
+        logger.warning("Could not store invoice %s", invoice_id, exc_info=True)
+    return invoice, lines
 
-            base_amount = price * qty_needed
-            tax_amount = (base_amount * gst_pct) / Decimal("100")
-            line_total = base_amount + tax_amount
 
-            InvoiceItem.objects.create(
-                invoice=invoice,
-                medicine=medicine,
-                batch=batch,
-                quantity=qty_needed,
-                unit_price=price,
-                gst_percent=gst_pct,
-                gst_amount=tax_amount,
-                total_amount=line_total,
+def _create_invoice(
+    user, cart_items, customer, payment_method, invoice_id, expected_total
+):
+    with transaction.atomic():
+        quantities = {
+            int(medicine_id_str): int(items_data["quantity"])
+            for medicine_id_str, items_data in cart_items.items()
+        }
+
+        # Split each medicine across its batches, soonest expiry first
+        allocations = allocate_stock_fefo(quantities)
+
+        lines = [
+            invoice_item(
+                allocation["batch"],
+                allocation["quantity"],
+                allocation["batch"].sale_price,
+                allocation["batch"].medicine.gst_percent or Decimal("0.00"),
             )
+            for allocation in allocations
+        ]
 
-            running_total_amount += base_amount
-            running_gst_amount += tax_amount
-
-        invoice.total_amount = running_total_amount
-        invoice.gst_amount = running_gst_amount
-        invoice.grand_total = running_total_amount + running_gst_amount
-
-        invoice.save()
+        invoice = Invoice.objects.create(
+            invoice_number=invoice_id,
+            customer=customer,
+            created_by=user,
+            payment_method=payment_method,
+            payment_status="PAID",
+            **check_quote(lines, expected_total),
+        )
 
-        return invoice
+        deduct_stock(allocations, invoice)
+
+        for line in lines:
+            line.invoice = invoice
+        InvoiceItem.objects.bulk_create(lines)
+        record_sales([(invoice, lines)])
+
+        return invoice, lines
+
+
+# An unsaved invoice line for `quantity` units of `batch` at the given price
+def invoice_item(batch, quantity, unit_price, gst_percent):
+    base_amount = unit_price * quantity
+    tax_amount = (base_amount * gst_percent) / Decimal("100")
+    return InvoiceItem(
+        medicine=batch.medicine,
+        batch=batch,
+        quantity=quantity,
+        unit_price=unit_price,
+        gst_percent=gst_percent,
+        gst_amount=tax_amount,
+        total_amount=base_amount + tax_amount,
+    )
+
+
+def invoice_totals(lines):
+    total_amount = sum(
+        (line.unit_price * line.quantity for line in lines), Decimal("0.00")
+    )
+    gst_amount = sum((line.gst_amount for line in lines), Decimal("0.00"))
+    return {
+        "total_amount": total_amount,
+        "gst_amount": gst_amount,
+        "grand_total": total_amount + gst_amount,
+    }
 
 
 # summary function for calculating grand total etc in UI
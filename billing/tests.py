@@ -1,3 +1,489 @@
-from django.test import TestCase
+import shutil
+import tempfile
+from datetime import timedelta
+from decimal import Decimal
+from pathlib import Path
+from unittest import mock
 
-# Create your tests here.
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured, ValidationError
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from billing import journal, numbering
+
+from billing.cart import Cart, CartConflict, CartLine, LRUCartStore, get_cart_store
+from billing.scan import barcode_index, resolve_barcode
+from billing.models import (
+    CartSnapshot,
+    Invoice,
+    InvoiceDocument,
+    InvoiceSequence,
+    Staff,
+    VoidedInvoiceNumber,
+)
+from billing.numbering import (
+    InvoiceNumberAllocator,
+    close_allocator,
+    format_invoice_number,
+    hold_terminal_lock,
+)
+from billing.search_cache import cached_search
+from billing.services import create_invoice
+from inventory.models import Action
+from medicines.models import Batch, Brand, Medicine, PackType, StockChange, Supplier
+
+from pharmacy_project.query_plans import QueryPlanTestCase, make_sample_stock
+
+
+class HotQueryPlanTests(QueryPlanTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.shop = make_sample_stock()
+
+    def setUp(self):
+        # Search results are cached across requests
+        cache.clear()
+
+    def test_medicine_search(self):
+        response = self.assertNoFullScans(
+            lambda: self.client.get("/billingsearch-medicine/", {"search": "amox"})
+        )
+        self.assertContains(response, "Amoxicillin")
+
+    def test_barcode_scan(self):
+        def scan():
+            return self.client.post("/billingscan/", {"barcode": "8901000000028"})
+
+        # The first scan loads every barcode in one pass, by design...
+        barcode_index.clear()
+        self.assertNoFullScans(scan, allow=["medicines_medicine"])
+        # ...and a barcode dropped since is looked up on its own
+        barcode_index.invalidate([medicine.id for medicine in self.shop["medicines"]])
+        self.assertNoFullScans(scan)
+
+    def test_barcode_scan_sees_changes_of_other_processes(self):
+        azithromycin = self.shop["medicines"][1]
+        barcode_index.clear()
+        self.assertEqual(resolve_barcode("8901000000028").price, Decimal("10.00"))
+        # Another process reprices the batch: no signal reaches this one,
+        # only the row it logs
+        Batch.objects.filter(medicine=azithromycin).update(sale_price="12.00")
+        StockChange.objects.create(medicine_id=azithromycin.id)
+        self.assertEqual(resolve_barcode("8901000000028").price, Decimal("12.00"))
+
+    def test_search_cache_sees_changes_of_other_processes(self):
+        searches = []
+
+        def search(query):
+            searches.append(query)
+            return [], True, "fts"
+
+        cached_search("amox", search)
+        cached_search("amox", search)
+        StockChange.objects.create(medicine_id=self.shop["medicines"][0].id)
+        cached_search("amox", search)
+        self.assertEqual(searches, ["amox", "amox"])
+
+    def test_add_to_cart_and_checkout(self):
+        medicine = self.shop["medicines"][0]
+        self.assertNoFullScans(
+            lambda: self.client.post(
+                "/billingadd-to-cart/", {"medicine_id": medicine.id}
+            )
+        )
+        response = self.assertNoFullScans(
+            lambda: self.client.post("/billingcheckout/", {"payment_mode": "CASH"})
+        )
+        self.assertEqual(response.status_code, 200)
+
+    def test_print_invoice(self):
+        invoice = self.shop["invoice"]
+        self.assertNoFullScans(
+            lambda: self.client.get(f"/billinginvoice/{invoice.id}/print/")
+        )
+
+    def test_reprint_invoices(self):
+        day = self.shop["invoice"].created_at.date().isoformat()
+
+        def reprint():
+            response = self.client.get(
+                "/billinginvoices/reprint/", {"from": day, "to": day}
+            )
+            return b"".join(response.streaming_content)
+
+        self.assertTrue(self.assertNoFullScans(reprint))
+
+    def test_reprint_view_renders_in_process(self):
+        day = self.shop["invoice"].created_at.date().isoformat()
+        InvoiceDocument.objects.all().delete()
+        with (
+            mock.patch("billing.documents.POOL_THRESHOLD", 1),
+            mock.patch("billing.documents.ProcessPoolExecutor") as pool,
+        ):
+            response = self.client.get(
+                "/billinginvoices/reprint/", {"from": day, "to": day}
+            )
+            self.assertTrue(b"".join(response.streaming_content))
+        pool.assert_not_called()
+        self.assertTrue(InvoiceDocument.objects.exists())
+
+    def test_customer_search(self):
+        # A substring search reads every customer; it must not touch invoices
+        self.assertNoFullScans(
+            lambda: self.client.get("/billingcustomer/search/", {"q": "98"}),
+            allow=["billing_customer"],
+        )
+
+
+class CheckoutPricingTests(QueryPlanTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.shop = make_sample_stock()
+        # Amoxicillin: 3 left in B1 at 10.00, then B0 now at 12.00
+        Batch.objects.filter(batch_number="B0").update(sale_price="12.00")
+
+    def setUp(self):
+        self.amoxicillin = self.shop["medicines"][0]
+        self.invoices = Invoice.objects.count()
+
+    def add(self, times):
+        for _ in range(times):
+            self.client.post(
+                "/billingadd-to-cart/", {"medicine_id": self.amoxicillin.id}
+            )
+
+    def checkout(self, **data):
+        return self.client.post("/billingcheckout/", {"payment_mode": "CASH", **data})
+
+    def test_quantity_split_across_batches_charges_each_batch_price(self):
+        self.add(5)
+        # The cart shows 5 x 10.00 + 12% = 56.00; the batches come to more
+        response = self.checkout()
+        self.assertContains(response, "Confirm Total")
+        self.assertContains(response, 'name="confirmed_total" value="60.4800"')
+        self.assertEqual(Invoice.objects.count(), self.invoices)
+
+        response = self.checkout(confirmed_total="60.4800")
+        self.assertContains(response, "Invoice")
+        invoice = Invoice.objects.latest("id")
+        self.assertEqual(invoice.grand_total, Decimal("60.48"))
+        self.assertEqual(
+            sorted(
+                invoice.items.values_list(
+                    "batch__batch_number", "quantity", "unit_price"
+                )
+            ),
+            [("B0", 2, Decimal("12.00")), ("B1", 3, Decimal("10.00"))],
+        )
+
+    def test_single_batch_checks_out_at_the_cart_price(self):
+        self.add(3)
+        self.checkout()
+        invoice = Invoice.objects.latest("id")
+        self.assertEqual(Invoice.objects.count(), self.invoices + 1)
+        self.assertEqual(invoice.grand_total, Decimal("33.60"))
+
+    def test_stale_confirmation_is_asked_again(self):
+        self.add(5)
+        response = self.checkout(confirmed_total="56.00")
+        self.assertContains(response, 'name="confirmed_total" value="60.4800"')
+        self.assertEqual(Invoice.objects.count(), self.invoices)
+
+    def test_cart_changed_during_checkout_is_left_alone(self):
+        self.add(3)
+        key = self.client.cookies["pos_cart"].value
+        cetirizine = self.shop["medicines"][2]
+
+        def add_meanwhile(**kwargs):
+            sale = create_invoice(**kwargs)
+            # Another tab scans a medicine while the sale is being posted
+            get_cart_store().mutate(
+                key,
+                lambda cart: cart.add(
+                    CartLine(cetirizine.id, "Cetirizine", "B4", None, "10.00", "12", 1)
+                ),
+            )
+            return sale
+
+        with mock.patch("billing.views.create_invoice", add_meanwhile):
+            self.checkout()
+        cart = get_cart_store().load(key)
+        self.assertEqual(
+            sorted(dict(cart.items())),
+            sorted([str(self.amoxicillin.id), str(cetirizine.id)]),
+        )
+        self.assertEqual(Invoice.objects.count(), self.invoices + 1)
+
+    def test_malformed_cart_version_is_rejected(self):
+        self.add(1)
+        for url in ("/billingadd-to-cart/", "/billingremove-from-cart/"):
+            response = self.client.post(
+                url, {"medicine_id": self.amoxicillin.id, "cart_version": "abc"}
+            )
+            self.assertEqual(response.status_code, 400)
+
+    def test_insufficient_stock_is_rejected(self):
+        with self.assertRaisesMessage(ValidationError, "Insufficient stock"):
+            create_invoice(
+                self.shop["staff"], {str(self.amoxicillin.id): {"quantity": 100}}
+            )
+        self.assertEqual(Invoice.objects.count(), self.invoices)
+
+
+class CheckoutStatementTests(QueryPlanTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        Action.objects.create(name="Sale")
+        cls.staff = Staff.objects.create(name="Counter", position="Pharmacist")
+        brand = Brand.objects.create(name="Cipla")
+        pack_type = PackType.objects.create(name="Strip")
+        supplier = Supplier.objects.create(name="Medline")
+        cls.medicines = []
+        for number in range(10):
+            medicine = Medicine.objects.create(
+                name=f"Medicine {number}",
+                brand=brand,
+                pack_size=10,
+                pack_type=pack_type,
+                hsn_code="3004",
+                gst_percent="12.00",
+            )
+            Batch.objects.create(
+                batch_number="B1",
+                medicine=medicine,
+                initial_quantity=50,
+                current_quantity=50,
+                purchase_price="6.00",
+                sale_price="10.00",
+                expiration_date=timezone.localdate() + timedelta(days=200),
+                supplier=supplier,
+            )
+            cls.medicines.append(medicine)
+
+    def setUp(self):
+        allocator = mock.patch.object(
+            numbering, "_allocator", InvoiceNumberAllocator("01", block_size=50)
+        )
+        allocator.start()
+        self.addCleanup(allocator.stop)
+
+    def statements(self, medicines):
+        with CaptureQueriesContext(connection) as captured:
+            create_invoice(
+                self.staff,
+                {str(medicine.id): {"quantity": 2} for medicine in medicines},
+            )
+        return len(captured.captured_queries)
+
+    def test_statements_do_not_grow_with_the_lines(self):
+        # Reserves the number block and fills the lookup caches
+        self.statements(self.medicines[:1])
+        self.assertEqual(
+            self.statements(self.medicines), self.statements(self.medicines[:1])
+        )
+
+
+class CheckoutJournalTests(QueryPlanTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.shop = make_sample_stock()
+
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        settings = override_settings(
+            POS_CHECKOUT_JOURNAL={"DIR": directory, "BATCH_SIZE": 50}
+        )
+        settings.enable()
+        self.addCleanup(settings.disable)
+        journal._journal = None
+        self.addCleanup(setattr, journal, "_journal", None)
+
+    def test_drained_sales_reach_the_web_process_caches(self):
+        azithromycin = self.shop["medicines"][1]
+        barcode_index.clear()
+        self.assertIsNotNone(resolve_barcode("8901000000028"))
+        journal.journal_checkout(
+            self.shop["staff"], {str(azithromycin.id): {"quantity": 3}}
+        )
+        # Posted by the drain command in its own process: only the change it
+        # logs with the sale tells this one the last batch is sold out
+        self.assertEqual(journal.drain_checkout_journal(), (1, 0))
+        self.assertIsNone(resolve_barcode("8901000000028"))
+
+    def sell(self, medicine, quantity=1):
+        invoice, _ = journal.journal_checkout(
+            self.shop["staff"], {str(medicine.id): {"quantity": quantity}}
+        )
+        return invoice.invoice_number
+
+    def test_crash_before_checkpoint_replays_without_posting_twice(self):
+        cetirizine = self.shop["medicines"][2]
+        number = self.sell(cetirizine, 2)
+        # The committer dies after its transaction commits, before the
+        # checkpoint moves
+        with mock.patch.object(
+            journal.CheckoutJournal, "set_checkpoint", side_effect=OSError
+        ):
+            with self.assertRaises(OSError):
+                journal.drain_checkout_journal()
+        self.assertTrue(Invoice.objects.filter(invoice_number=number).exists())
+
+        self.assertEqual(journal.drain_checkout_journal(), (0, 0))
+        self.assertEqual(Invoice.objects.filter(invoice_number=number).count(), 1)
+        batch = Batch.objects.get(batch_number="B4")
+        self.assertEqual(batch.current_quantity, 58)
+        self.assertEqual(journal.get_checkout_journal().path.read_bytes(), b"")
+
+    def test_torn_trailing_line_is_ignored_and_overwritten(self):
+        cetirizine = self.shop["medicines"][2]
+        self.sell(cetirizine)
+        path = journal.get_checkout_journal().path
+        # A checkout died halfway through writing its record
+        with open(path, "ab") as handle:
+            handle.write(b'{"invoice_number":"INV-')
+        self.sell(cetirizine)
+        self.assertTrue(path.read_bytes().endswith(b"}\n"))
+        with open(path, "ab") as handle:
+            handle.write(b'{"invoice_number":"INV-')
+
+        self.assertEqual(journal.drain_checkout_journal(), (2, 0))
+        self.assertEqual(Batch.objects.get(batch_number="B4").current_quantity, 58)
+
+    def test_compact_keeps_unposted_records(self):
+        cetirizine = self.shop["medicines"][2]
+        self.sell(cetirizine, 2)
+        self.sell(cetirizine, 3)
+        checkout_journal = journal.get_checkout_journal()
+        (_, first_end), _ = checkout_journal.read(0)
+        generation, _ = checkout_journal.checkpoint()
+        checkout_journal.set_checkpoint(generation, first_end)
+
+        self.assertFalse(checkout_journal.compact())
+        self.assertEqual(len(checkout_journal.path.read_bytes().splitlines()), 2)
+        with checkout_journal.locked():
+            batch = Batch.objects.get(batch_number="B4")
+            self.assertEqual(checkout_journal.reserved(), {batch.id: 3})
+
+
+class CartStoreTests(TestCase):
+    # Two stores over one database stand for two worker processes
+    def setUp(self):
+        self.first = LRUCartStore(flush_interval=3600)
+        self.second = LRUCartStore(flush_interval=3600)
+
+    def add(self, medicine_id, quantity=1):
+        def change(cart):
+            cart.add(CartLine(medicine_id, "Med", "B1", None, "10.00", "12", quantity))
+
+        return change
+
+    def snapshot(self):
+        return CartSnapshot.objects.values_list("version", "data").get(key="till")
+
+    def test_cart_changed_in_another_process_is_reloaded(self):
+        self.first.mutate("till", self.add(1))
+        self.first.flush()
+        self.second.mutate("till", self.add(2), expected_version=1)
+        self.second.flush()
+        # The client was last served by the second process, at version 2
+        cart = self.first.mutate("till", self.add(3), expected_version=2)
+        self.assertEqual(
+            (cart.version, sorted(dict(cart.items()))), (3, ["1", "2", "3"])
+        )
+        with self.assertRaises(CartConflict):
+            self.first.mutate("till", Cart.clear, expected_version=2)
+
+    def test_flush_never_overwrites_a_newer_snapshot(self):
+        self.second.load("till")
+        self.first.mutate("till", self.add(1))
+        self.first.mutate("till", self.add(1))
+        self.first.flush()
+        self.second.mutate("till", self.add(2))
+        self.second.flush()
+        self.assertEqual(
+            self.snapshot(), (2, [[1, "Med", "B1", None, "10.00", "12", 2]])
+        )
+        # The second store's copy lost: it reads the saved cart next time
+        self.assertEqual(self.second.load("till").version, 2)
+        self.assertIsNotNone(self.second.load("till").get(1))
+
+    def test_conflicting_flush_at_the_same_version(self):
+        self.first.mutate("till", self.add(1))
+        self.second.mutate("till", self.add(2))
+        self.first.flush()
+        self.second.flush()
+        self.assertEqual(self.snapshot()[0], 1)
+        self.assertIsNotNone(self.second.load("till").get(1))
+        self.assertIsNone(self.second.load("till").get(2))
+
+    def test_cleared_cart_keeps_its_version(self):
+        self.second.load("till")
+        self.first.mutate("till", self.add(1))
+        self.first.mutate("till", Cart.clear)
+        self.first.flush()
+        self.assertEqual(self.snapshot(), (2, []))
+        # A stale copy of the full cart can't bring it back
+        self.second.mutate("till", self.add(1))
+        self.second.flush()
+        self.assertEqual(self.snapshot(), (2, []))
+
+
+class InvoiceNumberingTests(TestCase):
+    def setUp(self):
+        self.allocator = InvoiceNumberAllocator("01", block_size=5)
+        self.day = timezone.localdate()
+
+    def number(self, sequence, day=None):
+        return format_invoice_number(day or self.day, "01", sequence)
+
+    def voided(self):
+        return list(
+            VoidedInvoiceNumber.objects.values_list("invoice_number", flat=True)
+        )
+
+    def last_reserved(self, day=None):
+        return InvoiceSequence.objects.get(day=day or self.day).last_reserved
+
+    def test_last_number_released_is_reused(self):
+        first = self.allocator.allocate()
+        self.allocator.release(first)
+        self.assertEqual(self.allocator.allocate(), first)
+        self.allocator.close()
+        self.assertEqual((self.voided(), self.last_reserved()), ([], 1))
+
+    def test_earlier_number_released_is_voided_not_reused(self):
+        first = self.allocator.allocate()
+        self.allocator.allocate()
+        self.allocator.release(first)
+        self.assertEqual(self.allocator.allocate(), self.number(3))
+        self.allocator.close()
+        # The unused tail goes back to the counter, the hole is voided
+        self.assertEqual((self.voided(), self.last_reserved()), ([first], 3))
+
+    def test_day_rollover_voids_released_numbers(self):
+        first = self.allocator.allocate()
+        self.allocator.allocate()
+        self.allocator.release(first)
+        tomorrow = self.day + timedelta(days=1)
+        with mock.patch.object(timezone, "localdate", return_value=tomorrow):
+            self.assertEqual(self.allocator.allocate(), self.number(1, tomorrow))
+        self.assertEqual((self.voided(), self.last_reserved()), ([first], 2))
+
+    def test_one_process_per_terminal(self):
+        path = Path(tempfile.mkdtemp()) / "terminal.lock"
+        self.addCleanup(shutil.rmtree, path.parent)
+        held = hold_terminal_lock(path, "01")
+        self.addCleanup(held.close)
+        with self.assertRaisesMessage(ImproperlyConfigured, "Terminal 01"):
+            hold_terminal_lock(path, "01")
+
+    def test_close_without_allocating_writes_nothing(self):
+        # A process that never billed, as `manage.py test` or a command
+        with mock.patch.object(numbering, "_allocator", None):
+            with self.assertNumQueries(0):
+                close_allocator()
+                self.allocator.close()
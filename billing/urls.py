@@ -5,7 +5,9 @@ from . import views
 urlpatterns = [
     path("", views.pos_billing_page, name="pos"),
     path("search-medicine/", views.search_medicine, name="search_medicine"),
+    path("search-cache-stats/", views.search_cache_stats, name="search_cache_stats"),
     path("add-to-cart/", views.add_to_cart, name="add_to_cart"),
+    path("scan/", views.scan_barcode, name="scan_barcode"),
     path("remove-from-cart/", views.remove_from_cart, name="remove_from_cart"),
     path(
         "update-cart-quantity", views.update_cart_quantity, name="update_cart_quantity"
@@ -29,5 +31,6 @@ urlpatterns = [
         views.print_invoice_view,
         name="print_invoice",
     ),
+    path("invoices/reprint/", views.reprint_invoices_view, name="reprint_invoices"),
     path("clear_cart/", views.clear_cart, name="clear_cart"),
 ]
@@ -1,68 +1,126 @@
 import json
+from datetime import date
+from decimal import Decimal, InvalidOperation
 from django.shortcuts import render, get_object_or_404
 from django.db.models import (
     Q,
-    OuterRef,
-    Subquery,
-    Min,
     F,
     Case,
     When,
     Value,
     BooleanField,
+    FilteredRelation,
+)
+from medicines.models import Batch, current_store_id
+from billing.services import (
+    PriceChanged,
+    create_invoice,
+    get_fefo_batch,
+    invoices_between,
+)
+from billing.journal import journal_checkout
+from billing.documents import (
+    FORMATS,
+    document_content,
+    get_invoice_document,
+    iter_invoice_documents,
+)
+from pharmacy_project.streaming import stream_zip
+from billing.scan import resolve_barcode
+from inventory.stock import refresh_expired_stock
+from billing import search_cache
+from billing.search_cache import cached_search
+from medicines.search import rank_expression, search_medicine_ids
+from .cart import (
+    Cart,
+    CartConflict,
+    CartLine,
+    get_cart_key,
+    get_cart_store,
+    remember_cart_key,
+)
+from django.http import (
+    Http404,
+    HttpResponse,
+    HttpResponseBadRequest,
+    JsonResponse,
+    StreamingHttpResponse,
 )
-from medicines.models import Batch
-from decimal import Decimal
-from billing.services import summary, create_invoice
-from django.http import HttpResponse
 from django.template.loader import render_to_string
-from .models import Customer, InvoiceItem, Invoice, Staff
+from django.conf import settings
+from .models import Customer, Invoice, Staff
 from django.core.exceptions import ValidationError
 from django.utils.timezone import now
 import logging
-import traceback
 
 
 logger = logging.getLogger(__name__)
 
+# How many ranked medicines the POS search looks at, and how many batch rows
+# of them it keeps for the search cache to narrow down
+SEARCH_MEDICINE_LIMIT = 50
+SEARCH_RESULT_CAP = 200
 
-# helper function
-def recalculate_totals(request, cart):
-    subtotal = Decimal(0)
-    total_tax = Decimal(0)
-    grand_total = Decimal(0)
 
-    for str_id, item in cart.items():
-        base, tax, line_tot = summary(item)
-        subtotal += base
-        total_tax += tax
-        grand_total += line_tot
+# helper functions
+def cart_response(request, cart, html, target, swap):
+    # Every cart mutation answers in one round trip: the changed markup plus
+    # the summary, item count and cart version as out-of-band swaps.
+    oob_html = render_to_string(
+        "billing/partials/cart_oob.html", {"cart": cart}, request=request
+    )
+    response = HttpResponse(html + oob_html)
+    response["HX-Retarget"] = target
+    response["HX-Reswap"] = swap
+    return remember_cart_key(response, cart.key)
 
-    # Update Session
-    request.session["subtotal"] = float(subtotal)
-    request.session["tax_total"] = float(total_tax)
-    request.session["grand_total"] = float(grand_total)
-    request.session.modified = True
 
-    return subtotal, total_tax, grand_total
+def render_cart(request, cart):
+    cart_html = render_to_string(
+        "billing/partials/cart_area.html", {"cart": cart}, request=request
+    )
+    return cart_response(request, cart, cart_html, "#cart-area", "outerHTML")
+
+
+def render_cart_row(request, cart, key, target, swap):
+    row_html = render_to_string(
+        "billing/partials/cart_row.html",
+        {"key": key, "item": cart.get(key)},
+        request=request,
+    )
+    return cart_response(request, cart, row_html, target, swap)
+
+
+def mutate_cart(request, change, check_version=True):
+    # Apply a change to this terminal's cart. Returns the cart and whether
+    # this request's change is the only one since the client last rendered
+    # it, in which case re-rendering the touched row is enough. Raises
+    # ValueError for a cart_version that isn't a number.
+    seen_version = request.POST.get("cart_version")
+    seen_version = int(seen_version) if seen_version else None
+    cart = get_cart_store().mutate(
+        get_cart_key(request),
+        change,
+        expected_version=seen_version if check_version else None,
+    )
+    in_step = seen_version is not None and cart.version == seen_version + 1
+    return cart, in_step
 
 
 # 1. Main POS Page
 def pos_billing_page(request):
-    cart = request.session.get("cart", {})
-    subtotal = request.session.get("subtotal", 0.0)
-    tax_total = request.session.get("tax_total", 0.0)
-    grand_total = request.session.get("grand_total", 0.0)
-    return render(
+    cart = get_cart_store().load(get_cart_key(request))
+    response = render(
         request,
         "billing/pos_billing_page.html",
         {
             "cart": cart,
-            "subtotal": subtotal,
-            "tax_total": tax_total,
-            "grand_total": grand_total,
+            "subtotal": cart.subtotal,
+            "tax_total": cart.tax_total,
+            "grand_total": cart.grand_total,
         },
     )
+    return remember_cart_key(response, cart.key)
 
 
 # 2. Search Suggestions (HTMX)
@@ -74,167 +132,212 @@ def search_medicine(request):
     if len(query) < 2:
         return render(request, "billing/partials/search_results.html", {"batches": []})
 
-    earliest_expiry_subquery = (
-        Batch.objects.filter(
-            medicine=OuterRef("medicine"),
-            is_active=True,
-            current_quantity__gt=0,
-            expiration_date__gte=now().date(),
+    # Served from the search cache while stock and catalogue are unchanged
+    batches = cached_search(query, find_search_results)[:10]
+
+    return render(request, "billing/partials/search_results.html", {"batches": batches})
+
+
+# Every sellable batch matching the query, best first, as plain rows the
+# search cache can keep and narrow down.
+def find_search_results(query):
+    refresh_expired_stock()
+
+    # Ask the full-text index for the best matching medicines first
+    medicine_ids = search_medicine_ids(query, limit=SEARCH_MEDICINE_LIMIT)
+    if medicine_ids is None:
+        mode = "contains"
+        matches = Q(medicine__name__icontains=query) | Q(
+            medicine__barcode__icontains=query
         )
-        .values("medicine")
-        .annotate(min_expiry=Min("expiration_date"))
-        .values("min_expiry")[:1]  # ⭐ IMPORTANT
-    )
+        search_rank = Value(0)
+    else:
+        mode = "fts"
+        matches = Q(medicine_id__in=medicine_ids)
+        search_rank = rank_expression(medicine_ids, field="medicine_id")
 
     batches = (
-        Batch.objects.filter(
-            Q(medicine__name__icontains=query) | Q(medicine__barcode__icontains=query),
+        Batch.objects.for_store()
+        .filter(
+            matches,
             is_active=True,
             current_quantity__gt=0,
             expiration_date__gte=now().date(),
         )
-        .select_related("medicine")
+        .select_related("medicine", "medicine__brand")
         .annotate(
-            earliest_expiry=Subquery(earliest_expiry_subquery),
+            # Kept in the medicine's stock summary for this store
+            store_stock=FilteredRelation(
+                "medicine__stocks",
+                condition=Q(medicine__stocks__store_id=current_store_id()),
+            ),
+            earliest_expiry=F("store_stock__earliest_expiry"),
             is_soonest_expiry=Case(
                 When(expiration_date=F("earliest_expiry"), then=Value(True)),
                 default=Value(False),
                 output_field=BooleanField(),
             ),
+            search_rank=search_rank,
         )
     ).order_by(
         "-is_soonest_expiry",  # True first
+        "search_rank",  # Best text match first
         "expiration_date",  # Then by date
-    )[:10]
+    )[: SEARCH_RESULT_CAP + 1]
+
+    rows = []
+    for batch in batches:
+        medicine = batch.medicine
+        if mode == "fts":
+            text_parts = [
+                medicine.name,
+                medicine.strength,
+                medicine.brand.name if medicine.brand else None,
+                medicine.barcode,
+            ]
+        else:
+            text_parts = [medicine.name, medicine.barcode]
+        rows.append(
+            {
+                "id": batch.id,
+                "medicine_id": batch.medicine_id,
+                "medicine": {"name": medicine.name},
+                "batch_number": batch.batch_number,
+                "expiration_date": batch.expiration_date,
+                "current_quantity": batch.current_quantity,
+                "sale_price": batch.sale_price,
+                "is_soonest_expiry": batch.is_soonest_expiry,
+                "search_text": " ".join(part for part in text_parts if part),
+            }
+        )
+
+    # Complete unless the index or the row cap may have cut matches off
+    complete = len(rows) <= SEARCH_RESULT_CAP and (
+        medicine_ids is None or len(medicine_ids) < SEARCH_MEDICINE_LIMIT
+    )
+    return rows[:SEARCH_RESULT_CAP], complete, mode
 
-    return render(request, "billing/partials/search_results.html", {"batches": batches})
+
+def search_cache_stats(request):
+    return JsonResponse(search_cache.stats())
 
 
 # 3. Add to Cart (HTMX)
+# The cart is keyed by medicine; batches are picked FEFO at checkout, which
+# asks to confirm the total when they are priced unlike the first one.
 def add_to_cart(request):
-    batch_id = request.POST.get("batch_id")
-    batch = get_object_or_404(Batch, id=batch_id)
-    cart = request.session.get("cart", {})
-    str_id = str(batch_id)
-
-    if str_id in cart:
-        # Increment quantity if exists
-        cart[str_id]["quantity"] += 1
-        cart[str_id]["total"] = float(cart[str_id]["price"]) * cart[str_id]["quantity"]
-    else:
-        # Add new item
-        cart[str_id] = {
-            "name": batch.medicine.name,
-            "batch_number": batch.batch_number,
-            "expiry_date": batch.expiration_date.isoformat()
-            if batch.expiration_date
-            else None,
-            "price": float(batch.sale_price),
-            "gst": float(batch.medicine.gst_percent)
-            if batch.medicine.gst_percent is not None
-            else 0.0,
-            "quantity": 1,
-            "total": float(batch.sale_price),
-        }
-
-    request.session["cart"] = cart
-    request.session.modified = True
-
-    sub, tax, grand = recalculate_totals(request, cart)
-    # 1. Render ONLY the Cart Area
-    # This ensures it fits perfectly into #cart-area without breaking the DOM
-    cart_html = render_to_string(
-        "billing/partials/cart_area.html", {"cart": cart}, request=request
+    medicine_id = request.POST.get("medicine_id")
+    batch = get_fefo_batch(medicine_id)
+    if batch is None:
+        raise Http404("No sellable batch for this medicine")
+
+    # Priced from the batch that will be sold first
+    line = CartLine(
+        medicine_id=batch.medicine_id,
+        name=batch.medicine.name,
+        batch_number=batch.batch_number,
+        expiry_date=batch.expiration_date.isoformat(),
+        price=batch.sale_price,
+        gst=batch.medicine.gst_percent or 0,
+        quantity=1,
     )
+    return add_line_to_cart(request, line)
 
-    response = HttpResponse(cart_html)
 
-    # 2. Send a Trigger to the frontend
-    # This tells main.html to fire the 'update-summary' event
-    response["HX-Trigger"] = "update-summary"
+# Barcode scanner input: exact barcode match, straight into the cart
+def scan_barcode(request):
+    barcode = request.POST.get("barcode") or request.POST.get("search", "")
+    line = resolve_barcode(barcode) if barcode.strip() else None
+    if line is None:
+        response = render(
+            request,
+            "billing/partials/scan_not_found.html",
+            {"barcode": barcode},
+        )
+        response["HX-Retarget"] = "#search-results"
+        response["HX-Reswap"] = "innerHTML"
+        return response
 
+    response = add_line_to_cart(request, line)
+    # Close any suggestions the scanner's keystrokes opened
+    response.write('<div id="search-results" hx-swap-oob="innerHTML"></div>')
     return response
 
 
-def remove_from_cart(request):
-    batch_id = request.POST.get("batch_id")
-    cart = request.session.get("cart", {})
-    str_id = str(batch_id)
-
-    # 1. Remove Item Logic
-    if str_id in cart:
-        del cart[str_id]
-        request.session["cart"] = cart
-        request.session.modified = True
+def add_line_to_cart(request, line):
+    key = str(line.medicine_id)
+    was_in_cart = False
 
-    # 2. Recalculate Totals (CRITICAL: Keeps session data correct)
-    # We don't use the return values here, but this function updates
-    # request.session['subtotal'], etc., which the Sidebar needs.
-    recalculate_totals(request, cart)
+    def change(cart):
+        nonlocal was_in_cart
+        was_in_cart = cart.get(key) is not None
+        cart.add(line)
 
-    # 3. Render ONLY the Cart Area
-    # This ensures the response is just the list of items, no extra summary blocks.
-    cart_html = render_to_string(
-        "billing/partials/cart_area.html", {"cart": cart}, request=request
-    )
-
-    response = HttpResponse(cart_html)
+    # Adding is safe to apply on top of any version, so don't check it
+    try:
+        cart, in_step = mutate_cart(request, change, check_version=False)
+    except ValueError:
+        return HttpResponseBadRequest("Invalid cart version")
+    if not in_step or len(cart) == 1:
+        return render_cart(request, cart)
+    if was_in_cart:
+        return render_cart_row(request, cart, key, f"#item-{key}", "outerHTML")
+    return render_cart_row(request, cart, key, "#cart-rows", "beforeend")
 
-    # 4. Trigger the Sidebar Update
-    # This matches the hx-trigger="update-summary" in your main.html
-    response["HX-Trigger"] = "update-summary"
 
-    return response
+def remove_from_cart(request):
+    medicine_id = request.POST.get("medicine_id")
+    try:
+        cart, in_step = mutate_cart(request, lambda cart: cart.remove(medicine_id))
+    except CartConflict as conflict:
+        return render_cart(request, conflict.cart)
+    except ValueError:
+        return HttpResponseBadRequest("Invalid cart version")
+    if not in_step or not cart:
+        return render_cart(request, cart)
+    # An empty body swapped over the row removes it
+    return cart_response(request, cart, "", f"#item-{medicine_id}", "outerHTML")
 
 
 # update cart quantity
 def update_cart_quantity(request):
-    batch_id = request.POST.get("batch_id")
+    medicine_id = request.POST.get("medicine_id")
     action = request.POST.get("action")
-    cart = request.session.get("cart", {})
-    str_id = str(batch_id)
 
-    # 1. Update Logic (Keep exactly as is)
-    if str_id in cart:
+    def change(cart):
+        line = cart.get(medicine_id)
+        if line is None:
+            return
         if action == "increment":
-            cart[str_id]["quantity"] += 1
-        elif action == "decrement" and cart[str_id]["quantity"] > 1:
-            cart[str_id]["quantity"] -= 1
+            cart.set_quantity(medicine_id, line.quantity + 1)
+        elif action == "decrement":
+            cart.set_quantity(medicine_id, line.quantity - 1)
 
-        cart[str_id]["total"] = float(cart[str_id]["price"]) * cart[str_id]["quantity"]
-
-    request.session["cart"] = cart
-    request.session.modified = True
-
-    # 2. Recalculate Totals (Keep this!)
-    # This updates the session variables so the sidebar can read them later.
-    recalculate_totals(request, cart)
-
-    # 3. Render ONLY the Cart HTML
-    # This ensures the response fits perfectly into #cart-area without duplicates.
-    cart_html = render_to_string(
-        "billing/partials/cart_area.html", {"cart": cart}, request=request
+    try:
+        cart, in_step = mutate_cart(request, change)
+    except CartConflict as conflict:
+        return render_cart(request, conflict.cart)
+    except ValueError:
+        return HttpResponseBadRequest("Invalid cart version")
+    if not in_step or cart.get(medicine_id) is None:
+        return render_cart(request, cart)
+    return render_cart_row(
+        request, cart, medicine_id, f"#item-{medicine_id}", "outerHTML"
     )
 
-    response = HttpResponse(cart_html)
-
-    # 4. Trigger the Sidebar Update
-    # This tells the frontend: "I updated the cart, now you go refresh the summary."
-    response["HX-Trigger"] = "update-summary"
-
-    return response
-
 
 # summary section
 def get_cart_summary(request):
-    subtotal = request.session.get("subtotal", 0.0)
-    tax_total = request.session.get("tax_total", 0.0)
-    grand_total = request.session.get("grand_total", 0.0)
+    cart = get_cart_store().load(get_cart_key(request))
 
     return render(
         request,
         "billing/partials/summary_area.html",
-        {"subtotal": subtotal, "tax_total": tax_total, "grand_total": grand_total},
+        {
+            "subtotal": cart.subtotal,
+            "tax_total": cart.tax_total,
+            "grand_total": cart.grand_total,
+        },
     )
 
 
@@ -363,6 +466,11 @@ def checkout_view(request):
         )
 
     payment_mode = request.POST.get("payment_mode", "CASH")
+    # The total the cashier confirmed after a re-quote, else the cart's own
+    try:
+        confirmed_total = Decimal(request.POST["confirmed_total"])
+    except (KeyError, InvalidOperation):
+        confirmed_total = None
 
     # --- Staff / Customer / Invoice Logic (Keep as is) ---
     try:
@@ -375,7 +483,9 @@ def checkout_view(request):
             status=500,
         )
 
-    cart = request.session.get("cart", {})
+    cart_store = get_cart_store()
+    cart = cart_store.load(get_cart_key(request))
+    quoted_version = cart.version
     if not cart:
         return render(
             request,
@@ -398,11 +508,33 @@ def checkout_view(request):
             )
 
     try:
-        invoice = create_invoice(
-            user=staff,
-            cart_items=cart,
-            customer=customer,
-            payment_method=payment_mode,
+        if settings.POS_CHECKOUT_MODE == "journal":
+            # Posted later by the journal committer; answer with the
+            # provisional invoice now
+            invoice, items = journal_checkout(
+                user=staff,
+                cart_items=cart.checkout_items(),
+                customer=customer,
+                payment_method=payment_mode,
+                expected_total=confirmed_total or cart.grand_total,
+            )
+        else:
+            invoice, items = create_invoice(
+                user=staff,
+                cart_items=cart.checkout_items(),
+                customer=customer,
+                payment_method=payment_mode,
+                expected_total=confirmed_total or cart.grand_total,
+            )
+    except PriceChanged as changed:
+        return render(
+            request,
+            "billing/partials/invoice/price_changed_popup.html",
+            {
+                "message": changed.messages[0],
+                "grand_total": changed.grand_total,
+                "payment_mode": payment_mode,
+            },
         )
     except ValidationError as ve:
         return render(
@@ -422,60 +554,73 @@ def checkout_view(request):
 
     # --- Success Handling ---
 
-    # 1. Clear Session
-    request.session["cart"] = {}
-    request.session.modified = True
+    # 1. Clear the Cart, unless it was changed while the sale was posted: the
+    # newer lines weren't sold, so they stay
+    try:
+        cart = cart_store.mutate(cart.key, Cart.clear, expected_version=quoted_version)
+    except CartConflict as conflict:
+        cart = conflict.cart
 
     # 2. Prepare Main Response (The Popup)
-    items = InvoiceItem.objects.filter(invoice=invoice)
     popup_html = render_to_string(
         "billing/partials/invoice/invoice_popup.html",
         {"invoice": invoice, "items": items, "payment_mode": payment_mode},
         request=request,
     )
 
-    # 3. Prepare OOB Update: Clear the Cart List in the background
+    # 3. Prepare OOB Update: Clear the Cart List and Summary in the background
     empty_cart_html = render_to_string(
-        "billing/partials/cart_area.html", {"cart": {}}, request=request
+        "billing/partials/cart_area.html", {"cart": cart, "oob": True}, request=request
+    )
+    cart_oob_html = render_to_string(
+        "billing/partials/cart_oob.html", {"cart": cart}, request=request
     )
-    empty_cart_oob = f'<div id="cart-area" hx-swap-oob="true">{empty_cart_html}</div>'
 
     # 4. Construct Response
-    response = HttpResponse(popup_html + empty_cart_oob)
-
-    # 5. Trigger 'update-summary' so the sidebar totals drop to 0.00
-    response["HX-Trigger"] = "update-summary"
-
-    return response
+    response = HttpResponse(popup_html + empty_cart_html + cart_oob_html)
+    return remember_cart_key(response, cart.key)
 
 
 def print_invoice_view(request, invoice_id):
     invoice = get_object_or_404(Invoice, id=invoice_id)
-    items = InvoiceItem.objects.filter(invoice=invoice).select_related(
-        "medicine", "batch"
+    document = get_invoice_document(invoice)
+    if request.GET.get("format") == "text":
+        return HttpResponse(
+            document_content(document, "text"), content_type="text/plain; charset=utf-8"
+        )
+    return HttpResponse(document_content(document))
+
+
+# Every invoice of a date range as one zip of stored documents, streamed
+def reprint_invoices_view(request):
+    try:
+        date_from = date.fromisoformat(request.GET.get("from", ""))
+        date_to = date.fromisoformat(request.GET.get("to", ""))
+    except ValueError:
+        return HttpResponse("Give from and to dates as YYYY-MM-DD.", status=400)
+    fmt = request.GET.get("format", "html")
+    if fmt not in FORMATS:
+        return HttpResponse("Format must be html or text.", status=400)
+
+    invoices = invoices_between(date_from, date_to).order_by("invoice_number")
+    response = StreamingHttpResponse(
+        stream_zip(iter_invoice_documents(invoices, fmt)),
+        content_type="application/zip",
     )
-    return render(
-        request,
-        "billing/print_invoice.html",
-        {
-            "invoice": invoice,
-            "items": items,
-        },
+    response["Content-Disposition"] = (
+        f'attachment; filename="invoices-{date_from}-{date_to}-{fmt}.zip"'
     )
+    return response
 
 
 # views.py
 
 
 def clear_cart(request):
-    # 1. Empty the cart in session
-    request.session["cart"] = {}
-    request.session.modified = True
-
-    # 2. Reset totals (optional, but good practice)
-    # recalculate_totals(request, {}) # If you use this helper
-
-    # 3. Trigger the summary to update (to show 0.00)
-    response = render(request, "billing/partials/cart_area.html", {"cart": {}})
-    response["HX-Trigger"] = "update-summary"
-    return response
+    try:
+        cart, _ = mutate_cart(request, Cart.clear)
+    except CartConflict as conflict:
+        cart = conflict.cart
+    except ValueError:
+        return HttpResponseBadRequest("Invalid cart version")
+    return render_cart(request, cart)
@@ -1,3 +1,17 @@
-from django.test import TestCase
+from pharmacy_project.query_plans import QueryPlanTestCase, make_sample_stock
 
-# Create your tests here.
+
+class HotQueryPlanTests(QueryPlanTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        make_sample_stock()
+
+    def test_customer_list(self):
+        # The list shows every customer; their invoices must come by index
+        self.assertNoFullScans(
+            lambda: self.client.get("/customers"), allow=["billing_customer"]
+        )
+        self.assertNoFullScans(
+            lambda: self.client.get("/customers", {"search": "asha"}),
+            allow=["billing_customer"],
+        )
@@ -1,3 +1,12 @@
-from django.test import TestCase
+from pharmacy_project.query_plans import QueryPlanTestCase, make_sample_stock
 
-# Create your tests here.
+
+class HotQueryPlanTests(QueryPlanTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        make_sample_stock()
+
+    def test_dashboard(self):
+        response = self.assertNoFullScans(lambda: self.client.get("/"))
+        self.assertEqual(response.context["invoices_today_count"], 1)
+        self.assertEqual(response.context["expired_items_count"], 1)
@@ -1,26 +1,43 @@
 from django.shortcuts import render
 from django.utils import timezone
 from billing.models import Invoice
-from medicines.models import Batch
+from inventory.models import StockAlert
+from inventory.stock import refresh_expired_stock
+from reports.models import DailySales
+from reports.rollups import rollup_between
 from django.db.models import Sum, Count
 from datetime import timedelta
 
 
 # Create your views here.
 def dashboard(request):
-    now = timezone.now()
-    sales_data = Invoice.objects.filter(created_at__date=now.date()).aggregate(
-        total=Sum("grand_total"), count=Count("id")
-    )
-    sales_today = sales_data["total"] or 0
-    invoices_today_count = sales_data["count"] or 0
-    low_stock_items = Batch.objects.filter(current_quantity__lt=10)
-    expired_items = Batch.objects.filter(
-        expiration_date__lt=now.date(), current_quantity__gt=0
+    now = timezone.localtime()
+    # One read of the daily rollup covers today's cards and the 7-day chart
+    daily = {
+        row["day"]: row
+        for row in rollup_between(
+            DailySales, now.date() - timedelta(days=6), now.date()
+        )
+        .values("day")
+        .annotate(total=Sum("total_amount"), count=Sum("invoices"))
+        .order_by()
+    }
+    sales_data = daily.get(now.date(), {})
+    sales_today = sales_data.get("total") or 0
+    invoices_today_count = sales_data.get("count") or 0
+    # Alert counts and top entries come from the precomputed snapshot
+    refresh_expired_stock()
+    alert_counts = dict(
+        StockAlert.objects.for_store().values_list("kind").annotate(count=Count("id"))
     )
-    low_stock_list = low_stock_items.order_by("current_quantity")[:3]
-    expired_list = expired_items.order_by("expiration_date")[:3]
-    recent_invoices = Invoice.objects.all().order_by("-created_at")[:5]
+    alerts = StockAlert.objects.for_store().select_related("medicine", "batch")
+    low_stock_list = alerts.filter(kind=StockAlert.LOW_STOCK).order_by(
+        "quantity", "id"
+    )[:3]
+    expired_list = alerts.filter(kind=StockAlert.EXPIRED).order_by(
+        "expiration_date", "id"
+    )[:3]
+    recent_invoices = Invoice.objects.for_store().order_by("-created_at")[:5]
     dates = []
     revenues = []
     # Loop 7 times (from 6 days ago up to today)
@@ -28,12 +45,7 @@ def dashboard(request):
         target_date = now.date() - timedelta(days=i)
 
         # Get sales for that specific day
-        day_sales = (
-            Invoice.objects.filter(created_at__date=target_date).aggregate(
-                total=Sum("grand_total")
-            )["total"]
-            or 0
-        )
+        day_sales = daily.get(target_date, {}).get("total") or 0
 
         # Add to our lists
         dates.append(target_date.strftime("%d/%m"))  # Format as "30/01"
@@ -41,8 +53,9 @@ def dashboard(request):
     context = {
         "sales_today": sales_today,
         "invoices_today_count": invoices_today_count,
-        "low_stock_items_count": low_stock_items.count(),
-        "expired_items_count": expired_items.count(),
+        "low_stock_items_count": alert_counts.get(StockAlert.LOW_STOCK, 0),
+        "expired_items_count": alert_counts.get(StockAlert.EXPIRED, 0),
+        "expiring_30_count": alert_counts.get(StockAlert.EXPIRING_30, 0),
         "low_stock_list": low_stock_list,
         "expired_list": expired_list,
         "chart_dates": dates,
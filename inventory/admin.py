@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Action, StockMovement
+from .models import Action, StockMovement, StockMovementArchive, StockTransfer
 # Register your models here.
 
 
@@ -11,3 +11,38 @@ class ActionAdmin(admin.ModelAdmin):
 @admin.register(StockMovement)
 class StockMovementAdmin(admin.ModelAdmin):
     list_display = ("created_on", "medicine", "batch", "action")
+    list_select_related = ("medicine", "batch", "action")
+    # Counting every row on each page load is the slow part of the changelist
+    show_full_result_count = False
+
+
+# Closed months, read-only: the archive is written by archive_stock_movements
+@admin.register(StockMovementArchive)
+class StockMovementArchiveAdmin(admin.ModelAdmin):
+    list_display = ("created_on", "medicine", "batch", "action", "quantity")
+    list_select_related = ("medicine", "batch", "action")
+    list_filter = ("month",)
+    show_full_result_count = False
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+
+# Written by inventory.stores.transfer_stock with their ledger rows
+@admin.register(StockTransfer)
+class StockTransferAdmin(admin.ModelAdmin):
+    list_display = ("created_on", "medicine", "from_store", "to_store", "quantity")
+    list_select_related = ("medicine", "from_store", "to_store")
+    list_filter = ("from_store", "to_store")
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
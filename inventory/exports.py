@@ -0,0 +1,156 @@
+from django.utils import timezone
+
+from billing.models import Invoice
+from medicines.models import Batch
+
+from .ledger import movements_between
+from .models import Action
+
+CHUNK_SIZE = 2000  # rows per query of a streamed export
+
+MEDICINE_COLUMNS = [
+    "medicine_id",
+    "name",
+    "strength",
+    "brand",
+    "category",
+    "pack_type",
+    "pack_size",
+    "hsn_code",
+    "gst_percent",
+    "is_active",
+    "sellable_stock",
+]
+BATCH_COLUMNS = [
+    "batch_id",
+    "medicine",
+    "brand",
+    "batch_number",
+    "supplier",
+    "expiration_date",
+    "is_active",
+    "current_quantity",
+    "purchase_price",
+    "sale_price",
+    "stock_value",
+]
+REORDER_COLUMNS = [
+    "medicine_id",
+    "medicine",
+    "supplier",
+    "sellable_quantity",
+    "average_daily_demand",
+    "forecast_daily_demand",
+    "days_of_cover",
+    "lead_time_days",
+    "suggested_quantity",
+]
+LEDGER_COLUMNS = [
+    "movement_id",
+    "created_on",
+    "medicine",
+    "batch_number",
+    "action",
+    "quantity",
+    "invoice_number",
+]
+
+
+def _name(related):
+    return related.name if related else ""
+
+
+def medicine_row(medicine):
+    return [
+        medicine.id,
+        medicine.name,
+        medicine.strength,
+        _name(medicine.brand),
+        _name(medicine.category),
+        _name(medicine.pack_type),
+        medicine.pack_size,
+        medicine.hsn_code,
+        medicine.gst_percent,
+        medicine.is_active,
+        medicine.total_stock,
+    ]
+
+
+def batch_row(batch):
+    return [
+        batch.id,
+        batch.medicine.name,
+        _name(batch.medicine.brand),
+        batch.batch_number,
+        _name(batch.supplier),
+        batch.expiration_date,
+        batch.is_active,
+        batch.current_quantity,
+        batch.purchase_price,
+        batch.sale_price,
+        batch.purchase_price * batch.current_quantity,
+    ]
+
+
+def reorder_row(suggestion):
+    return [
+        suggestion.medicine_id,
+        suggestion.medicine.name,
+        _name(suggestion.supplier),
+        suggestion.sellable_quantity,
+        suggestion.average_daily_demand,
+        suggestion.forecast_daily_demand,
+        suggestion.days_of_cover,
+        suggestion.lead_time_days,
+        suggestion.suggested_quantity,
+    ]
+
+
+# Header and row function of each inventory tab's export
+EXPORTS = {
+    "medicines": (MEDICINE_COLUMNS, medicine_row),
+    "batches": (BATCH_COLUMNS, batch_row),
+    "alerts": (BATCH_COLUMNS, batch_row),
+    "reorder": (REORDER_COLUMNS, reorder_row),
+}
+
+
+def ledger_rows(start=None, end=None, chunk_size=CHUNK_SIZE, **filters):
+    """
+    Export rows of movements_between(start, end, **filters), archive
+    included, read `chunk_size` movements at a time with the batch,
+    action and invoice names of each chunk looked up in bulk.
+    """
+    actions = dict(Action.objects.values_list("id", "name"))
+    after = None
+    while True:
+        chunk = list(movements_between(start, end, after=after, **filters)[:chunk_size])
+        if not chunk:
+            return
+        batches = (
+            Batch.objects.select_related("medicine")
+            .only("batch_number", "medicine__name")
+            .in_bulk({movement["batch_id"] for movement in chunk})
+        )
+        invoice_ids = {movement["invoice_number_id"] for movement in chunk} - {None}
+        invoices = dict(
+            Invoice.objects.filter(id__in=invoice_ids).values_list(
+                "id", "invoice_number"
+            )
+        )
+        for movement in chunk:
+            batch = batches[movement["batch_id"]]
+            yield [
+                movement["id"],
+                timezone.localtime(movement["created_on"]).isoformat(
+                    timespec="seconds"
+                ),
+                batch.medicine.name,
+                batch.batch_number,
+                actions[movement["action_id"]],
+                movement["quantity"],
+                invoices.get(movement["invoice_number_id"], ""),
+            ]
+        if len(chunk) < chunk_size:
+            return
+        after = (chunk[-1]["created_on"], chunk[-1]["id"])
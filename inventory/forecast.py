@@ -0,0 +1,224 @@
+import time
+from datetime import timedelta
+
+import numpy as np
+from django.db import transaction
+from django.db.models import Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from billing.models import InvoiceItem
+from billing.services import invoices_between
+from medicines.models import Batch, Medicine
+
+from .models import MedicineStock, ReorderSuggestion
+
+RECENT_DAYS = 28  # moving-average window
+HISTORY_WEEKS = 108  # two years, plus the weeks seasonality compares against
+SEASON_WEEKS = 4  # how far ahead the seasonal factor looks
+SEASON_PRIOR = 4.0  # units added to both sides of the seasonal ratio to damp noise
+SEASON_LIMITS = (0.5, 2.0)
+REVIEW_DAYS = 14  # stock to hold beyond the lead time, until the next order
+SAFETY_Z = 1.65  # safety stock for about a 95% service level
+DEFAULT_LEAD_TIME = 7  # days, for medicines never bought from a supplier
+
+
+def daily_sales(medicine_ids, today):
+    """
+    Units sold per medicine per day over the history window, from one
+    grouped query, as three columns: row index into the sorted
+    `medicine_ids`, days before today (1 = yesterday), quantity.
+    """
+    start = today - timedelta(weeks=HISTORY_WEEKS)
+    rows = list(
+        InvoiceItem.objects.filter(
+            invoice__in=invoices_between(start, today - timedelta(days=1))
+        )
+        .annotate(day=TruncDate("invoice__created_at"))
+        .values("medicine_id", "day")
+        .annotate(quantity=Sum("quantity"))
+        .values_list("medicine_id", "day", "quantity")
+        .order_by()
+    )
+    if not rows:
+        empty = np.zeros(0, dtype=np.int64)
+        return empty, empty, np.zeros(0)
+    medicines, days, quantities = zip(*rows)
+    medicines = np.fromiter(medicines, dtype=np.int64, count=len(rows))
+    days_ago = (
+        np.datetime64(today, "D") - np.array(days, dtype="datetime64[D]")
+    ).astype(np.int64)
+    quantities = np.fromiter(quantities, dtype=np.float64, count=len(rows))
+
+    # Sales of medicines no longer active are left out
+    index = np.searchsorted(medicine_ids, medicines)
+    known = index < len(medicine_ids)
+    known[known] = medicine_ids[index[known]] == medicines[known]
+    return index[known], days_ago[known], quantities[known]
+
+
+def _latest_suppliers(medicine_ids):
+    # Supplier and lead time of each medicine's most recent batch
+    rows = np.array(
+        Batch.objects.for_store()
+        .order_by("medicine_id", "id")
+        .values_list("medicine_id", "supplier_id", "supplier__lead_time_days"),
+        dtype=np.int64,
+    ).reshape(-1, 3)
+    suppliers = np.zeros(len(medicine_ids), dtype=np.int64)
+    lead_times = np.full(len(medicine_ids), DEFAULT_LEAD_TIME, dtype=np.int64)
+    if len(rows):
+        last = np.r_[rows[1:, 0] != rows[:-1, 0], True]
+        rows = rows[last]
+        index = np.searchsorted(medicine_ids, rows[:, 0])
+        known = index < len(medicine_ids)
+        known[known] = medicine_ids[index[known]] == rows[known, 0]
+        suppliers[index[known]] = rows[known, 1]
+        lead_times[index[known]] = rows[known, 2]
+    return suppliers, lead_times
+
+
+def _sellable(medicine_ids):
+    rows = np.array(
+        MedicineStock.objects.for_store().values_list(
+            "medicine_id", "sellable_quantity"
+        ),
+        dtype=np.int64,
+    ).reshape(-1, 2)
+    sellable = np.zeros(len(medicine_ids), dtype=np.int64)
+    index = np.searchsorted(medicine_ids, rows[:, 0])
+    known = index < len(medicine_ids)
+    known[known] = medicine_ids[index[known]] == rows[known, 0]
+    sellable[index[known]] = rows[known, 1]
+    return sellable
+
+
+def forecast(count, index, days_ago, quantities, lead_times, sellable):
+    """
+    Demand forecast and order quantities for `count` medicines at once.
+    `index`, `days_ago` and `quantities` are daily_sales() columns;
+    `lead_times` and `sellable` are per-medicine arrays.
+
+    The recent demand is the moving average of the last RECENT_DAYS days.
+    It is scaled by a seasonal factor: how sales in the coming
+    SEASON_WEEKS weeks compared with the weeks before them, a year and two
+    years ago, in the years the medicine was selling through those weeks
+    before (1 otherwise). Enough stock is suggested to cover the lead time
+    and the review period, plus safety stock for the day-to-day variation.
+    """
+    offset = days_ago - 1  # 0 = yesterday
+    recent = offset < RECENT_DAYS
+    daily = np.bincount(
+        index[recent] * RECENT_DAYS + offset[recent],
+        weights=quantities[recent],
+        minlength=count * RECENT_DAYS,
+    ).reshape(count, RECENT_DAYS)
+    average = daily.mean(axis=1)
+    spread = daily.std(axis=1)
+
+    # Week 0 is the last seven days; week 51 - k, a year ago, lines up with
+    # the k-th week ahead
+    weeks = offset // 7
+    in_window = weeks < HISTORY_WEEKS
+    weekly = np.bincount(
+        index[in_window] * HISTORY_WEEKS + weeks[in_window],
+        weights=quantities[in_window],
+        minlength=count * HISTORY_WEEKS,
+    ).reshape(count, HISTORY_WEEKS)
+    ahead = np.zeros(count)
+    before = np.zeros(count)
+    # The week of each medicine's oldest sale in the history
+    oldest = np.full(count, -1)
+    np.maximum.at(oldest, index[in_window], weeks[in_window])
+    for year_end in (52, 104):
+        year_ahead = weekly[:, year_end - SEASON_WEEKS : year_end].sum(axis=1)
+        year_before = weekly[:, year_end : year_end + SEASON_WEEKS].sum(axis=1)
+        # Only the years a medicine was already selling in, through the
+        # whole window: one launched since would read its first sales as a
+        # seasonal rise
+        selling = (oldest >= year_end + SEASON_WEEKS - 1) & (year_before > 0)
+        ahead += np.where(selling, year_ahead, 0)
+        before += np.where(selling, year_before, 0)
+    seasonal = np.clip((ahead + SEASON_PRIOR) / (before + SEASON_PRIOR), *SEASON_LIMITS)
+    expected = average * seasonal
+
+    demand = expected * (lead_times + REVIEW_DAYS)
+    safety = SAFETY_Z * spread * np.sqrt(lead_times)
+    suggested = np.maximum(np.ceil(demand + safety - sellable), 0).astype(np.int64)
+    with np.errstate(divide="ignore"):
+        cover = np.where(
+            expected > 0, sellable / np.where(expected > 0, expected, 1), np.inf
+        )
+    return {
+        "average": average,
+        "expected": expected,
+        "suggested": suggested,
+        "cover": cover,
+    }
+
+
+def suggest_reorders():
+    """
+    Forecast the demand of every active medicine and replace the stored
+    ReorderSuggestion rows with the ones that need ordering. Returns a
+    report: medicines, sales_rows, suggestions and seconds.
+    """
+    started = time.perf_counter()
+    today = timezone.localdate()
+    medicine_ids = np.array(
+        Medicine.objects.filter(is_active=True)
+        .order_by("id")
+        .values_list("id", flat=True),
+        dtype=np.int64,
+    )
+    index, days_ago, quantities = daily_sales(medicine_ids, today)
+    suppliers, lead_times = _latest_suppliers(medicine_ids)
+    sellable = _sellable(medicine_ids)
+    result = forecast(
+        len(medicine_ids), index, days_ago, quantities, lead_times, sellable
+    )
+
+    now = timezone.now()
+    selected = np.flatnonzero(result["suggested"] > 0)
+    columns = zip(
+        medicine_ids[selected].tolist(),
+        suppliers[selected].tolist(),
+        result["average"][selected].round(3).tolist(),
+        result["expected"][selected].round(3).tolist(),
+        sellable[selected].tolist(),
+        lead_times[selected].tolist(),
+        result["cover"][selected].round(1).tolist(),
+        result["suggested"][selected].tolist(),
+    )
+    suggestions = [
+        ReorderSuggestion(
+            medicine_id=medicine_id,
+            supplier_id=supplier_id or None,
+            average_daily_demand=average,
+            forecast_daily_demand=expected,
+            sellable_quantity=stock,
+            lead_time_days=lead_time,
+            days_of_cover=cover,
+            suggested_quantity=suggested,
+            computed_at=now,
+        )
+        for (
+            medicine_id,
+            supplier_id,
+            average,
+            expected,
+            stock,
+            lead_time,
+            cover,
+            suggested,
+        ) in columns
+    ]
+    with transaction.atomic():
+        ReorderSuggestion.objects.for_store().delete()
+        ReorderSuggestion.objects.bulk_create(suggestions, batch_size=1000)
+    return {
+        "medicines": len(medicine_ids),
+        "sales_rows": len(index),
+        "suggestions": len(suggestions),
+        "seconds": time.perf_counter() - started,
+    }
@@ -0,0 +1,207 @@
+import time
+from datetime import datetime, timedelta
+
+from django.db import transaction
+from django.db.models import Max, Q, Sum
+from django.utils import timezone
+
+from medicines.models import Batch
+
+from .models import StockMovement, StockMovementArchive
+from .services import get_action
+
+# Action of the rows that carry a batch's archived balance into the live table
+OPENING = "Opening"
+CHUNK_SIZE = 200  # batches per archive transaction
+
+LEDGER_FIELDS = [
+    "id",
+    "medicine_id",
+    "batch_id",
+    "action_id",
+    "quantity",
+    "invoice_number_id",
+    "created_on",
+    "store_id",
+]
+
+
+def month_start(day):
+    return day.replace(day=1)
+
+
+def next_month(day):
+    return (month_start(day) + timedelta(days=32)).replace(day=1)
+
+
+def start_of_day(day):
+    return timezone.make_aware(datetime.combine(day, datetime.min.time()))
+
+
+def archived_until():
+    """
+    Start of the live period: every movement before it is in the archive.
+    None when nothing has been archived.
+    """
+    last_month = StockMovementArchive.objects.aggregate(last=Max("month"))["last"]
+    return start_of_day(next_month(last_month)) if last_month else None
+
+
+def _archive_batches(batches, cutoff, opening):
+    # One short transaction per chunk of (batch id, store id): a batch's
+    # archived movements and the opening row that replaces them commit
+    # together, so its live ledger keeps adding up to its stock at every
+    # point in between
+    with transaction.atomic():
+        movements = list(
+            StockMovement.objects.filter(
+                store_id__in={store_id for _, store_id in batches},
+                batch_id__in=[batch_id for batch_id, _ in batches],
+                created_on__lt=cutoff,
+            ).values(*LEDGER_FIELDS)
+        )
+        if not movements:
+            return 0
+        balances = {}
+        archive = []
+        for movement in movements:
+            batch_id = movement["batch_id"]
+            balance = balances.setdefault(
+                batch_id, [movement["medicine_id"], movement["store_id"], 0]
+            )
+            balance[2] += movement["quantity"]
+            # An earlier opening row only stands for movements archived before
+            if movement["action_id"] != opening.id:
+                archive.append(
+                    StockMovementArchive(
+                        month=month_start(
+                            timezone.localtime(movement["created_on"]).date()
+                        ),
+                        **movement,
+                    )
+                )
+        StockMovementArchive.objects.bulk_create(archive)
+        StockMovement.objects.filter(
+            id__in=[movement["id"] for movement in movements]
+        ).delete()
+        openings = StockMovement.objects.bulk_create(
+            StockMovement(
+                medicine_id=medicine_id,
+                batch_id=batch_id,
+                action=opening,
+                quantity=quantity,
+                store_id=store_id,
+            )
+            for batch_id, (medicine_id, store_id, quantity) in balances.items()
+            if quantity
+        )
+        # Dated at the start of the live period, ahead of everything in it
+        for movement in openings:
+            movement.created_on = cutoff
+        StockMovement.objects.bulk_update(openings, ["created_on"])
+    return len(archive)
+
+
+def archive_closed_months(before=None, chunk_size=CHUNK_SIZE):
+    """
+    Move every movement dated before the month of `before` (default: today,
+    so all closed months) into StockMovementArchive. Each batch with a
+    non-zero archived balance gets one Opening movement at the cutoff, so
+    reconciliation and balances read from the live table stay correct.
+    Batches are processed `chunk_size` at a time, each chunk in its own
+    short transaction, so checkouts are never held up for long.
+
+    Returns a report: cutoff, batches, archived and seconds.
+    """
+    started = time.perf_counter()
+    cutoff = start_of_day(month_start(before or timezone.localdate()))
+    opening = get_action(OPENING)
+    result = {"cutoff": cutoff, "batches": 0, "archived": 0}
+    last_id = 0
+    while True:
+        batches = list(
+            Batch.objects.filter(id__gt=last_id)
+            .order_by("id")
+            .values_list("id", "store_id")[:chunk_size]
+        )
+        if not batches:
+            break
+        last_id = batches[-1][0]
+        result["archived"] += _archive_batches(batches, cutoff, opening)
+        result["batches"] += len(batches)
+    result["seconds"] = time.perf_counter() - started
+    return result
+
+
+def _ledger_sources(start, end, filters, after=None):
+    # The live movements and, when the range reaches back before the live
+    # period, the archived ones, both filtered to the range
+    bounds = {}
+    if start is not None:
+        bounds["created_on__gte"] = start
+    if end is not None:
+        bounds["created_on__lt"] = end
+    sources = [
+        StockMovement.objects.filter(**bounds, **filters).exclude(
+            action=get_action(OPENING)
+        )
+    ]
+    cutoff = archived_until()
+    if cutoff is not None and (start is None or start < cutoff):
+        # The live side stays in even for ranges that end before the cutoff:
+        # a sale posted late from the checkout journal can land there until
+        # the next rollover
+        archived = StockMovementArchive.objects.filter(**bounds, **filters)
+        if start is not None:
+            # Only the monthly slices the range touches
+            archived = archived.filter(
+                month__gte=month_start(timezone.localtime(start).date())
+            )
+        sources.append(archived)
+    if after is not None:
+        # Keyset cursor: only the rows past (created_on, id), per side so
+        # each stays an index range read
+        created_on, last_id = after
+        sources = [
+            source.filter(
+                Q(created_on__gt=created_on) | Q(id__gt=last_id),
+                created_on__gte=created_on,
+            )
+            for source in sources
+        ]
+    return sources
+
+
+def movements_between(start=None, end=None, after=None, **filters):
+    """
+    values() rows of every movement with start <= created_on < end (open
+    ended when None) and `filters`, in ledger order. Ranges reaching back
+    before the live period read the archive too, through a UNION ALL; the
+    opening rows are left out, as the movements they stand for are there.
+    `after`, the (created_on, id) of the last row already read, continues
+    from there.
+    """
+    live, *archived = (
+        source.values(*LEDGER_FIELDS)
+        for source in _ledger_sources(start, end, filters, after)
+    )
+    if archived:
+        live = live.union(*archived, all=True)
+    return live.order_by("created_on", "id")
+
+
+def movement_totals(start=None, end=None, **filters):
+    """
+    {batch_id: net quantity} of the movements movements_between() would
+    return, summed per batch by the database on each side of the union.
+    """
+    totals = {}
+    for source in _ledger_sources(start, end, filters):
+        for batch_id, quantity in (
+            source.order_by()
+            .values("batch_id")
+            .annotate(total=Sum("quantity"))
+            .values_list("batch_id", "total")
+        ):
+            totals[batch_id] = totals.get(batch_id, 0) + quantity
+    return totals
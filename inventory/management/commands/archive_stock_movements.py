@@ -0,0 +1,41 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+
+from inventory.ledger import CHUNK_SIZE, archive_closed_months
+
+
+class Command(BaseCommand):
+    help = (
+        "Move the stock movements of closed months into the archive table, "
+        "leaving an opening-balance movement per batch. Run it monthly."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--before",
+            help="Archive the months before this date's month (YYYY-MM-DD). "
+            "Defaults to today, archiving every closed month.",
+        )
+        parser.add_argument(
+            "--chunk-size",
+            type=int,
+            default=CHUNK_SIZE,
+            help="Batches per transaction.",
+        )
+
+    def handle(self, *args, **options):
+        before = None
+        if options["before"]:
+            try:
+                before = date.fromisoformat(options["before"])
+            except ValueError:
+                raise CommandError("--before must be YYYY-MM-DD")
+        report = archive_closed_months(before, chunk_size=options["chunk_size"])
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Archived {report['archived']} movements of {report['batches']} "
+                f"batches before {report['cutoff']:%Y-%m-%d} in "
+                f"{report['seconds']:.2f}s"
+            )
+        )
@@ -0,0 +1,43 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from inventory.receipts import read_delivery, receive_goods
+from medicines.models import Supplier
+
+
+class Command(BaseCommand):
+    help = (
+        "Receive a supplier delivery file (CSV or JSON) as new batches with "
+        "Purchase stock movements, and report every line that failed."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="Delivery file (.csv, .json, .jsonl).")
+        parser.add_argument("--supplier", type=int, required=True, help="Supplier id.")
+        parser.add_argument(
+            "--partial",
+            action="store_true",
+            help="Receive the valid lines even when some lines fail.",
+        )
+
+    def handle(self, *args, **options):
+        supplier = Supplier.objects.filter(id=options["supplier"]).first()
+        if supplier is None:
+            raise CommandError(f"No supplier with id {options['supplier']}.")
+
+        with open(options["path"], "rb") as delivery:
+            report = receive_goods(
+                read_delivery(delivery, options["path"]),
+                supplier,
+                accept_partial=options["partial"],
+            )
+
+        for line, error in report["errors"]:
+            self.stderr.write(f"line {line or '-'}: {error}")
+        summary = (
+            f"{report['lines']} lines, {report['received']} batches received in "
+            f"{report['seconds']:.2f}s ({report['lines_per_second']:.0f} lines/s)"
+        )
+        if report["saved"]:
+            self.stdout.write(self.style.SUCCESS(summary))
+        else:
+            raise CommandError(f"{summary}. Nothing was saved.")
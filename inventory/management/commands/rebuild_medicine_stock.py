@@ -0,0 +1,20 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from inventory.stock import rebuild_medicine_stock
+
+
+class Command(BaseCommand):
+    help = "Recompute the stock summary of every medicine from its batches."
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        with transaction.atomic():
+            count = rebuild_medicine_stock()
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Summarised {count} medicines in {time.perf_counter() - started:.2f}s"
+            )
+        )
@@ -0,0 +1,50 @@
+from django.core.management.base import BaseCommand
+
+from inventory.reconcile import CHUNK_SIZE, reconcile_stock
+
+
+class Command(BaseCommand):
+    help = (
+        "Check that every batch's stock movements add up to its current "
+        "quantity, and optionally write Adjustment movements for the drift."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=1,
+            help="Processes to split the medicine-id ranges across.",
+        )
+        parser.add_argument(
+            "--fix",
+            action="store_true",
+            help="Write an Adjustment movement for every drifted batch.",
+        )
+        parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE)
+        parser.add_argument(
+            "--limit", type=int, default=50, help="Drifted batches to list."
+        )
+
+    def handle(self, *args, **options):
+        report = reconcile_stock(
+            workers=options["workers"],
+            fix=options["fix"],
+            chunk_size=options["chunk_size"],
+        )
+        for batch_id, medicine_id, ledger, on_hand in report["drift"][
+            : options["limit"]
+        ]:
+            self.stdout.write(
+                f"batch {batch_id} (medicine {medicine_id}): ledger {ledger}, "
+                f"on hand {on_hand}, drift {on_hand - ledger:+d}"
+            )
+        summary = (
+            f"{report['batches']} batches in {report['ranges']} ranges, "
+            f"{len(report['drift'])} drifted, {report['adjusted']} adjusted "
+            f"in {report['seconds']:.2f}s"
+        )
+        if report["drift"] and not report["adjusted"]:
+            self.stdout.write(self.style.WARNING(summary))
+        else:
+            self.stdout.write(self.style.SUCCESS(summary))
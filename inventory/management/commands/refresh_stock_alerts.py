@@ -0,0 +1,40 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from inventory.models import StockAlert
+from inventory.stock import refresh_stock_alerts, roll_over_stock
+
+
+class Command(BaseCommand):
+    help = (
+        "Roll the stock summary and alert snapshot over to today. Run it "
+        "daily, shortly after midnight."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--full",
+            action="store_true",
+            help="Recompute the alerts of every medicine, not only those a "
+            "new day can change.",
+        )
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        with transaction.atomic():
+            if options["full"]:
+                roll_over_stock(timezone.localdate())
+                refresh_stock_alerts()
+                message = "Recomputed every alert"
+            else:
+                count = roll_over_stock(timezone.localdate())
+                message = f"Rolled over {count} medicines"
+        alerts = StockAlert.objects.for_store().count()
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"{message}: {alerts} alerts in {time.perf_counter() - started:.2f}s"
+            )
+        )
@@ -0,0 +1,32 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+
+from inventory.snapshots import take_stock_snapshot
+
+
+class Command(BaseCommand):
+    help = (
+        "Store the closing stock of every batch for a day, the base that "
+        "stock-as-of-date queries start from. Run it daily after midnight."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--day", help="Day to snapshot (YYYY-MM-DD). Defaults to yesterday."
+        )
+
+    def handle(self, *args, **options):
+        day = None
+        if options["day"]:
+            try:
+                day = date.fromisoformat(options["day"])
+            except ValueError:
+                raise CommandError("--day must be YYYY-MM-DD")
+        report = take_stock_snapshot(day)
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Snapshot of {report['day']:%Y-%m-%d}: {report['batches']} batches "
+                f"in {report['seconds']:.2f}s"
+            )
+        )
@@ -0,0 +1,35 @@
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+
+from inventory.stores import transfer_stock
+from medicines.models import Batch, Store
+
+
+class Command(BaseCommand):
+    help = (
+        "Move stock of a batch to another store, writing the paired ledger "
+        "entries. Both stores must share this database."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("batch_id", type=int)
+        parser.add_argument("store", help="Code of the receiving store.")
+        parser.add_argument("quantity", type=int)
+
+    def handle(self, *args, **options):
+        batch = Batch.objects.filter(pk=options["batch_id"]).first()
+        store = Store.objects.filter(code=options["store"]).first()
+        if batch is None:
+            raise CommandError(f"No batch {options['batch_id']}.")
+        if store is None:
+            raise CommandError(f"No store {options['store']}.")
+        try:
+            transfer = transfer_stock(batch, store, options["quantity"])
+        except ValidationError as error:
+            raise CommandError(" ".join(error.messages))
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Moved {transfer.quantity} of {batch.batch_number} to {store.name} "
+                f"(batch {transfer.destination_batch_id})."
+            )
+        )
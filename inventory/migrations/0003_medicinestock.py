@@ -0,0 +1,85 @@
+# Generated by Django 5.2.10 on 2026-10-17 23:05
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Min, Q, Sum
+from django.utils import timezone
+
+
+def summarise_stock(apps, schema_editor):
+    Batch = apps.get_model("medicines", "Batch")
+    Medicine = apps.get_model("medicines", "Medicine")
+    MedicineStock = apps.get_model("inventory", "MedicineStock")
+    today = timezone.localdate()
+    sellable = Q(is_active=True, current_quantity__gt=0, expiration_date__gte=today)
+    expired = Q(is_active=True, current_quantity__gt=0, expiration_date__lt=today)
+
+    totals = {
+        row["medicine_id"]: row
+        for row in Batch.objects.values("medicine_id").annotate(
+            sellable=Sum("current_quantity", filter=sellable),
+            expired=Sum("current_quantity", filter=expired),
+            earliest=Min("expiration_date", filter=sellable),
+        )
+    }
+    fefo = {}
+    for medicine_id, batch_id in (
+        Batch.objects.filter(sellable)
+        .order_by("medicine_id", "expiration_date", "id")
+        .values_list("medicine_id", "id")
+    ):
+        fefo.setdefault(medicine_id, batch_id)
+
+    rows = []
+    for medicine_id in Medicine.objects.values_list("id", flat=True):
+        row = totals.get(medicine_id, {})
+        rows.append(
+            MedicineStock(
+                medicine_id=medicine_id,
+                sellable_quantity=row.get("sellable") or 0,
+                expired_quantity=row.get("expired") or 0,
+                earliest_expiry=row.get("earliest"),
+                fefo_batch_id=fefo.get(medicine_id),
+            )
+        )
+    MedicineStock.objects.bulk_create(rows, batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("inventory", "0002_alter_stockmovement_invoice_number"),
+        ("medicines", "0003_medicine_search_index"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="MedicineStock",
+            fields=[
+                (
+                    "medicine",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        primary_key=True,
+                        related_name="stock",
+                        serialize=False,
+                        to="medicines.medicine",
+                    ),
+                ),
+                ("sellable_quantity", models.PositiveIntegerField(default=0)),
+                ("expired_quantity", models.PositiveIntegerField(default=0)),
+                ("earliest_expiry", models.DateField(blank=True, null=True)),
+                (
+                    "fefo_batch",
+                    models.ForeignKey(
+                        blank=True,
+                        null=True,
+                        on_delete=django.db.models.deletion.SET_NULL,
+                        related_name="fefo_of",
+                        to="medicines.batch",
+                    ),
+                ),
+            ],
+        ),
+        migrations.RunPython(summarise_stock, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,59 @@
+# Generated by Django 5.2.10 on 2026-10-17 23:10
+
+from django.db import migrations, models
+from django.db.models import F, Q
+
+
+def sign_ledger(apps, schema_editor):
+    Action = apps.get_model("inventory", "Action")
+    Batch = apps.get_model("medicines", "Batch")
+    StockMovement = apps.get_model("inventory", "StockMovement")
+
+    # Sales took stock out
+    StockMovement.objects.filter(action__name="Sale").update(quantity=-F("quantity"))
+
+    # Batches entered before purchases were recorded get one for their
+    # initial quantity, so their ledger starts where their stock did
+    purchase, _ = Action.objects.get_or_create(name="Purchase")
+    openings = []
+    created_on = []
+    for batch in Batch.objects.filter(
+        ~Q(id__in=StockMovement.objects.filter(quantity__gt=0).values("batch_id"))
+    ).iterator(chunk_size=2000):
+        openings.append(
+            StockMovement(
+                medicine_id=batch.medicine_id,
+                batch_id=batch.id,
+                action=purchase,
+                quantity=batch.initial_quantity,
+            )
+        )
+        created_on.append(batch.created_on)
+    openings = StockMovement.objects.bulk_create(openings, batch_size=2000)
+    # Dated when the batch came in, not when the ledger was signed, so the
+    # opening stock falls before the batch's sales
+    for movement, when in zip(openings, created_on):
+        movement.created_on = when
+    StockMovement.objects.bulk_update(openings, ["created_on"], batch_size=2000)
+
+
+def unsign_ledger(apps, schema_editor):
+    StockMovement = apps.get_model("inventory", "StockMovement")
+    StockMovement.objects.filter(quantity__lt=0).update(quantity=-F("quantity"))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("inventory", "0003_medicinestock"),
+        ("medicines", "0004_keyset_indexes"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="stockmovement",
+            name="quantity",
+            field=models.IntegerField(),
+        ),
+        migrations.RunPython(sign_ledger, unsign_ledger),
+    ]
@@ -0,0 +1,129 @@
+# Generated by Django 5.2.10 on 2026-10-17 23:15
+
+from datetime import timedelta
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Exists, F, OuterRef
+from django.utils import timezone
+
+
+def snapshot_alerts(apps, schema_editor):
+    Batch = apps.get_model("medicines", "Batch")
+    MedicineStock = apps.get_model("inventory", "MedicineStock")
+    StockAlert = apps.get_model("inventory", "StockAlert")
+    today = timezone.localdate()
+
+    alerts = []
+    for batch_id, medicine_id, quantity, expiration_date in Batch.objects.filter(
+        is_active=True,
+        current_quantity__gt=0,
+        expiration_date__lte=today + timedelta(days=90),
+    ).values_list("id", "medicine_id", "current_quantity", "expiration_date"):
+        days_left = (expiration_date - today).days
+        if days_left < 0:
+            kind = "expired"
+        else:
+            kind = next(
+                f"expiring_{days}" for days in (30, 60, 90) if days_left <= days
+            )
+        alerts.append(
+            StockAlert(
+                kind=kind,
+                medicine_id=medicine_id,
+                batch_id=batch_id,
+                quantity=quantity,
+                expiration_date=expiration_date,
+                computed_on=today,
+            )
+        )
+    for medicine_id, quantity, threshold in MedicineStock.objects.filter(
+        Exists(Batch.objects.filter(medicine_id=OuterRef("medicine_id"))),
+        medicine__is_active=True,
+        sellable_quantity__lt=F("medicine__reorder_threshold"),
+    ).values_list("medicine_id", "sellable_quantity", "medicine__reorder_threshold"):
+        alerts.append(
+            StockAlert(
+                kind="low_stock",
+                medicine_id=medicine_id,
+                quantity=quantity,
+                reorder_threshold=threshold,
+                computed_on=today,
+            )
+        )
+    StockAlert.objects.bulk_create(alerts, batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("inventory", "0004_signed_stock_movements"),
+        ("medicines", "0005_medicine_reorder_threshold"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="StockAlert",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "kind",
+                    models.CharField(
+                        choices=[
+                            ("expired", "Expired"),
+                            ("expiring_30", "Expiring in 30 days"),
+                            ("expiring_60", "Expiring in 31-60 days"),
+                            ("expiring_90", "Expiring in 61-90 days"),
+                            ("low_stock", "Below reorder threshold"),
+                        ],
+                        max_length=20,
+                    ),
+                ),
+                ("quantity", models.PositiveIntegerField()),
+                ("expiration_date", models.DateField(blank=True, null=True)),
+                (
+                    "reorder_threshold",
+                    models.PositiveIntegerField(blank=True, null=True),
+                ),
+                ("computed_on", models.DateField()),
+                (
+                    "batch",
+                    models.ForeignKey(
+                        blank=True,
+                        null=True,
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="stock_alerts",
+                        to="medicines.batch",
+                    ),
+                ),
+                (
+                    "medicine",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="stock_alerts",
+                        to="medicines.medicine",
+                    ),
+                ),
+            ],
+            options={
+                "indexes": [
+                    models.Index(
+                        fields=["kind", "expiration_date"],
+                        name="stockalert_kind_expiry_idx",
+                    ),
+                    models.Index(
+                        fields=["kind", "quantity"], name="stockalert_kind_quantity_idx"
+                    ),
+                ],
+            },
+        ),
+        migrations.RunPython(snapshot_alerts, migrations.RunPython.noop),
+    ]
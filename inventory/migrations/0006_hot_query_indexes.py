@@ -0,0 +1,33 @@
+# Generated by Django 5.2.10 on 2026-10-17 23:17
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("billing", "0007_invoice_created_at_idx"),
+        ("inventory", "0005_stockalert"),
+        ("medicines", "0006_batch_sellable_indexes"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="medicinestock",
+            index=models.Index(
+                fields=["earliest_expiry"], name="stock_earliest_expiry_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="stockalert",
+            index=models.Index(
+                fields=["computed_on"], name="stockalert_computed_on_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="stockmovement",
+            index=models.Index(
+                fields=["batch", "created_on"], name="movement_batch_created_idx"
+            ),
+        ),
+    ]
@@ -0,0 +1,69 @@
+# Generated by Django 5.2.10 on 2026-10-17 23:20
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("billing", "0007_invoice_created_at_idx"),
+        ("inventory", "0006_hot_query_indexes"),
+        ("medicines", "0006_batch_sellable_indexes"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="StockMovementArchive",
+            fields=[
+                ("id", models.BigIntegerField(primary_key=True, serialize=False)),
+                ("month", models.DateField()),
+                ("created_on", models.DateTimeField()),
+                ("quantity", models.IntegerField()),
+                (
+                    "action",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.PROTECT,
+                        related_name="+",
+                        to="inventory.action",
+                    ),
+                ),
+                (
+                    "batch",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.PROTECT,
+                        related_name="+",
+                        to="medicines.batch",
+                    ),
+                ),
+                (
+                    "invoice_number",
+                    models.ForeignKey(
+                        null=True,
+                        on_delete=django.db.models.deletion.PROTECT,
+                        related_name="+",
+                        to="billing.invoice",
+                    ),
+                ),
+                (
+                    "medicine",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.PROTECT,
+                        related_name="archived_movements",
+                        to="medicines.medicine",
+                    ),
+                ),
+            ],
+            options={
+                "indexes": [
+                    models.Index(
+                        fields=["month", "batch"], name="movement_archive_month_idx"
+                    ),
+                    models.Index(
+                        fields=["batch", "created_on"],
+                        name="movement_archive_batch_idx",
+                    ),
+                ],
+            },
+        ),
+    ]
@@ -0,0 +1,51 @@
+# Generated by Django 5.2.10 on 2026-10-17 23:23
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("billing", "0007_invoice_created_at_idx"),
+        ("inventory", "0007_stockmovementarchive"),
+        ("medicines", "0006_batch_sellable_indexes"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="StockSnapshot",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("day", models.DateField()),
+                ("quantity", models.IntegerField()),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name="stockmovement",
+            index=models.Index(fields=["created_on"], name="movement_created_idx"),
+        ),
+        migrations.AddField(
+            model_name="stocksnapshot",
+            name="batch",
+            field=models.ForeignKey(
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="+",
+                to="medicines.batch",
+            ),
+        ),
+        migrations.AddConstraint(
+            model_name="stocksnapshot",
+            constraint=models.UniqueConstraint(
+                fields=("day", "batch"), name="unique_stock_snapshot_per_batch"
+            ),
+        ),
+    ]
@@ -0,0 +1,61 @@
+# Generated by Django 5.2.10 on 2026-10-17 23:26
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("inventory", "0008_stocksnapshot"),
+        ("medicines", "0007_supplier_lead_time_days"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ReorderSuggestion",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("average_daily_demand", models.FloatField()),
+                ("forecast_daily_demand", models.FloatField()),
+                ("sellable_quantity", models.PositiveIntegerField()),
+                ("lead_time_days", models.PositiveIntegerField()),
+                ("days_of_cover", models.FloatField()),
+                ("suggested_quantity", models.PositiveIntegerField()),
+                ("computed_at", models.DateTimeField()),
+                (
+                    "medicine",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="reorder_suggestion",
+                        to="medicines.medicine",
+                    ),
+                ),
+                (
+                    "supplier",
+                    models.ForeignKey(
+                        blank=True,
+                        null=True,
+                        on_delete=django.db.models.deletion.SET_NULL,
+                        related_name="+",
+                        to="medicines.supplier",
+                    ),
+                ),
+            ],
+            options={
+                "indexes": [
+                    models.Index(
+                        fields=["days_of_cover", "id"], name="reorder_cover_id_idx"
+                    )
+                ],
+            },
+        ),
+    ]
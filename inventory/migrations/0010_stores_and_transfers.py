@@ -0,0 +1,93 @@
+# Generated by Django 5.2.10 on 2026-10-17 23:39
+
+import django.db.models.deletion
+import medicines.models
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("inventory", "0009_reordersuggestion"),
+        ("medicines", "0008_store"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="stockmovement",
+            name="store",
+            field=models.ForeignKey(
+                default=medicines.models.current_store_id,
+                on_delete=django.db.models.deletion.PROTECT,
+                related_name="+",
+                to="medicines.store",
+            ),
+        ),
+        migrations.AddField(
+            model_name="stockmovementarchive",
+            name="store",
+            field=models.ForeignKey(
+                default=medicines.models.current_store_id,
+                on_delete=django.db.models.deletion.PROTECT,
+                related_name="+",
+                to="medicines.store",
+            ),
+            preserve_default=False,
+        ),
+        migrations.CreateModel(
+            name="StockTransfer",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("quantity", models.PositiveIntegerField()),
+                ("created_on", models.DateTimeField(auto_now_add=True)),
+                (
+                    "destination_batch",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.PROTECT,
+                        related_name="transfers_in",
+                        to="medicines.batch",
+                    ),
+                ),
+                (
+                    "from_store",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.PROTECT,
+                        related_name="+",
+                        to="medicines.store",
+                    ),
+                ),
+                (
+                    "medicine",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.PROTECT,
+                        related_name="+",
+                        to="medicines.medicine",
+                    ),
+                ),
+                (
+                    "source_batch",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.PROTECT,
+                        related_name="transfers_out",
+                        to="medicines.batch",
+                    ),
+                ),
+                (
+                    "to_store",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.PROTECT,
+                        related_name="+",
+                        to="medicines.store",
+                    ),
+                ),
+            ],
+        ),
+    ]
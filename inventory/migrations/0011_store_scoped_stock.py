@@ -0,0 +1,260 @@
+# Generated by Django 5.2.10 on 2026-10-18 00:01
+
+from datetime import timedelta
+
+import django.db.models.deletion
+import medicines.models
+from django.db import migrations, models
+from django.db.models import Exists, F, Min, OuterRef, Q, Sum
+from django.utils import timezone
+
+
+def clear_summaries(apps, schema_editor):
+    # Recomputed per store below (suggestions on the next run)
+    for name in ("StockAlert", "ReorderSuggestion"):
+        apps.get_model("inventory", name).objects.all().delete()
+
+
+def summarise_stores(apps, schema_editor):
+    Batch = apps.get_model("medicines", "Batch")
+    Medicine = apps.get_model("medicines", "Medicine")
+    Store = apps.get_model("medicines", "Store")
+    MedicineStock = apps.get_model("inventory", "MedicineStock")
+    StockAlert = apps.get_model("inventory", "StockAlert")
+    today = timezone.localdate()
+    sellable = Q(is_active=True, current_quantity__gt=0, expiration_date__gte=today)
+    expired = Q(is_active=True, current_quantity__gt=0, expiration_date__lt=today)
+    medicine_ids = list(Medicine.objects.values_list("id", flat=True))
+
+    for store_id in Store.objects.values_list("id", flat=True):
+        batches = Batch.objects.filter(store_id=store_id)
+        totals = {
+            row["medicine_id"]: row
+            for row in batches.values("medicine_id").annotate(
+                sellable=Sum("current_quantity", filter=sellable),
+                expired=Sum("current_quantity", filter=expired),
+                earliest=Min("expiration_date", filter=sellable),
+            )
+        }
+        fefo = {}
+        for medicine_id, batch_id in (
+            batches.filter(sellable)
+            .order_by("medicine_id", "expiration_date", "id")
+            .values_list("medicine_id", "id")
+        ):
+            fefo.setdefault(medicine_id, batch_id)
+        MedicineStock.objects.bulk_create(
+            [
+                MedicineStock(
+                    store_id=store_id,
+                    medicine_id=medicine_id,
+                    sellable_quantity=totals.get(medicine_id, {}).get("sellable") or 0,
+                    expired_quantity=totals.get(medicine_id, {}).get("expired") or 0,
+                    earliest_expiry=totals.get(medicine_id, {}).get("earliest"),
+                    fefo_batch_id=fefo.get(medicine_id),
+                )
+                for medicine_id in medicine_ids
+            ],
+            batch_size=500,
+        )
+
+        alerts = []
+        for batch_id, medicine_id, quantity, expiration_date in batches.filter(
+            is_active=True,
+            current_quantity__gt=0,
+            expiration_date__lte=today + timedelta(days=90),
+        ).values_list("id", "medicine_id", "current_quantity", "expiration_date"):
+            days_left = (expiration_date - today).days
+            if days_left < 0:
+                kind = "expired"
+            else:
+                kind = next(
+                    f"expiring_{days}" for days in (30, 60, 90) if days_left <= days
+                )
+            alerts.append(
+                StockAlert(
+                    store_id=store_id,
+                    kind=kind,
+                    medicine_id=medicine_id,
+                    batch_id=batch_id,
+                    quantity=quantity,
+                    expiration_date=expiration_date,
+                    computed_on=today,
+                )
+            )
+        for medicine_id, quantity, threshold in MedicineStock.objects.filter(
+            Exists(batches.filter(medicine_id=OuterRef("medicine_id"))),
+            store_id=store_id,
+            medicine__is_active=True,
+            sellable_quantity__lt=F("medicine__reorder_threshold"),
+        ).values_list(
+            "medicine_id", "sellable_quantity", "medicine__reorder_threshold"
+        ):
+            alerts.append(
+                StockAlert(
+                    store_id=store_id,
+                    kind="low_stock",
+                    medicine_id=medicine_id,
+                    quantity=quantity,
+                    reorder_threshold=threshold,
+                    computed_on=today,
+                )
+            )
+        StockAlert.objects.bulk_create(alerts, batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("inventory", "0010_stores_and_transfers"),
+        ("medicines", "0008_store"),
+    ]
+
+    operations = [
+        migrations.RunPython(clear_summaries, migrations.RunPython.noop),
+        # Keyed by medicine until now: recreated rather than altered, as
+        # SQLite can't move a primary key, and refilled below
+        migrations.DeleteModel(name="MedicineStock"),
+        migrations.CreateModel(
+            name="MedicineStock",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("sellable_quantity", models.PositiveIntegerField(default=0)),
+                ("expired_quantity", models.PositiveIntegerField(default=0)),
+                ("earliest_expiry", models.DateField(blank=True, null=True)),
+                (
+                    "fefo_batch",
+                    models.ForeignKey(
+                        blank=True,
+                        null=True,
+                        on_delete=django.db.models.deletion.SET_NULL,
+                        related_name="fefo_of",
+                        to="medicines.batch",
+                    ),
+                ),
+                (
+                    "medicine",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="stocks",
+                        to="medicines.medicine",
+                    ),
+                ),
+                (
+                    "store",
+                    models.ForeignKey(
+                        default=medicines.models.current_store_id,
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="+",
+                        to="medicines.store",
+                    ),
+                ),
+            ],
+            options={
+                "indexes": [
+                    models.Index(
+                        fields=["store", "earliest_expiry"],
+                        name="stock_earliest_expiry_idx",
+                    )
+                ],
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("store", "medicine"),
+                        name="unique_medicine_stock_per_store",
+                    )
+                ],
+            },
+        ),
+        migrations.RemoveIndex(
+            model_name="reordersuggestion",
+            name="reorder_cover_id_idx",
+        ),
+        migrations.RemoveIndex(
+            model_name="stockalert",
+            name="stockalert_kind_expiry_idx",
+        ),
+        migrations.RemoveIndex(
+            model_name="stockalert",
+            name="stockalert_kind_quantity_idx",
+        ),
+        migrations.RemoveIndex(
+            model_name="stockalert",
+            name="stockalert_computed_on_idx",
+        ),
+        migrations.AddField(
+            model_name="reordersuggestion",
+            name="store",
+            field=models.ForeignKey(
+                default=medicines.models.current_store_id,
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="+",
+                to="medicines.store",
+            ),
+        ),
+        migrations.AddField(
+            model_name="stockalert",
+            name="store",
+            field=models.ForeignKey(
+                default=medicines.models.current_store_id,
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="+",
+                to="medicines.store",
+            ),
+        ),
+        migrations.AlterField(
+            model_name="reordersuggestion",
+            name="medicine",
+            field=models.ForeignKey(
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="reorder_suggestions",
+                to="medicines.medicine",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="reordersuggestion",
+            index=models.Index(
+                fields=["store", "days_of_cover", "id"], name="reorder_cover_id_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="stockalert",
+            index=models.Index(
+                fields=["store", "kind", "expiration_date"],
+                name="stockalert_kind_expiry_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="stockalert",
+            index=models.Index(
+                fields=["store", "kind", "quantity"],
+                name="stockalert_kind_quantity_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="stockalert",
+            index=models.Index(
+                fields=["store", "computed_on"], name="stockalert_computed_on_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="stockalert",
+            index=models.Index(
+                fields=["store", "medicine"], name="stockalert_store_medicine_idx"
+            ),
+        ),
+        migrations.AddConstraint(
+            model_name="reordersuggestion",
+            constraint=models.UniqueConstraint(
+                fields=("store", "medicine"), name="unique_reorder_per_store"
+            ),
+        ),
+        migrations.RunPython(summarise_stores, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 5.2.10 on 2026-10-18 00:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("inventory", "0011_store_scoped_stock"),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name="stockmovement",
+            name="movement_batch_created_idx",
+        ),
+        migrations.RemoveIndex(
+            model_name="stockmovement",
+            name="movement_created_idx",
+        ),
+        migrations.AddIndex(
+            model_name="stockmovement",
+            index=models.Index(
+                fields=["store", "batch", "created_on"],
+                name="movement_batch_created_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="stockmovement",
+            index=models.Index(
+                fields=["store", "created_on"], name="movement_created_idx"
+            ),
+        ),
+    ]
@@ -1,5 +1,12 @@
 from django.db import models
-from medicines.models import Medicine, Batch
+from medicines.models import (
+    Medicine,
+    Batch,
+    Store,
+    StoreQuerySet,
+    Supplier,
+    current_store_id,
+)
 from billing.models import Invoice
 
 
@@ -15,5 +22,224 @@ class StockMovement(models.Model):
     batch = models.ForeignKey(Batch, on_delete=models.PROTECT)
     created_on = models.DateTimeField(auto_now_add=True)
     action = models.ForeignKey(Action, on_delete=models.PROTECT)
-    quantity = models.PositiveIntegerField()
+    # Signed ledger delta: stock in is positive, stock out negative, so the
+    # movements of a batch sum to its current quantity
+    quantity = models.IntegerField()
     invoice_number = models.ForeignKey(Invoice, on_delete=models.PROTECT, null=True)
+    # The batch's store; a transfer's two legs carry their own
+    store = models.ForeignKey(
+        Store, on_delete=models.PROTECT, related_name="+", default=current_store_id
+    )
+
+    objects = StoreQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # A batch's ledger in order: reconciliation and history reads.
+            # Store-leading like the other per-store indexes, so queries name
+            # the batches' stores as well
+            models.Index(
+                fields=["store", "batch", "created_on"],
+                name="movement_batch_created_idx",
+            ),
+            # Ledger deltas since a point in time: stock-as-of queries
+            models.Index(fields=["store", "created_on"], name="movement_created_idx"),
+        ]
+
+
+# Movements of closed months, moved out of StockMovement by inventory.ledger
+# so the live table only holds the current period. Rows keep their original
+# id and time; `month` is the first day of the month they belong to.
+class StockMovementArchive(models.Model):
+    id = models.BigIntegerField(primary_key=True)
+    month = models.DateField()
+    medicine = models.ForeignKey(
+        Medicine, on_delete=models.PROTECT, related_name="archived_movements"
+    )
+    batch = models.ForeignKey(Batch, on_delete=models.PROTECT, related_name="+")
+    created_on = models.DateTimeField()
+    action = models.ForeignKey(Action, on_delete=models.PROTECT, related_name="+")
+    quantity = models.IntegerField()
+    invoice_number = models.ForeignKey(
+        Invoice, on_delete=models.PROTECT, null=True, related_name="+"
+    )
+    store = models.ForeignKey(Store, on_delete=models.PROTECT, related_name="+")
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["month", "batch"], name="movement_archive_month_idx"),
+            models.Index(
+                fields=["batch", "created_on"], name="movement_archive_batch_idx"
+            ),
+        ]
+
+
+# Stock summary of one medicine in one store, refreshed by inventory.stock in
+# the same transaction as the batch changes it sums up. "Sellable" means
+# active, in stock and not expired; expired counts active batches past their
+# expiry.
+class MedicineStock(models.Model):
+    store = models.ForeignKey(
+        Store, on_delete=models.CASCADE, related_name="+", default=current_store_id
+    )
+    medicine = models.ForeignKey(
+        Medicine, on_delete=models.CASCADE, related_name="stocks"
+    )
+    sellable_quantity = models.PositiveIntegerField(default=0)
+    expired_quantity = models.PositiveIntegerField(default=0)
+    earliest_expiry = models.DateField(null=True, blank=True)
+    fefo_batch = models.ForeignKey(
+        Batch,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name="fefo_of",
+    )
+
+    objects = StoreQuerySet.as_manager()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["store", "medicine"], name="unique_medicine_stock_per_store"
+            )
+        ]
+        indexes = [
+            # Daily rollover finds the medicines whose earliest batch expired
+            models.Index(
+                fields=["store", "earliest_expiry"], name="stock_earliest_expiry_idx"
+            ),
+        ]
+
+
+# Precomputed stock alerts of a store, kept by inventory.stock alongside
+# MedicineStock.
+# Expiry alerts are per batch and bucketed by days left (buckets are
+# exclusive: a batch expiring in 20 days is only in expiring_30); low-stock
+# alerts are per medicine, for sellable stock below its reorder threshold.
+class StockAlert(models.Model):
+    EXPIRED = "expired"
+    EXPIRING_30 = "expiring_30"
+    EXPIRING_60 = "expiring_60"
+    EXPIRING_90 = "expiring_90"
+    LOW_STOCK = "low_stock"
+    KIND_CHOICES = [
+        (EXPIRED, "Expired"),
+        (EXPIRING_30, "Expiring in 30 days"),
+        (EXPIRING_60, "Expiring in 31-60 days"),
+        (EXPIRING_90, "Expiring in 61-90 days"),
+        (LOW_STOCK, "Below reorder threshold"),
+    ]
+
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+    medicine = models.ForeignKey(
+        Medicine, on_delete=models.CASCADE, related_name="stock_alerts"
+    )
+    batch = models.ForeignKey(
+        Batch,
+        on_delete=models.CASCADE,
+        null=True,
+        blank=True,
+        related_name="stock_alerts",
+    )
+    # Batch quantity for expiry alerts, sellable quantity for low stock
+    quantity = models.PositiveIntegerField()
+    expiration_date = models.DateField(null=True, blank=True)
+    reorder_threshold = models.PositiveIntegerField(null=True, blank=True)
+    computed_on = models.DateField()
+    store = models.ForeignKey(
+        Store, on_delete=models.CASCADE, related_name="+", default=current_store_id
+    )
+
+    objects = StoreQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # Top-N per kind: soonest expiry, lowest stock
+            models.Index(
+                fields=["store", "kind", "expiration_date"],
+                name="stockalert_kind_expiry_idx",
+            ),
+            models.Index(
+                fields=["store", "kind", "quantity"],
+                name="stockalert_kind_quantity_idx",
+            ),
+            # Rollover looks for alerts computed on an earlier day
+            models.Index(
+                fields=["store", "computed_on"], name="stockalert_computed_on_idx"
+            ),
+            # Refreshes replace the alerts of some medicines
+            models.Index(
+                fields=["store", "medicine"], name="stockalert_store_medicine_idx"
+            ),
+        ]
+
+
+# Closing stock of a batch at the end of a day, written by
+# inventory.snapshots. Batches with nothing left are not stored.
+class StockSnapshot(models.Model):
+    day = models.DateField()
+    batch = models.ForeignKey(Batch, on_delete=models.CASCADE, related_name="+")
+    quantity = models.IntegerField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["day", "batch"], name="unique_stock_snapshot_per_batch"
+            )
+        ]
+
+
+# Latest output of inventory.forecast: what a store should order for each
+# medicine that will run short before a new delivery could arrive. Replaced
+# on every run.
+class ReorderSuggestion(models.Model):
+    store = models.ForeignKey(
+        Store, on_delete=models.CASCADE, related_name="+", default=current_store_id
+    )
+    medicine = models.ForeignKey(
+        Medicine, on_delete=models.CASCADE, related_name="reorder_suggestions"
+    )
+    supplier = models.ForeignKey(
+        Supplier, on_delete=models.SET_NULL, null=True, blank=True, related_name="+"
+    )
+    average_daily_demand = models.FloatField()  # recent moving average
+    forecast_daily_demand = models.FloatField()  # adjusted for the season
+    sellable_quantity = models.PositiveIntegerField()
+    lead_time_days = models.PositiveIntegerField()
+    days_of_cover = models.FloatField()  # sellable stock / forecast demand
+    suggested_quantity = models.PositiveIntegerField()
+    computed_at = models.DateTimeField()
+
+    objects = StoreQuerySet.as_manager()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["store", "medicine"], name="unique_reorder_per_store"
+            )
+        ]
+        indexes = [
+            # The inventory screen lists the most urgent first
+            models.Index(
+                fields=["store", "days_of_cover", "id"], name="reorder_cover_id_idx"
+            ),
+        ]
+
+
+# Stock moved from one store to another. The source batch gives up the
+# quantity and the destination store's batch of the same number receives
+# it, each with its own ledger row ("Transfer Out" / "Transfer In") written
+# in the same transaction.
+class StockTransfer(models.Model):
+    from_store = models.ForeignKey(Store, on_delete=models.PROTECT, related_name="+")
+    to_store = models.ForeignKey(Store, on_delete=models.PROTECT, related_name="+")
+    medicine = models.ForeignKey(Medicine, on_delete=models.PROTECT, related_name="+")
+    source_batch = models.ForeignKey(
+        Batch, on_delete=models.PROTECT, related_name="transfers_out"
+    )
+    destination_batch = models.ForeignKey(
+        Batch, on_delete=models.PROTECT, related_name="transfers_in"
+    )
+    quantity = models.PositiveIntegerField()
+    created_on = models.DateTimeField(auto_now_add=True)
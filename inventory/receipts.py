@@ -0,0 +1,293 @@
+import csv
+import io
+import json
+import re
+import time
+from datetime import date
+from decimal import Decimal, InvalidOperation
+
+from django.db import transaction
+from django.db.models.functions import Lower
+from django.utils import timezone
+
+from medicines.models import Batch, Medicine
+from medicines.signals import notify_batches_changed
+
+from .models import StockMovement
+from .services import get_action
+from .stock import refresh_medicine_stock
+
+# Columns of a delivery file. A line names its medicine either by barcode or
+# by the variant key (name, brand, strength, pack_size, pack_type).
+FIELDS = [
+    "barcode",
+    "name",
+    "brand",
+    "strength",
+    "pack_size",
+    "pack_type",
+    "batch_number",
+    "quantity",
+    "purchase_price",
+    "sale_price",
+    "expiration_date",
+]
+CHUNK_SIZE = 500
+
+# What may stand between records: whitespace, commas and the array brackets
+_SEPARATORS = re.compile(r"[\s,\[\]]*")
+
+
+def _text(upload):
+    # Uploaded files and files opened in binary mode both arrive as bytes
+    return io.TextIOWrapper(upload, encoding="utf-8-sig", newline="")
+
+
+def read_csv(upload):
+    # header is line 1, so the first record is line 2
+    for line_no, row in enumerate(csv.DictReader(_text(upload)), start=2):
+        yield line_no, row
+
+
+def read_json(upload):
+    """
+    Records of a JSON array or of newline-delimited JSON, decoded one at a
+    time from a small buffer so the file is never loaded whole.
+    """
+    decoder = json.JSONDecoder()
+    stream = _text(upload)
+    buffer = ""
+    number = 0
+    while True:
+        chunk = stream.read(64 * 1024)
+        buffer += chunk
+        position = 0
+        while True:
+            position = _SEPARATORS.match(buffer, position).end()
+            if position == len(buffer):
+                break
+            try:
+                record, position_after = decoder.raw_decode(buffer, position)
+            except json.JSONDecodeError:
+                if not chunk:
+                    raise ValueError(f"malformed JSON after record {number}") from None
+                break  # incomplete record: read more
+            number += 1
+            position = position_after
+            yield number, record
+        buffer = buffer[position:]
+        if not chunk:
+            return
+
+
+def read_delivery(upload, name):
+    if name.lower().endswith((".json", ".jsonl", ".ndjson")):
+        return read_json(upload)
+    return read_csv(upload)
+
+
+def _variant_key(name, brand, strength, pack_size, pack_type):
+    return (
+        (name or "").strip().lower(),
+        (brand or "").strip().lower(),
+        (strength or "").strip().lower(),
+        pack_size,
+        (pack_type or "").strip().lower(),
+    )
+
+
+def _resolve_medicines(rows):
+    # Two queries per chunk: every barcode at once, every variant name at once
+    barcodes = {row["barcode"] for row in rows if row["barcode"]}
+    names = {
+        row["name"].strip().lower()
+        for row in rows
+        if not row["barcode"] and row["name"]
+    }
+    by_barcode = {
+        medicine.barcode: medicine
+        for medicine in Medicine.objects.filter(barcode__in=barcodes).only(
+            "id", "name", "barcode"
+        )
+    }
+    by_variant = {}
+    # Matched case-insensitively, like the variant key
+    for medicine in (
+        Medicine.objects.annotate(name_lower=Lower("name"))
+        .filter(barcode__isnull=True, name_lower__in=names)
+        .select_related("brand", "pack_type")
+    ):
+        key = _variant_key(
+            medicine.name,
+            medicine.brand.name if medicine.brand else "",
+            medicine.strength,
+            medicine.pack_size,
+            medicine.pack_type.name,
+        )
+        by_variant[key] = medicine
+    return by_barcode, by_variant
+
+
+def _clean(record):
+    row = {field: str(record.get(field) or "").strip() for field in FIELDS}
+    errors = []
+    if not row["barcode"] and not row["name"]:
+        errors.append("barcode or name is required")
+    if not row["batch_number"]:
+        errors.append("batch_number is required")
+
+    for field in ("quantity", "pack_size"):
+        if not row[field] and field == "pack_size":
+            row[field] = None
+            continue
+        try:
+            row[field] = int(row[field])
+            if row[field] <= 0:
+                raise ValueError
+        except ValueError:
+            errors.append(f"{field} must be a positive whole number")
+
+    for field in ("purchase_price", "sale_price"):
+        try:
+            row[field] = Decimal(row[field])
+            if not row[field].is_finite() or row[field] < 0:
+                raise InvalidOperation
+        except InvalidOperation:
+            errors.append(f"{field} must be a non-negative amount")
+
+    try:
+        row["expiration_date"] = date.fromisoformat(row["expiration_date"])
+        if row["expiration_date"] < timezone.localdate():
+            errors.append("batch is already expired")
+    except ValueError:
+        errors.append("expiration_date must be YYYY-MM-DD")
+    return row, errors
+
+
+def _receive_chunk(chunk, supplier, purchase_action, seen_batches, result):
+    cleaned = []
+    for line_no, record in chunk:
+        if not isinstance(record, dict):
+            result["errors"].append((line_no, "record is not an object"))
+            continue
+        row, errors = _clean(record)
+        if errors:
+            result["errors"].append((line_no, "; ".join(errors)))
+        else:
+            cleaned.append((line_no, row))
+
+    by_barcode, by_variant = _resolve_medicines([row for _, row in cleaned])
+    resolved = []
+    for line_no, row in cleaned:
+        if row["barcode"]:
+            medicine = by_barcode.get(row["barcode"])
+        else:
+            medicine = by_variant.get(
+                _variant_key(
+                    row["name"],
+                    row["brand"],
+                    row["strength"],
+                    row["pack_size"],
+                    row["pack_type"],
+                )
+            )
+        if medicine is None:
+            result["errors"].append((line_no, "unknown medicine"))
+        else:
+            resolved.append((line_no, row, medicine))
+
+    # Batch numbers are unique per medicine in a store: check the file and
+    # the database
+    existing = set(
+        Batch.objects.for_store()
+        .filter(
+            medicine_id__in={medicine.id for _, _, medicine in resolved},
+            batch_number__in={row["batch_number"] for _, row, _ in resolved},
+        )
+        .values_list("medicine_id", "batch_number")
+    )
+    batches = []
+    for line_no, row, medicine in resolved:
+        key = (medicine.id, row["batch_number"])
+        if key in existing or key in seen_batches:
+            result["errors"].append(
+                (line_no, f"batch {row['batch_number']} of {medicine.name} exists")
+            )
+            continue
+        seen_batches.add(key)
+        batches.append(
+            Batch(
+                batch_number=row["batch_number"],
+                medicine=medicine,
+                initial_quantity=row["quantity"],
+                current_quantity=row["quantity"],
+                purchase_price=row["purchase_price"],
+                sale_price=row["sale_price"],
+                expiration_date=row["expiration_date"],
+                supplier=supplier,
+            )
+        )
+
+    Batch.objects.bulk_create(batches)
+    StockMovement.objects.bulk_create(
+        StockMovement(
+            medicine_id=batch.medicine_id,
+            batch=batch,
+            action=purchase_action,
+            quantity=batch.initial_quantity,
+            store_id=batch.store_id,
+        )
+        for batch in batches
+    )
+    result["received"] += len(batches)
+    result["medicine_ids"].update(batch.medicine_id for batch in batches)
+
+
+def receive_goods(records, supplier, accept_partial=False):
+    """
+    Create a Batch and a Purchase StockMovement for every valid line of a
+    delivery. `records` yields (line number, dict) pairs, as read_delivery()
+    does; they are validated and inserted CHUNK_SIZE at a time inside one
+    transaction. Unless `accept_partial`, a file with any bad line saves
+    nothing, so it can be fixed and imported again.
+
+    Returns a report: lines, received, errors [(line, message)], saved,
+    seconds and lines_per_second.
+    """
+    started = time.perf_counter()
+    result = {"lines": 0, "received": 0, "errors": [], "medicine_ids": set()}
+    seen_batches = set()
+    with transaction.atomic():
+        purchase_action = get_action("Purchase")
+        chunk = []
+        try:
+            for record in records:
+                chunk.append(record)
+                if len(chunk) >= CHUNK_SIZE:
+                    _receive_chunk(
+                        chunk, supplier, purchase_action, seen_batches, result
+                    )
+                    result["lines"] += len(chunk)
+                    chunk = []
+        except (ValueError, csv.Error, UnicodeDecodeError) as exc:
+            result["errors"].append((None, f"Could not read the file: {exc}"))
+        if chunk:
+            _receive_chunk(chunk, supplier, purchase_action, seen_batches, result)
+            result["lines"] += len(chunk)
+
+        result["saved"] = not result["errors"] or accept_partial
+        if result["saved"]:
+            refresh_medicine_stock(result["medicine_ids"])
+            notify_batches_changed(result["medicine_ids"])
+        else:
+            transaction.set_rollback(True)
+
+    del result["medicine_ids"]
+    result["errors"].sort(key=lambda error: (error[0] is None, error[0] or 0))
+    if not result["saved"]:
+        result["received"] = 0
+    result["seconds"] = time.perf_counter() - started
+    result["lines_per_second"] = (
+        result["lines"] / result["seconds"] if result["seconds"] else 0
+    )
+    return result
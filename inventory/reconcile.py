@@ -0,0 +1,143 @@
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import django
+from django.db import connections, transaction
+from django.db.models import Max, Min, Sum
+
+from medicines.models import Batch
+
+from .models import StockMovement
+from .services import get_action
+
+CHUNK_SIZE = 5000
+
+
+def medicine_id_ranges(parts):
+    """Split the medicine ids that have batches into `parts` [low, high) ranges."""
+    bounds = Batch.objects.aggregate(low=Min("medicine_id"), high=Max("medicine_id"))
+    if bounds["low"] is None:
+        return []
+    low, high = bounds["low"], bounds["high"] + 1
+    step = max(1, -(-(high - low) // parts))
+    return [(start, min(start + step, high)) for start in range(low, high, step)]
+
+
+def reconcile_range(low, high, fix=False, chunk_size=CHUNK_SIZE):
+    """
+    Compare the ledger of every batch of medicines low <= id < high with its
+    current quantity. Batches are read in id order a chunk at a time and
+    each chunk's movements are summed per batch in the database, so memory
+    stays flat however long the ledger is. With `fix`, an Adjustment
+    movement brings each drifted ledger in line with the stock on hand.
+
+    Returns a report: batches, drift [(batch_id, medicine_id, ledger,
+    on_hand)], adjusted and seconds.
+    """
+    started = time.perf_counter()
+    result = {"batches": 0, "drift": [], "adjusted": 0}
+    last_id = 0
+    while True:
+        batches = list(
+            Batch.objects.filter(
+                medicine_id__gte=low, medicine_id__lt=high, id__gt=last_id
+            )
+            .order_by("id")
+            .values_list("id", "medicine_id", "current_quantity", "store_id")[
+                :chunk_size
+            ]
+        )
+        if not batches:
+            break
+        last_id = batches[-1][0]
+        drift = _drift(batches)
+        if fix and drift:
+            result["adjusted"] += _adjust([row[0] for row in drift])
+        result["batches"] += len(batches)
+        result["drift"].extend(drift)
+    result["seconds"] = time.perf_counter() - started
+    return result
+
+
+def _drift(batches):
+    # (batch_id, medicine_id, ledger, on_hand) of the batches, given as
+    # (id, medicine_id, current_quantity, store_id), whose ledger doesn't
+    # add up
+    ledger = dict(
+        StockMovement.objects.filter(
+            store_id__in={batch[3] for batch in batches},
+            batch_id__in=[batch[0] for batch in batches],
+        )
+        .values("batch_id")
+        .annotate(total=Sum("quantity"))
+        .values_list("batch_id", "total")
+    )
+    return [
+        (batch_id, medicine_id, ledger.get(batch_id, 0), on_hand)
+        for batch_id, medicine_id, on_hand, _ in batches
+        if ledger.get(batch_id, 0) != on_hand
+    ]
+
+
+def _adjust(batch_ids):
+    # A sale committed since the chunk was read moved both the quantity and
+    # the ledger, so the drift is read again under the batches' lock and in
+    # the transaction that writes the adjustments: on SQLite a commit by
+    # another writer in between fails this one instead of skewing it
+    with transaction.atomic():
+        batches = (
+            Batch.objects.select_for_update()
+            .filter(id__in=batch_ids)
+            .order_by("id")
+            .values_list("id", "medicine_id", "current_quantity", "store_id")
+        )
+        batches = list(batches)
+        stores = {batch[0]: batch[3] for batch in batches}
+        drift = _drift(batches)
+        adjustment = get_action("Adjustment")
+        StockMovement.objects.bulk_create(
+            StockMovement(
+                medicine_id=medicine_id,
+                batch_id=batch_id,
+                action=adjustment,
+                quantity=on_hand - ledger,
+                store_id=stores[batch_id],
+            )
+            for batch_id, medicine_id, ledger, on_hand in drift
+        )
+    return len(drift)
+
+
+def _init_worker():
+    django.setup()
+    # Connections inherited from the parent process must not be shared
+    connections.close_all()
+
+
+def _reconcile_part(args):
+    return reconcile_range(*args)
+
+
+def reconcile_stock(workers=1, fix=False, chunk_size=CHUNK_SIZE):
+    """
+    Reconcile every batch, split by medicine-id range over `workers`
+    processes (inline when 1). Returns the merged report with the number
+    of ranges.
+    """
+    started = time.perf_counter()
+    ranges = medicine_id_ranges(max(1, workers) * 4)
+    parts = [(low, high, fix, chunk_size) for low, high in ranges]
+    if workers <= 1:
+        reports = map(_reconcile_part, parts)
+    else:
+        connections.close_all()
+        with ProcessPoolExecutor(workers, initializer=_init_worker) as pool:
+            reports = list(pool.map(_reconcile_part, parts))
+
+    result = {"ranges": len(parts), "batches": 0, "drift": [], "adjusted": 0}
+    for report in reports:
+        result["batches"] += report["batches"]
+        result["drift"].extend(report["drift"])
+        result["adjusted"] += report["adjusted"]
+    result["seconds"] = time.perf_counter() - started
+    return result
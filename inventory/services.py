@@ -0,0 +1,20 @@
+from django.db import transaction
+
+from .models import Action
+
+
+# Action rows never change once created, so keep them per process instead of
+# looking them up on every stock movement.
+_action_cache = {}
+
+
+def get_action(name):
+    action = _action_cache.get(name)
+    if action is None:
+        action, created = Action.objects.get_or_create(name=name)
+        if created:
+            # Don't remember a row that a rollback could still take away
+            transaction.on_commit(lambda: _action_cache.setdefault(name, action))
+        else:
+            _action_cache[name] = action
+    return action
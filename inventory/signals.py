@@ -0,0 +1,37 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from medicines.models import Batch, Medicine, Store
+
+from .models import StockMovement
+from .services import get_action
+from .stock import refresh_medicine_stock
+
+
+# Batch edits outside a stock movement (admin, imports) keep the summary too
+@receiver(post_save, sender=Batch)
+@receiver(post_delete, sender=Batch)
+def batch_saved(sender, instance, **kwargs):
+    refresh_medicine_stock([instance.medicine_id], instance.store_id)
+
+
+# A batch entered by hand is a purchase; bulk imports record their own
+@receiver(post_save, sender=Batch)
+def record_batch_purchase(sender, instance, created, raw=False, **kwargs):
+    if created and not raw and instance.current_quantity:
+        StockMovement.objects.create(
+            medicine_id=instance.medicine_id,
+            batch=instance,
+            action=get_action("Purchase"),
+            quantity=instance.current_quantity,
+            store_id=instance.store_id,
+        )
+
+
+# Creating a medicine gives it a summary row in every store; editing one may
+# change its reorder threshold or active flag, which its alerts depend on
+@receiver(post_save, sender=Medicine)
+def medicine_saved(sender, instance, raw=False, **kwargs):
+    if not raw:
+        for store_id in Store.objects.values_list("id", flat=True):
+            refresh_medicine_stock([instance.pk], store_id)
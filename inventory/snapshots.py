@@ -0,0 +1,122 @@
+import time
+from datetime import timedelta
+
+from django.db import transaction
+from django.utils import timezone
+
+from medicines.models import Batch, current_store_id
+
+from .ledger import movement_totals, start_of_day
+from .models import StockSnapshot
+
+DETAIL_CHUNK = 1000
+
+
+def end_of_day(day):
+    return start_of_day(day + timedelta(days=1))
+
+
+def _add(quantities, totals, sign):
+    for batch_id, quantity in totals.items():
+        quantities[batch_id] = quantities.get(batch_id, 0) + sign * quantity
+
+
+def stock_as_of(day):
+    """
+    Closing quantity of every batch of this store at the end of `day`, as
+    {batch_id: quantity} without the batches that had none. It starts from whichever
+    is nearest to `day`: the snapshot before it rolled forward, the
+    snapshot after it rolled back, or today's quantities rolled back. Only
+    the ledger between the two is read, so the cost is bounded by the
+    snapshot interval, not by the age of `day`.
+    """
+    today = timezone.localdate()
+    store_id = current_store_id()
+    snapshots = StockSnapshot.objects.filter(batch__store_id=store_id)
+    days = snapshots.values_list("day", flat=True)
+    # Each an index seek: the (day, batch) constraint leads with day
+    before = days.filter(day__lte=day).order_by("-day").first()
+    after = days.filter(day__gt=day).order_by("day").first()
+    starts = [(max((today - day).days, 0), "current", None)]
+    if before is not None:
+        starts.append(((day - before).days, "before", before))
+    if after is not None:
+        starts.append(((after - day).days, "after", after))
+    _, start, snapshot_day = min(starts)
+
+    if start == "current":
+        quantities = dict(
+            Batch.objects.for_store()
+            .filter(current_quantity__gt=0)
+            .values_list("id", "current_quantity")
+        )
+        _add(quantities, movement_totals(end_of_day(day), store_id=store_id), -1)
+    else:
+        quantities = dict(
+            snapshots.filter(day=snapshot_day).values_list("batch_id", "quantity")
+        )
+        if start == "before" and snapshot_day < day:
+            _add(
+                quantities,
+                movement_totals(
+                    end_of_day(snapshot_day), end_of_day(day), store_id=store_id
+                ),
+                1,
+            )
+        elif start == "after":
+            _add(
+                quantities,
+                movement_totals(
+                    end_of_day(day), end_of_day(snapshot_day), store_id=store_id
+                ),
+                -1,
+            )
+    return {batch_id: quantity for batch_id, quantity in quantities.items() if quantity}
+
+
+def take_stock_snapshot(day=None):
+    """
+    Store the closing stock of this store's batches for `day` (default:
+    yesterday), replacing an earlier snapshot of the same day. Returns a report: day,
+    batches and seconds.
+    """
+    started = time.perf_counter()
+    day = day or timezone.localdate() - timedelta(days=1)
+    quantities = stock_as_of(day)
+    with transaction.atomic():
+        StockSnapshot.objects.filter(
+            day=day, batch__store_id=current_store_id()
+        ).delete()
+        StockSnapshot.objects.bulk_create(
+            (
+                StockSnapshot(day=day, batch_id=batch_id, quantity=quantity)
+                for batch_id, quantity in quantities.items()
+            ),
+            batch_size=1000,
+        )
+    return {
+        "day": day,
+        "batches": len(quantities),
+        "seconds": time.perf_counter() - started,
+    }
+
+
+def stock_rows(quantities):
+    """(batch, quantity) for `quantities`, in batch order, read a chunk at a time."""
+    batch_ids = sorted(quantities)
+    for start in range(0, len(batch_ids), DETAIL_CHUNK):
+        chunk = batch_ids[start : start + DETAIL_CHUNK]
+        batches = (
+            Batch.objects.filter(id__in=chunk)
+            .select_related("medicine")
+            .only(
+                "batch_number",
+                "expiration_date",
+                "purchase_price",
+                "medicine__name",
+                "medicine__hsn_code",
+            )
+            .order_by("id")
+        )
+        for batch in batches:
+            yield batch, quantities[batch.id]
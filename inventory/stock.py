@@ -0,0 +1,203 @@
+from datetime import timedelta
+
+from django.db.models import Exists, F, Min, OuterRef, Q, Sum
+from django.utils import timezone
+
+from medicines.models import Batch, Medicine, current_store_id
+
+from .models import MedicineStock, StockAlert
+
+# Expiry alert buckets, in days left: (upper bound, kind)
+EXPIRY_WINDOWS = [
+    (30, StockAlert.EXPIRING_30),
+    (60, StockAlert.EXPIRING_60),
+    (90, StockAlert.EXPIRING_90),
+]
+
+_expiry_checked_on = None
+
+
+def _summaries(medicine_ids, today, store_id):
+    sellable = Q(is_active=True, current_quantity__gt=0, expiration_date__gte=today)
+    expired = Q(is_active=True, current_quantity__gt=0, expiration_date__lt=today)
+    batches = Batch.objects.filter(store_id=store_id)
+    if medicine_ids is not None:
+        batches = batches.filter(medicine_id__in=medicine_ids)
+
+    totals = {
+        row["medicine_id"]: row
+        for row in batches.values("medicine_id").annotate(
+            sellable=Sum("current_quantity", filter=sellable),
+            expired=Sum("current_quantity", filter=expired),
+            earliest=Min("expiration_date", filter=sellable),
+        )
+    }
+    # First sellable batch per medicine in FEFO order
+    fefo = {}
+    for medicine_id, batch_id in (
+        batches.filter(sellable)
+        .order_by("medicine_id", "expiration_date", "id")
+        .values_list("medicine_id", "id")
+    ):
+        fefo.setdefault(medicine_id, batch_id)
+
+    if medicine_ids is None:
+        medicine_ids = Medicine.objects.values_list("id", flat=True)
+    for medicine_id in medicine_ids:
+        row = totals.get(medicine_id, {})
+        yield MedicineStock(
+            store_id=store_id,
+            medicine_id=medicine_id,
+            sellable_quantity=row.get("sellable") or 0,
+            expired_quantity=row.get("expired") or 0,
+            earliest_expiry=row.get("earliest"),
+            fefo_batch_id=fefo.get(medicine_id),
+        )
+
+
+def refresh_medicine_stock(medicine_ids=None, store_id=None):
+    """
+    Recompute the MedicineStock rows of `medicine_ids` (every medicine when
+    None) in one store (default: this install's) from that store's batches.
+    Call it inside the transaction that changed the batches so the summary
+    commits or rolls back with them.
+    """
+    if medicine_ids is not None:
+        medicine_ids = set(medicine_ids)
+        if not medicine_ids:
+            return 0
+    store_id = store_id or current_store_id()
+    rows = list(_summaries(medicine_ids, timezone.localdate(), store_id))
+    MedicineStock.objects.bulk_create(
+        rows,
+        batch_size=500,
+        update_conflicts=True,
+        unique_fields=["store", "medicine"],
+        update_fields=[
+            "sellable_quantity",
+            "expired_quantity",
+            "earliest_expiry",
+            "fefo_batch",
+        ],
+    )
+    refresh_stock_alerts(medicine_ids, store_id)
+    return len(rows)
+
+
+def _alerts(medicine_ids, today, store_id):
+    horizon = today + timedelta(days=EXPIRY_WINDOWS[-1][0])
+    store_batches = Batch.objects.filter(store_id=store_id)
+    batches = store_batches.filter(
+        is_active=True, current_quantity__gt=0, expiration_date__lte=horizon
+    )
+    # Low stock only for medicines that have ever been stocked here, so
+    # catalogue lines never bought don't flood the list
+    low_stock = MedicineStock.objects.filter(
+        Exists(store_batches.filter(medicine_id=OuterRef("medicine_id"))),
+        store_id=store_id,
+        medicine__is_active=True,
+        sellable_quantity__lt=F("medicine__reorder_threshold"),
+    )
+    if medicine_ids is not None:
+        batches = batches.filter(medicine_id__in=medicine_ids)
+        low_stock = low_stock.filter(medicine_id__in=medicine_ids)
+
+    for batch_id, medicine_id, quantity, expiration_date in batches.values_list(
+        "id", "medicine_id", "current_quantity", "expiration_date"
+    ):
+        days_left = (expiration_date - today).days
+        kind = StockAlert.EXPIRED
+        if days_left >= 0:
+            kind = next(kind for days, kind in EXPIRY_WINDOWS if days_left <= days)
+        yield StockAlert(
+            store_id=store_id,
+            kind=kind,
+            medicine_id=medicine_id,
+            batch_id=batch_id,
+            quantity=quantity,
+            expiration_date=expiration_date,
+            computed_on=today,
+        )
+    for medicine_id, quantity, threshold in low_stock.values_list(
+        "medicine_id", "sellable_quantity", "medicine__reorder_threshold"
+    ):
+        yield StockAlert(
+            store_id=store_id,
+            kind=StockAlert.LOW_STOCK,
+            medicine_id=medicine_id,
+            quantity=quantity,
+            reorder_threshold=threshold,
+            computed_on=today,
+        )
+
+
+def refresh_stock_alerts(medicine_ids=None, store_id=None):
+    """
+    Replace one store's (default: this install's) StockAlert rows of
+    `medicine_ids` (every medicine when None) with ones computed from its
+    batches and MedicineStock rows, which must be current. Called by
+    refresh_medicine_stock(), so it shares its transaction.
+    """
+    if medicine_ids is not None:
+        medicine_ids = set(medicine_ids)
+        if not medicine_ids:
+            return 0
+    store_id = store_id or current_store_id()
+    alerts = list(_alerts(medicine_ids, timezone.localdate(), store_id))
+    stale = StockAlert.objects.filter(store_id=store_id)
+    if medicine_ids is not None:
+        stale = stale.filter(medicine_id__in=medicine_ids)
+    stale.delete()
+    StockAlert.objects.bulk_create(alerts, batch_size=500)
+    return len(alerts)
+
+
+def roll_over_stock(today, store_id=None):
+    # Re-summarise the store's medicines whose earliest sellable batch has
+    # expired, and recompute the alerts of every medicine with a batch close
+    # enough to expiry for a day to move it, or with alerts from an earlier
+    # day.
+    store_id = store_id or current_store_id()
+    stocks = MedicineStock.objects.filter(store_id=store_id)
+    expired = set(
+        stocks.filter(earliest_expiry__lt=today).values_list("medicine_id", flat=True)
+    )
+    refresh_medicine_stock(expired, store_id)
+    horizon = today + timedelta(days=EXPIRY_WINDOWS[-1][0])
+    rebucket = set(
+        StockAlert.objects.filter(store_id=store_id, computed_on__lt=today).values_list(
+            "medicine_id", flat=True
+        )
+    ) | set(
+        stocks.filter(earliest_expiry__lte=horizon).values_list(
+            "medicine_id", flat=True
+        )
+    )
+    refresh_stock_alerts(rebucket - expired, store_id)
+    return len(expired | rebucket)
+
+
+def refresh_expired_stock():
+    # Batches expire, and move between alert buckets, at midnight without
+    # any write, so once a day per process roll the tables over before they
+    # are read. The daily refresh_stock_alerts command normally got there
+    # first, leaving little to do.
+    global _expiry_checked_on
+    today = timezone.localdate()
+    if _expiry_checked_on == today:
+        return
+    alerts = StockAlert.objects.for_store()
+    if (
+        not alerts.filter(computed_on=today).exists()
+        or alerts.filter(computed_on__lt=today).exists()
+        or MedicineStock.objects.for_store().filter(earliest_expiry__lt=today).exists()
+    ):
+        roll_over_stock(today)
+    _expiry_checked_on = today
+
+
+def rebuild_medicine_stock():
+    global _expiry_checked_on
+    count = refresh_medicine_stock()
+    _expiry_checked_on = timezone.localdate()
+    return count
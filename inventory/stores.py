@@ -0,0 +1,111 @@
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.db.models import F, Sum
+from django.utils import timezone
+
+from medicines.models import SELLABLE, Batch
+from medicines.signals import notify_batches_changed
+
+from .models import StockMovement, StockTransfer
+from .services import get_action
+from .stock import refresh_medicine_stock
+
+
+def transfer_stock(batch, to_store, quantity):
+    """
+    Move `quantity` of `batch` to `to_store`, into its batch of the same
+    number (created on the first transfer). Both quantities change and the
+    paired Transfer Out / Transfer In movements are written in one
+    transaction, so each store's ledger keeps adding up to its stock.
+    Both stores must share this database. Returns the StockTransfer.
+    """
+    if quantity <= 0:
+        raise ValidationError("Transfer a positive quantity.")
+    if to_store.id == batch.store_id:
+        raise ValidationError("The batch is already in that store.")
+
+    with transaction.atomic():
+        source = Batch.objects.select_for_update().get(pk=batch.pk)
+        if source.current_quantity < quantity:
+            raise ValidationError(
+                f"Only {source.current_quantity} left in batch {source.batch_number}."
+            )
+        destination, _ = Batch.objects.select_for_update().get_or_create(
+            store=to_store,
+            medicine_id=source.medicine_id,
+            batch_number=source.batch_number,
+            defaults={
+                "initial_quantity": quantity,
+                "current_quantity": 0,
+                "purchase_price": source.purchase_price,
+                "sale_price": source.sale_price,
+                "expiration_date": source.expiration_date,
+                "supplier_id": source.supplier_id,
+            },
+        )
+        Batch.objects.filter(pk=source.pk).update(
+            current_quantity=F("current_quantity") - quantity
+        )
+        Batch.objects.filter(pk=destination.pk).update(
+            current_quantity=F("current_quantity") + quantity
+        )
+        StockMovement.objects.bulk_create(
+            [
+                StockMovement(
+                    medicine_id=source.medicine_id,
+                    batch=source,
+                    action=get_action("Transfer Out"),
+                    quantity=-quantity,
+                    store_id=source.store_id,
+                ),
+                StockMovement(
+                    medicine_id=source.medicine_id,
+                    batch=destination,
+                    action=get_action("Transfer In"),
+                    quantity=quantity,
+                    store_id=to_store.id,
+                ),
+            ]
+        )
+        transfer = StockTransfer.objects.create(
+            from_store_id=source.store_id,
+            to_store=to_store,
+            medicine_id=source.medicine_id,
+            source_batch=source,
+            destination_batch=destination,
+            quantity=quantity,
+        )
+        refresh_medicine_stock([source.medicine_id], source.store_id)
+        refresh_medicine_stock([source.medicine_id], to_store.id)
+        notify_batches_changed([source.medicine_id])
+    return transfer
+
+
+def consolidated_stock(databases=None):
+    """
+    Sellable stock of every store in each of `databases` (default:
+    settings.POS_STORE_DATABASES), as rows of (store code, store name,
+    medicine, quantity, value at cost) sorted by store and medicine.
+
+    Each database gets one grouped read through the sellable partial
+    index, on its own connection, and nothing is written, so head office
+    can run it at any time without holding up a branch's checkout.
+    """
+    today = timezone.localdate()
+    rows = []
+    for alias in databases or settings.POS_STORE_DATABASES:
+        rows.extend(
+            Batch.objects.using(alias)
+            .filter(SELLABLE, expiration_date__gte=today)
+            .values("store__code", "store__name", "medicine__name")
+            .annotate(
+                quantity=Sum("current_quantity"),
+                value=Sum(F("current_quantity") * F("purchase_price")),
+            )
+            .values_list(
+                "store__code", "store__name", "medicine__name", "quantity", "value"
+            )
+            .order_by()
+        )
+    return sorted(rows)
@@ -1,3 +1,595 @@
-from django.test import TestCase
+import json
+import zipfile
+from datetime import date, timedelta
+from io import BytesIO
+from unittest import mock
 
-# Create your tests here.
+import numpy as np
+from django.test import SimpleTestCase
+from django.utils import timezone
+
+from django.core.exceptions import ValidationError
+from django.db.models import Sum
+
+from billing.services import create_invoice, get_fefo_batch
+from inventory.forecast import forecast, suggest_reorders
+from inventory import stock
+from inventory.ledger import OPENING, archive_closed_months, movements_between
+from inventory.models import (
+    MedicineStock,
+    StockAlert,
+    StockMovement,
+    StockMovementArchive,
+)
+from inventory.receipts import FIELDS, read_delivery, receive_goods
+from inventory.reconcile import _adjust, reconcile_range, reconcile_stock
+from inventory.stores import consolidated_stock, transfer_stock
+from inventory.views import keyset_page, keyset_rows
+from medicines.models import Batch, Store, Supplier
+from inventory.snapshots import stock_as_of, take_stock_snapshot
+from inventory.stock import (
+    refresh_expired_stock,
+    refresh_medicine_stock,
+    roll_over_stock,
+)
+from pharmacy_project.query_plans import QueryPlanTestCase, make_sample_stock
+
+
+class HotQueryPlanTests(QueryPlanTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        make_sample_stock()
+
+    def get(self, **params):
+        return self.client.get("/inventory", params, HTTP_HX_REQUEST="true")
+
+    def test_medicine_list(self):
+        self.assertNoFullScans(lambda: self.get())
+        self.assertNoFullScans(lambda: self.get(search="amox", category=1))
+        self.assertNoFullScans(lambda: self.get(after="Amoxicillin|1"))
+
+    def test_batch_list(self):
+        self.assertNoFullScans(lambda: self.get(view_type="batches"))
+        self.assertNoFullScans(lambda: self.get(view_type="batches", search="azi"))
+
+    def test_alerts(self):
+        response = self.assertNoFullScans(lambda: self.get(view_type="alerts"))
+        self.assertContains(response, "Azithromycin")
+
+    def test_full_page(self):
+        # The category filter lists every category
+        self.assertNoFullScans(
+            lambda: self.client.get("/inventory"), allow=["medicines_category"]
+        )
+
+    def test_reorder_suggestions(self):
+        suggest_reorders()
+        self.assertNoFullScans(lambda: self.get(view_type="reorder"))
+        self.assertNoFullScans(
+            lambda: self.get(view_type="reorder", status="active", after="2.5|1")
+        )
+
+    def export(self, **params):
+        response = self.client.get("/inventoryexport/", params)
+        return b"".join(response.streaming_content)
+
+    def test_exports(self):
+        for view_type in ("medicines", "batches", "alerts", "reorder"):
+            self.assertNoFullScans(
+                lambda view_type=view_type: self.export(view_type=view_type)
+            )
+        content = self.assertNoFullScans(
+            lambda: self.export(view_type="batches", search="amox", format="xlsx")
+        )
+        sheet = zipfile.ZipFile(BytesIO(content)).read("xl/worksheets/sheet1.xml")
+        self.assertEqual(sheet.count(b"<row>"), 3)  # header and two batches
+        # The action names are one small lookup table
+        content = self.assertNoFullScans(
+            lambda: self.export(view_type="ledger", category=1),
+            allow=["inventory_action"],
+        )
+        self.assertEqual(content.decode().count("Amoxicillin"), 3)
+
+    def test_store_stock(self):
+        self.assertNoFullScans(lambda: self.client.get("/inventorystores/"))
+
+    def test_stock_as_of(self):
+        week_ago = (timezone.localdate() - timedelta(days=7)).isoformat()
+        # From today's quantities, which means reading every batch...
+        self.assertNoFullScans(
+            lambda: self.client.get("/inventoryas-of/", {"date": week_ago}),
+            allow=["medicines_batch"],
+        )
+        # ...or from a snapshot and the ledger since, all by index
+        StockMovement.objects.update(created_on=timezone.now() - timedelta(days=30))
+        take_stock_snapshot(timezone.localdate() - timedelta(days=8))
+        self.assertNoFullScans(
+            lambda: self.client.get("/inventoryas-of/", {"date": week_ago})
+        )
+
+
+class KeysetPagingTests(QueryPlanTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        shop = make_sample_stock()
+        # Five batches expiring the same day: pages of three split the tie
+        expiry = timezone.localdate() + timedelta(days=300)
+        for number in range(5):
+            Batch.objects.create(
+                batch_number=f"T{number}",
+                medicine=shop["medicines"][2],
+                initial_quantity=1,
+                current_quantity=1,
+                purchase_price="6.00",
+                sale_price="10.00",
+                expiration_date=expiry,
+                supplier=Supplier.objects.get(name="Medline"),
+            )
+
+    def setUp(self):
+        page_size = mock.patch("inventory.views.PAGE_SIZE", 3)
+        page_size.start()
+        self.addCleanup(page_size.stop)
+        self.batches = Batch.objects.for_store()
+        self.in_order = list(
+            self.batches.order_by("expiration_date", "id").values_list("id", flat=True)
+        )
+
+    def page(self, **cursor):
+        rows, next_cursor = keyset_page(
+            self.batches, "expiration_date", date.fromisoformat, **cursor
+        )
+        return [row.id for row in rows], next_cursor
+
+    def test_ties_across_pages_are_neither_skipped_nor_repeated(self):
+        seen, cursor = self.page(after="")
+        pages = [seen]
+        while cursor:
+            ids, cursor = self.page(after=cursor)
+            pages.append(ids)
+        self.assertEqual([pk for ids in pages for pk in ids], self.in_order)
+        self.assertEqual([len(ids) for ids in pages], [3, 3, 3, 1])
+
+        rows = keyset_rows(self.batches, "expiration_date", size=3)
+        self.assertEqual([row.id for row in rows], self.in_order)
+
+    def test_paging_backwards(self):
+        last = Batch.objects.get(pk=self.in_order[-1])
+        cursor = f"{last.expiration_date.isoformat()}|{last.id}"
+        self.assertNoFullScans(lambda: self.page(after="", before=cursor))
+        pages = []
+        while cursor:
+            ids, cursor = self.page(after="", before=cursor)
+            pages.insert(0, ids)
+        self.assertEqual([pk for ids in pages for pk in ids], self.in_order[:-1])
+        self.assertEqual([len(ids) for ids in pages], [3, 3, 3])
+
+    def test_tampered_cursor_is_rejected(self):
+        for view_type, after in [
+            ("batches", "2026-02-30|1"),
+            ("batches", "no cursor"),
+            ("medicines", "Amoxicillin|1 OR 1=1"),
+            ("reorder", "soon|1"),
+        ]:
+            response = self.client.get(
+                "/inventory", {"view_type": view_type, "after": after}
+            )
+            self.assertEqual(response.status_code, 400, after)
+
+
+class StockAlertTests(QueryPlanTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        shop = make_sample_stock()
+        cls.cetirizine = shop["medicines"][2]
+        today = timezone.localdate()
+        for days in (0, 30, 31, 60, 61, 90, 91):
+            Batch.objects.create(
+                batch_number=f"E{days}",
+                medicine=cls.cetirizine,
+                initial_quantity=1,
+                current_quantity=1,
+                purchase_price="6.00",
+                sale_price="10.00",
+                expiration_date=today + timedelta(days=days),
+                supplier=Supplier.objects.get(name="Medline"),
+            )
+
+    def setUp(self):
+        stock._expiry_checked_on = None
+        self.addCleanup(setattr, stock, "_expiry_checked_on", None)
+
+    def alerts(self):
+        return dict(
+            StockAlert.objects.for_store()
+            .filter(batch__isnull=False)
+            .values_list("batch__batch_number", "kind")
+        )
+
+    def on(self, day):
+        return mock.patch("django.utils.timezone.localdate", return_value=day)
+
+    def test_expiry_buckets_and_low_stock(self):
+        self.assertEqual(
+            self.alerts(),
+            {
+                "B1": StockAlert.EXPIRING_30,
+                "B3": StockAlert.EXPIRED,
+                "E0": StockAlert.EXPIRING_30,
+                "E30": StockAlert.EXPIRING_30,
+                "E31": StockAlert.EXPIRING_60,
+                "E60": StockAlert.EXPIRING_60,
+                "E61": StockAlert.EXPIRING_90,
+                "E90": StockAlert.EXPIRING_90,
+            },
+        )
+        # Azithromycin has 3 sellable, under the default threshold of 10
+        low_stock = StockAlert.objects.for_store().get(kind=StockAlert.LOW_STOCK)
+        self.assertEqual(
+            (low_stock.medicine.name, low_stock.quantity), ("Azithromycin", 3)
+        )
+
+    def test_rollover_expires_batches_and_moves_buckets(self):
+        tomorrow = timezone.localdate() + timedelta(days=1)
+        summary = MedicineStock.objects.for_store().get(medicine=self.cetirizine)
+        with self.on(tomorrow):
+            roll_over_stock(tomorrow)
+        alerts = self.alerts()
+        self.assertEqual(alerts["E0"], StockAlert.EXPIRED)
+        self.assertEqual(alerts["E31"], StockAlert.EXPIRING_30)
+        self.assertEqual(alerts["E61"], StockAlert.EXPIRING_60)
+        self.assertEqual(alerts["E91"], StockAlert.EXPIRING_90)
+        self.assertFalse(
+            StockAlert.objects.for_store().filter(computed_on__lt=tomorrow).exists()
+        )
+        rolled = MedicineStock.objects.for_store().get(medicine=self.cetirizine)
+        self.assertEqual(rolled.sellable_quantity, summary.sellable_quantity - 1)
+        self.assertEqual(rolled.expired_quantity, summary.expired_quantity + 1)
+        self.assertEqual(
+            rolled.earliest_expiry, summary.earliest_expiry + timedelta(30)
+        )
+
+    def test_expired_stock_is_refreshed_once_a_day(self):
+        tomorrow = timezone.localdate() + timedelta(days=1)
+        with mock.patch.object(
+            stock, "roll_over_stock", wraps=stock.roll_over_stock
+        ) as rolled:
+            # Today's alerts are current: checked, nothing to roll over
+            refresh_expired_stock()
+            self.assertEqual(rolled.call_count, 0)
+            with self.assertNumQueries(0):
+                refresh_expired_stock()
+
+            with self.on(tomorrow):
+                refresh_expired_stock()
+                self.assertEqual(rolled.call_count, 1)
+                with self.assertNumQueries(0):
+                    refresh_expired_stock()
+        self.assertEqual(self.alerts()["E0"], StockAlert.EXPIRED)
+
+
+class StockSummaryTests(QueryPlanTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.shop = make_sample_stock()
+
+    def assertSummaryMatchesBatches(self, today):
+        for medicine in self.shop["medicines"]:
+            batches = Batch.objects.for_store().filter(
+                medicine=medicine, is_active=True, current_quantity__gt=0
+            )
+            sellable = batches.filter(expiration_date__gte=today).order_by(
+                "expiration_date", "id"
+            )
+            summary = MedicineStock.objects.for_store().get(medicine=medicine)
+            self.assertEqual(
+                (
+                    summary.sellable_quantity,
+                    summary.expired_quantity,
+                    summary.earliest_expiry,
+                    summary.fefo_batch_id,
+                ),
+                (
+                    sum(batch.current_quantity for batch in sellable),
+                    sum(
+                        batch.current_quantity
+                        for batch in batches.filter(expiration_date__lt=today)
+                    ),
+                    sellable[0].expiration_date if sellable else None,
+                    sellable[0].id if sellable else None,
+                ),
+                medicine.name,
+            )
+
+    def test_summary_follows_sales_receipts_and_expiry(self):
+        today = timezone.localdate()
+        amoxicillin, _, cetirizine = self.shop["medicines"]
+        self.assertSummaryMatchesBatches(today)
+
+        create_invoice(self.shop["staff"], {str(amoxicillin.id): {"quantity": 2}})
+        self.assertSummaryMatchesBatches(today)
+
+        record = {
+            "name": "Cetirizine",
+            "brand": "Cipla",
+            "pack_size": "10",
+            "pack_type": "Strip",
+            "batch_number": "R1",
+            "quantity": "12",
+            "purchase_price": "5.00",
+            "sale_price": "9.00",
+            "expiration_date": (today + timedelta(days=50)).isoformat(),
+        }
+        report = receive_goods([(2, record)], Supplier.objects.get(name="Medline"))
+        self.assertEqual(report["received"], 1)
+        self.assertSummaryMatchesBatches(today)
+
+        # Amoxicillin's earlier batch expires on the 21st day
+        later = today + timedelta(days=21)
+        with mock.patch("django.utils.timezone.localdate", return_value=later):
+            roll_over_stock(later)
+        self.assertSummaryMatchesBatches(later)
+        self.assertEqual(
+            MedicineStock.objects.for_store()
+            .get(medicine=amoxicillin)
+            .expired_quantity,
+            1,
+        )
+        self.assertEqual(
+            MedicineStock.objects.for_store().get(medicine=cetirizine).earliest_expiry,
+            today + timedelta(days=50),
+        )
+
+
+class ForecastTests(SimpleTestCase):
+    def test_steady_and_seasonal_demand(self):
+        # Medicine 0 sells 5 a day all year; medicine 1 sells 2 a day, but
+        # three times that in the coming weeks of past years
+        days = np.arange(1, 731)
+        steady = np.full(days.size, 5.0)
+        seasonal = np.where(
+            ((days - 1) // 7 % 52 >= 48) & ((days - 1) // 7 < 104), 6.0, 2.0
+        )
+        result = forecast(
+            2,
+            np.r_[
+                np.zeros(days.size, dtype=np.int64), np.ones(days.size, dtype=np.int64)
+            ],
+            np.r_[days, days],
+            np.r_[steady, seasonal],
+            lead_times=np.array([7, 7]),
+            sellable=np.array([50, 500]),
+        )
+        self.assertAlmostEqual(result["expected"][0], 5.0)
+        self.assertEqual(result["suggested"][0], 5 * 21 - 50)
+        self.assertAlmostEqual(result["cover"][0], 10.0)
+        # Scaled up by the seasonal factor, capped at twice the recent rate
+        self.assertAlmostEqual(result["expected"][1], 4.0)
+        self.assertEqual(result["suggested"][1], 0)
+
+    def test_new_medicine_has_no_seasonal_factor(self):
+        # Medicine 0's sales reach back two years; medicine 1 was launched
+        # 340 days ago, so last year's coming weeks hold its first sales
+        old, new = np.arange(1, 731), np.arange(1, 341)
+        result = forecast(
+            2,
+            np.r_[
+                np.zeros(old.size, dtype=np.int64), np.ones(new.size, dtype=np.int64)
+            ],
+            np.r_[old, new],
+            np.r_[np.full(old.size, 5.0), np.full(new.size, 3.0)],
+            lead_times=np.array([7, 7]),
+            sellable=np.array([0, 0]),
+        )
+        self.assertAlmostEqual(result["expected"][1], 3.0)
+
+
+class TransferTests(QueryPlanTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.sample = make_sample_stock()
+        cls.branch = Store.objects.create(code="CITY", name="City Branch")
+
+    def test_transfer_writes_paired_movements(self):
+        amoxicillin = self.sample["medicines"][0]
+        batch = Batch.objects.get(batch_number="B0")
+        transfer = transfer_stock(batch, self.branch, 15)
+
+        self.assertEqual(Batch.objects.get(pk=batch.pk).current_quantity, 25)
+        destination = transfer.destination_batch
+        destination.refresh_from_db()
+        self.assertEqual(
+            (destination.store, destination.batch_number, destination.current_quantity),
+            (self.branch, "B0", 15),
+        )
+        # Each store's ledger still adds up to its stock
+        for moved in (batch, destination):
+            ledger = StockMovement.objects.filter(batch=moved).aggregate(
+                total=Sum("quantity")
+            )
+            moved.refresh_from_db()
+            self.assertEqual(ledger["total"], moved.current_quantity)
+
+        # This store sells from its own batches only
+        self.assertEqual(
+            MedicineStock.objects.for_store()
+            .get(medicine=amoxicillin)
+            .sellable_quantity,
+            28,
+        )
+        self.assertEqual(
+            {
+                (code, quantity)
+                for code, _, name, quantity, _ in consolidated_stock()
+                if name == "Amoxicillin"
+            },
+            {("MAIN", 28), ("CITY", 15)},
+        )
+        with self.assertRaises(ValidationError):
+            transfer_stock(batch, self.branch, 100)
+
+    def test_each_store_keeps_its_own_summary(self):
+        amoxicillin = self.sample["medicines"][0]
+        fefo = get_fefo_batch(amoxicillin.pk)
+        transfer = transfer_stock(fefo, self.branch, 2)
+        # The branch refreshing its summary leaves this store's alone
+        refresh_medicine_stock([amoxicillin.pk], self.branch.id)
+
+        here = MedicineStock.objects.for_store().get(medicine=amoxicillin)
+        there = MedicineStock.objects.for_store(self.branch).get(medicine=amoxicillin)
+        self.assertEqual((here.sellable_quantity, here.fefo_batch_id), (41, fefo.pk))
+        self.assertEqual(
+            (there.sellable_quantity, there.fefo_batch_id),
+            (2, transfer.destination_batch_id),
+        )
+        self.assertEqual(get_fefo_batch(amoxicillin.pk), fefo)
+
+
+class ReconcileTests(QueryPlanTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        make_sample_stock()
+
+    def test_fix_adjusts_drift_still_there_when_it_writes(self):
+        batch = Batch.objects.get(batch_number="B0")
+        Batch.objects.filter(pk=batch.pk).update(current_quantity=35)
+        report = reconcile_range(0, 10**9, fix=True)
+        self.assertEqual(
+            (report["drift"], report["adjusted"]),
+            ([(batch.pk, batch.medicine_id, 40, 35)], 1),
+        )
+        # A drift reported before a sale evened it out is not adjusted again
+        self.assertEqual(_adjust([batch.pk]), 0)
+        self.assertEqual(
+            StockMovement.objects.filter(batch=batch).aggregate(total=Sum("quantity"))[
+                "total"
+            ],
+            35,
+        )
+
+
+class GoodsReceiptTests(QueryPlanTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        make_sample_stock()
+
+    def setUp(self):
+        expiry = (timezone.localdate() + timedelta(days=300)).isoformat()
+        line = dict.fromkeys(FIELDS, "")
+        line.update(quantity="10", purchase_price="5.00", sale_price="9.00")
+        line.update(expiration_date=expiry)
+        # Three lines to a chunk: the repeated batch number is in the next one
+        self.lines = [
+            {**line, "barcode": "8901000000011", "batch_number": "R1"},
+            # No barcode: matched by variant, whatever the case
+            {
+                **line,
+                "name": "CETIRIZINE",
+                "brand": "cipla",
+                "pack_size": "10",
+                "pack_type": "STRIP",
+                "batch_number": "R2",
+            },
+            {**line, "barcode": "8901000000028", "batch_number": "R3"},
+            {**line, "barcode": "8901000000011", "batch_number": "R1"},
+            {**line, "barcode": "8901000000028", "batch_number": "R4"},
+            {**line, "barcode": "8901000000028", "batch_number": "R5"},
+            {
+                **line,
+                "barcode": "8901000000028",
+                "batch_number": "R6",
+                "sale_price": "NaN",
+            },
+            {
+                **line,
+                "barcode": "8901000000028",
+                "batch_number": "R7",
+                "purchase_price": "Infinity",
+            },
+        ]
+        self.supplier = Supplier.objects.get(name="Medline")
+        chunk_size = mock.patch("inventory.receipts.CHUNK_SIZE", 3)
+        chunk_size.start()
+        self.addCleanup(chunk_size.stop)
+
+    def receive(self, content, name, **options):
+        records = read_delivery(BytesIO(content.encode()), name)
+        return receive_goods(records, self.supplier, **options)
+
+    def assertReceived(self, report, first_line):
+        self.assertEqual((report["lines"], report["received"]), (8, 5))
+        self.assertEqual(
+            [line for line, _ in report["errors"]],
+            [first_line + 3, first_line + 6, first_line + 7],
+        )
+        self.assertIn("batch R1 of Amoxicillin exists", report["errors"][0][1])
+        self.assertIn("sale_price", report["errors"][1][1])
+        self.assertIn("purchase_price", report["errors"][2][1])
+        self.assertEqual(Batch.objects.filter(batch_number__startswith="R").count(), 5)
+        self.assertEqual(
+            MedicineStock.objects.for_store()
+            .get(medicine__name="Cetirizine")
+            .sellable_quantity,
+            70,
+        )
+
+    def test_csv_delivery(self):
+        content = ",".join(FIELDS) + "\n"
+        content += "".join(
+            ",".join(line[field] for field in FIELDS) + "\n" for line in self.lines
+        )
+        # Header is line 1
+        self.assertReceived(self.receive(content, "d.csv", accept_partial=True), 2)
+
+    def test_json_delivery(self):
+        content = json.dumps(self.lines)
+        # A file with bad lines saves nothing unless asked to
+        report = self.receive(content, "d.json")
+        self.assertEqual((report["saved"], report["received"]), (False, 0))
+        self.assertFalse(Batch.objects.filter(batch_number__startswith="R").exists())
+
+        self.assertReceived(self.receive(content, "d.json", accept_partial=True), 1)
+
+
+class LedgerArchiveTests(QueryPlanTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        shop = make_sample_stock()
+        # Everything so far happened in a closed month...
+        cls.old_day = timezone.localdate() - timedelta(days=70)
+        StockMovement.objects.update(created_on=timezone.now() - timedelta(days=70))
+        # ...and one sale this month
+        create_invoice(shop["staff"], {str(shop["medicines"][2].id): {"quantity": 5}})
+
+    def test_round_trip(self):
+        days = [self.old_day - timedelta(days=1), self.old_day, timezone.localdate()]
+        as_of = [stock_as_of(day) for day in days]
+        ledger = sorted(movement["id"] for movement in movements_between())
+
+        report = archive_closed_months()
+        self.assertEqual(report["archived"], StockMovementArchive.objects.count())
+        self.assertTrue(report["archived"])
+
+        # One opening row per batch, carrying the sum of what was archived
+        archived = dict(
+            StockMovementArchive.objects.values("batch_id")
+            .annotate(total=Sum("quantity"))
+            .values_list("batch_id", "total")
+        )
+        openings = dict(
+            StockMovement.objects.filter(action__name=OPENING).values_list(
+                "batch_id", "quantity"
+            )
+        )
+        self.assertEqual(
+            openings, {batch: total for batch, total in archived.items() if total}
+        )
+
+        # The ledger still reads the same, archive included...
+        self.assertEqual(
+            sorted(movement["id"] for movement in movements_between()), ledger
+        )
+        # ...adds up to the stock on hand...
+        self.assertEqual(reconcile_stock()["drift"], [])
+        # ...and gives the same stock on any past day
+        self.assertEqual([stock_as_of(day) for day in days], as_of)
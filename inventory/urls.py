@@ -3,4 +3,8 @@ from . import views
 
 urlpatterns = [
     path("", views.inventory_list, name="inventory_list"),
+    path("receipt/", views.goods_receipt, name="goods_receipt"),
+    path("as-of/", views.stock_as_of_view, name="stock_as_of"),
+    path("export/", views.inventory_export, name="inventory_export"),
+    path("stores/", views.store_stock_view, name="store_stock"),
 ]
@@ -1,73 +1,228 @@
+from datetime import date, timedelta
+
+from django.http import HttpResponseBadRequest, StreamingHttpResponse
 from django.shortcuts import render
-from django.db.models import Sum, Q
+from django.db.models import F, FilteredRelation, Q
+from django.db.models.functions import Coalesce
 from django.utils import timezone
-from medicines.models import Medicine, Batch, Category
+from medicines.models import Medicine, Batch, Category, Supplier, current_store_id
+from medicines.search import medicine_search_q
+from pharmacy_project.streaming import CSV_TYPE, XLSX_TYPE, stream_csv, stream_xlsx
+from .exports import CHUNK_SIZE, EXPORTS, LEDGER_COLUMNS, ledger_rows
+from .ledger import start_of_day
+from .models import ReorderSuggestion, StockAlert
+from .receipts import read_delivery, receive_goods
+from .snapshots import end_of_day, stock_as_of, stock_rows
+from .stores import consolidated_stock
+from .stock import refresh_expired_stock
 
 
-def inventory_list(request):
+PAGE_SIZE = 50
+AS_OF_PREVIEW = 200  # rows shown on the stock-as-of page; the CSV has all
+
+
+# Partial each tab renders, and the (field, cursor parser) it is ordered by
+TEMPLATES = {
+    "medicines": "inventory/partials/table_medicines.html",
+    "batches": "inventory/partials/table_batches.html",
+    "alerts": "inventory/partials/table_batches.html",  # Reuse batch table layout
+    "reorder": "inventory/partials/table_reorder.html",
+}
+SORT_KEYS = {
+    "medicines": ("name", str),
+    "batches": ("expiration_date", date.fromisoformat),
+    "alerts": ("expiration_date", date.fromisoformat),
+    "reorder": ("days_of_cover", float),
+}
+
+
+def _past(queryset, sort_field, key, last_id):
+    # Same as (sort_field, id) > (key, last_id), in a form that keeps the
+    # index range on sort_field
+    return queryset.filter(
+        Q(**{f"{sort_field}__gt": key}) | Q(id__gt=last_id),
+        **{f"{sort_field}__gte": key},
+    )
+
+
+def _before(queryset, sort_field, key, first_id):
+    # Same as (sort_field, id) < (key, first_id), mirroring _past
+    return queryset.filter(
+        Q(**{f"{sort_field}__lt": key}) | Q(id__lt=first_id),
+        **{f"{sort_field}__lte": key},
+    )
+
+
+def _cursor(row, sort_field):
+    key = getattr(row, sort_field)
+    if isinstance(key, date):
+        key = key.isoformat()
+    return f"{key}|{row.id}"
+
+
+def keyset_page(queryset, sort_field, parse_key, after, before=""):
+    """
+    One page of `queryset` ordered by (sort_field, id), starting after the
+    cursor "<sort key>|<id>" of the previous page's last row. Every page is
+    an index range read, so it costs the same however deep it is.
+    Returns (rows, cursor of the next page or None).
+
+    Given `before`, the cursor of a page's first row, it pages backwards:
+    the rows just before that one, still in ascending order, and the cursor
+    of the page before them (None at the start).
+    Raises ValueError for a malformed cursor.
+    """
+    if before:
+        key, first_id = before.rsplit("|", 1)
+        rows = list(
+            _before(queryset, sort_field, parse_key(key), int(first_id)).order_by(
+                f"-{sort_field}", "-id"
+            )[: PAGE_SIZE + 1]
+        )
+        if len(rows) <= PAGE_SIZE:
+            return rows[::-1], None
+        rows = rows[:PAGE_SIZE][::-1]
+        return rows, _cursor(rows[0], sort_field)
+
+    queryset = queryset.order_by(sort_field, "id")
+    if after:
+        key, last_id = after.rsplit("|", 1)
+        queryset = _past(queryset, sort_field, parse_key(key), int(last_id))
+    rows = list(queryset[: PAGE_SIZE + 1])
+    if len(rows) <= PAGE_SIZE:
+        return rows, None
+    rows = rows[:PAGE_SIZE]
+    return rows, _cursor(rows[-1], sort_field)
+
+
+def keyset_rows(queryset, sort_field, size=CHUNK_SIZE):
+    """
+    Every row of `queryset` in (sort_field, id) order, read `size` rows at a
+    time. Each chunk is its own short query continuing from the last row,
+    so memory stays flat and no read stays open between chunks.
+    """
+    queryset = queryset.order_by(sort_field, "id")
+    chunk = list(queryset[:size])
+    while chunk:
+        yield from chunk
+        if len(chunk) < size:
+            break
+        last = chunk[-1]
+        chunk = list(
+            _past(queryset, sort_field, getattr(last, sort_field), last.id)[:size]
+        )
+
+
+def inventory_items(params):
+    """
+    The rows of an inventory tab for the query `params` (view_type, search,
+    category, status), unordered. Returns (view_type, queryset); the list
+    pages it and the exports stream all of it.
+    """
     # 1. Get Parameters
-    view_type = request.GET.get("view_type", "medicines")  # Default to 'medicines'
-    search_query = request.GET.get("search", "").strip()
-    category_filter = request.GET.get("category", "")
-    status_filter = request.GET.get("status", "")
+    view_type = params.get("view_type", "medicines")  # Default to 'medicines'
+    search_query = params.get("search", "").strip()
+    category_filter = params.get("category", "")
+    status_filter = params.get("status", "")
 
     today = timezone.now().date()
 
-    # 2. Base QuerySets (Optimized with select_related)
-    medicines_qs = (
-        Medicine.objects.select_related("brand", "category", "pack_type")
-        .all()
-        .order_by("name")
+    # 2. Base QuerySets (select_related, and only the columns the partials render)
+    medicines_qs = Medicine.objects.select_related(
+        "brand", "category", "pack_type"
+    ).only(
+        "name",
+        "strength",
+        "pack_size",
+        "is_active",
+        "brand__name",
+        "category__name",
+        "pack_type__name",
     )
     batches_qs = (
-        Batch.objects.select_related("medicine", "supplier")
-        .all()
-        .order_by("expiration_date")
+        Batch.objects.for_store()
+        .select_related("medicine", "medicine__brand", "supplier")
+        .only(
+            "batch_number",
+            "expiration_date",
+            "current_quantity",
+            "sale_price",
+            "medicine__name",
+            "medicine__brand__name",
+            "supplier__name",
+        )
     )
 
     # 3. Determine Data & Template based on View Type
-    items = []
-    # Default template is the medicine list
-    template_name = "inventory/partials/table_medicines.html"
-
     if view_type == "batches":
-        template_name = "inventory/partials/table_batches.html"
         items = batches_qs
 
         # Search Batches (Batch Number OR Medicine Name)
         if search_query:
             items = items.filter(
                 Q(batch_number__icontains=search_query)
-                | Q(medicine__name__icontains=search_query)
+                | medicine_search_q(search_query, prefix="medicine__")
             )
         # Filter Batches by Category (via Medicine relationship)
         if category_filter:
             items = items.filter(medicine__category__id=category_filter)
 
     elif view_type == "alerts":
-        template_name = (
-            "inventory/partials/table_batches.html"  # Reuse batch table layout
-        )
-        # Alerts: Low Stock (<10) OR Expired
+        # Alerts from the snapshot: batches expired or expiring within 90
+        # days, and the sellable batches of medicines below their threshold
+        refresh_expired_stock()
+        alerts = StockAlert.objects.for_store()
         items = batches_qs.filter(
-            Q(current_quantity__lte=10) | Q(expiration_date__lt=today)
+            Q(id__in=alerts.filter(batch__isnull=False).values("batch_id"))
+            | Q(
+                medicine_id__in=alerts.filter(kind=StockAlert.LOW_STOCK).values(
+                    "medicine_id"
+                ),
+                is_active=True,
+                current_quantity__gt=0,
+                expiration_date__gte=today,
+            )
+        )
+        if search_query:
+            items = items.filter(medicine_search_q(search_query, prefix="medicine__"))
+
+    elif view_type == "reorder":
+        # Written nightly by the suggest_reorders command
+        items = (
+            ReorderSuggestion.objects.for_store()
+            .select_related("medicine", "supplier")
+            .only(
+                "sellable_quantity",
+                "forecast_daily_demand",
+                "lead_time_days",
+                "days_of_cover",
+                "suggested_quantity",
+                "medicine__name",
+                "medicine__strength",
+                "supplier__name",
+            )
         )
         if search_query:
-            items = items.filter(medicine__name__icontains=search_query)
+            items = items.filter(medicine_search_q(search_query, prefix="medicine__"))
+        if category_filter:
+            items = items.filter(medicine__category__id=category_filter)
 
     else:
         # Default: 'medicines' (Master List)
-        template_name = "inventory/partials/table_medicines.html"
-
         # We assume 'medicines' if view_type is unknown
-        # Calculate Total Stock by summing batches
-        items = medicines_qs.annotate(total_stock=Sum("batches__current_quantity"))
+        view_type = "medicines"
+        # Total Stock is the sellable quantity from the stock summary table
+        refresh_expired_stock()
+        items = medicines_qs.annotate(
+            store_stock=FilteredRelation(
+                "stocks", condition=Q(stocks__store_id=current_store_id())
+            ),
+            total_stock=Coalesce(F("store_stock__sellable_quantity"), 0),
+        )
 
-        # Search Medicines (Name OR Brand)
+        # Search Medicines (Name, Strength, Brand OR Barcode) via the full-text index
         if search_query:
-            items = items.filter(
-                Q(name__icontains=search_query) | Q(brand__name__icontains=search_query)
-            )
+            items = items.filter(medicine_search_q(search_query))
         # Filter Medicines by Category
         if category_filter:
             items = items.filter(category__id=category_filter)
@@ -75,19 +230,210 @@ def inventory_list(request):
     # 4. Common Status Filter (Applies to all views)
     if status_filter:
         is_active = True if status_filter == "active" else False
-        items = items.filter(is_active=is_active)
+        if view_type == "reorder":
+            items = items.filter(medicine__is_active=is_active)
+        else:
+            items = items.filter(is_active=is_active)
+
+    return view_type, items
+
 
-    # 5. Prepare Context
+def inventory_list(request):
+    after = request.GET.get("after", "")  # cursor of the page to continue from
+    view_type, items = inventory_items(request.GET)
+    template_name = TEMPLATES[view_type]
+    today = timezone.now().date()
+
+    # 5. One page, medicines by name, batches by expiry and reorders by
+    # how soon they run out
+    try:
+        items, next_cursor = keyset_page(items, *SORT_KEYS[view_type], after)
+    except ValueError:
+        return HttpResponseBadRequest("Invalid page cursor")
+
+    next_query = None
+    if next_cursor:
+        next_query = request.GET.copy()
+        next_query["after"] = next_cursor
+        next_query = next_query.urlencode()
+
+    # 6. Prepare Context
     context = {
         "items": items,
         "view_type": view_type,
         "today": today,
-        "categories": Category.objects.all(),
+        "next_query": next_query,
+        "is_first_page": not after,
     }
 
-    # 6. HTMX Response: Return ONLY the SPECIFIC partial file
+    # 7. Later pages only append rows (the scroll sentinel asked for them)
+    if after:
+        rows_template = template_name.replace("table_", "rows_")
+        return render(request, rows_template, context)
+
+    # 8. HTMX Response: Return ONLY the SPECIFIC partial file
     if request.headers.get("HX-Request"):
         return render(request, template_name, context)
 
-    # 7. Full Page Response: Load main page (which includes the default partial)
+    context["categories"] = Category.objects.all()
+
+    # 9. Full Page Response: Load main page (which includes the default partial)
     return render(request, "inventory/inventory_list.html", context)
+
+
+def goods_receipt(request):
+    context = {"suppliers": Supplier.objects.order_by("name")}
+    if request.method == "POST":
+        upload = request.FILES.get("delivery")
+        supplier = Supplier.objects.filter(id=request.POST.get("supplier") or 0).first()
+        if upload is None or supplier is None:
+            context["message"] = "Choose a supplier and a delivery file."
+        else:
+            context["selected_supplier"] = supplier.id
+            context["report"] = receive_goods(
+                read_delivery(upload, upload.name),
+                supplier,
+                accept_partial=bool(request.POST.get("accept_partial")),
+            )
+    return render(request, "inventory/goods_receipt.html", context)
+
+
+STOCK_COLUMNS = [
+    "batch_id",
+    "medicine",
+    "hsn_code",
+    "batch_number",
+    "expiration_date",
+    "quantity",
+    "purchase_price",
+    "value",
+]
+
+
+def _stock_csv_rows(quantities):
+    for batch, quantity in stock_rows(quantities):
+        yield [
+            batch.id,
+            batch.medicine.name,
+            batch.medicine.hsn_code,
+            batch.batch_number,
+            batch.expiration_date.isoformat(),
+            quantity,
+            batch.purchase_price,
+            batch.purchase_price * quantity,
+        ]
+
+
+def stock_as_of_view(request):
+    yesterday = timezone.localdate() - timedelta(days=1)
+    try:
+        day = date.fromisoformat(request.GET.get("date") or yesterday.isoformat())
+    except ValueError:
+        return HttpResponseBadRequest("Give the date as YYYY-MM-DD.")
+    if day > timezone.localdate():
+        return HttpResponseBadRequest("The date can't be in the future.")
+
+    quantities = stock_as_of(day)
+
+    if request.GET.get("format") == "csv":
+        response = StreamingHttpResponse(
+            stream_csv(STOCK_COLUMNS, _stock_csv_rows(quantities)),
+            content_type=CSV_TYPE,
+        )
+        response["Content-Disposition"] = (
+            f'attachment; filename="stock-{day.isoformat()}.csv"'
+        )
+        return response
+
+    preview = dict(sorted(quantities.items())[:AS_OF_PREVIEW])
+    context = {
+        "day": day,
+        "rows": list(stock_rows(preview)),
+        "batch_count": len(quantities),
+        "total_units": sum(quantities.values()),
+        "truncated": len(quantities) > AS_OF_PREVIEW,
+    }
+    return render(request, "inventory/stock_as_of.html", context)
+
+
+def _ledger_filters(params):
+    # This store's rows, with the medicine filters of the inventory screen
+    filters = {"store_id": current_store_id()}
+    search_query = params.get("search", "").strip()
+    if search_query:
+        filters["medicine_id__in"] = Medicine.objects.filter(
+            medicine_search_q(search_query)
+        ).values("id")
+    if params.get("category"):
+        filters["medicine__category_id"] = params["category"]
+    if params.get("status"):
+        filters["medicine__is_active"] = params["status"] == "active"
+    return filters
+
+
+# Everything an inventory tab would list (same filters), or the stock ledger
+# (view_type=ledger, optional from/to dates), streamed as CSV or .xlsx
+def inventory_export(request):
+    fmt = request.GET.get("format", "csv")
+    if fmt not in ("csv", "xlsx"):
+        return HttpResponseBadRequest("Format must be csv or xlsx.")
+
+    if request.GET.get("view_type") == "ledger":
+        view_type = "ledger"
+        try:
+            date_from = request.GET.get("from")
+            date_to = request.GET.get("to")
+            start = start_of_day(date.fromisoformat(date_from)) if date_from else None
+            end = end_of_day(date.fromisoformat(date_to)) if date_to else None
+        except ValueError:
+            return HttpResponseBadRequest("Give from and to dates as YYYY-MM-DD.")
+        header = LEDGER_COLUMNS
+        rows = ledger_rows(start, end, **_ledger_filters(request.GET))
+    else:
+        view_type, items = inventory_items(request.GET)
+        header, row = EXPORTS[view_type]
+        # Every column of the rows and their related objects, not only the
+        # ones the table shows
+        items = items.defer(None)
+        rows = map(row, keyset_rows(items, SORT_KEYS[view_type][0]))
+
+    if fmt == "xlsx":
+        content = stream_xlsx(header, rows, sheet=view_type.title())
+        content_type = XLSX_TYPE
+    else:
+        content = stream_csv(header, rows)
+        content_type = CSV_TYPE
+    response = StreamingHttpResponse(content, content_type=content_type)
+    response["Content-Disposition"] = (
+        f'attachment; filename="{view_type}-{timezone.localdate():%Y-%m-%d}.{fmt}"'
+    )
+    return response
+
+
+STORE_STOCK_COLUMNS = ["store_code", "store", "medicine", "quantity", "value"]
+
+
+# Head office: sellable stock of every store, per store and (in the CSV)
+# per medicine
+def store_stock_view(request):
+    rows = consolidated_stock()
+    if request.GET.get("format") == "csv":
+        response = StreamingHttpResponse(
+            stream_csv(STORE_STOCK_COLUMNS, rows), content_type=CSV_TYPE
+        )
+        response["Content-Disposition"] = (
+            f'attachment; filename="store-stock-{timezone.localdate():%Y-%m-%d}.csv"'
+        )
+        return response
+
+    stores = {}
+    for code, name, _, quantity, value in rows:
+        store = stores.setdefault(
+            code, {"code": code, "name": name, "medicines": 0, "units": 0, "value": 0}
+        )
+        store["medicines"] += 1
+        store["units"] += quantity
+        store["value"] += value
+    return render(
+        request, "inventory/store_stock.html", {"stores": list(stores.values())}
+    )
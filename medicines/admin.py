@@ -1,5 +1,7 @@
 from django.contrib import admin
-from .models import Medicine, Brand, PackType, Category, Supplier, Batch
+from django.db.models import Q
+from .models import Medicine, Brand, PackType, Category, Supplier, Batch, Store
+from .search import medicine_search_q
 # Register your models here.
 
 
@@ -26,6 +28,12 @@ class MedicineAdmin(admin.ModelAdmin):
 
     display_name.short_description = "Medicine"  # Column header in admin
 
+    # Search through the full-text index instead of icontains on every field
+    def get_search_results(self, request, queryset, search_term):
+        if not search_term:
+            return super().get_search_results(request, queryset, search_term)
+        return queryset.filter(medicine_search_q(search_term)), False
+
 
 @admin.register(Brand)
 class BrandAdmin(admin.ModelAdmin):
@@ -54,11 +62,17 @@ class SupplierAdmin(admin.ModelAdmin):
     search_fields = ("name",)
 
 
+@admin.register(Store)
+class StoreAdmin(admin.ModelAdmin):
+    list_display = ("code", "name", "is_active")
+
+
 @admin.register(Batch)
 class BatchAdmin(admin.ModelAdmin):
     list_display = (
         "medicine",
         "batch_number",
+        "store",
         "is_expired",
     )
     search_fields = (
@@ -66,4 +80,13 @@ class BatchAdmin(admin.ModelAdmin):
         "medicine__name",
         "supplier__name",
     )
-    list_filter = ("is_active",)
+    list_filter = ("is_active", "store")
+
+    def get_search_results(self, request, queryset, search_term):
+        if not search_term:
+            return super().get_search_results(request, queryset, search_term)
+        return queryset.filter(
+            Q(batch_number__icontains=search_term)
+            | Q(supplier__name__icontains=search_term)
+            | medicine_search_q(search_term, prefix="medicine__")
+        ), False
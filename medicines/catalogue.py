@@ -0,0 +1,245 @@
+import time
+from decimal import Decimal, InvalidOperation
+
+from django.db import transaction
+from django.utils import timezone
+
+from inventory.stock import refresh_medicine_stock
+
+from .models import Brand, Category, Medicine, PackType, Store
+from .signals import notify_batches_changed
+
+CHUNK_SIZE = 2000
+
+# Medicine columns a catalogue line sets, besides the barcode
+FIELDS = [
+    "name",
+    "brand_id",
+    "category_id",
+    "strength",
+    "pack_size",
+    "pack_type_id",
+    "hsn_code",
+    "gst_percent",
+    "is_active",
+]
+
+
+class _Lookup:
+    """Name -> id of a small lookup table, loaded once, extended as needed."""
+
+    def __init__(self, model):
+        self.model = model
+        self.ids = {
+            name.lower(): pk for pk, name in model.objects.values_list("pk", "name")
+        }
+
+    def resolve(self, names):
+        # Create the names not seen yet in one statement, then fetch their ids.
+        # Names match case-insensitively: the first spelling seen is kept.
+        missing = {}
+        for name in names:
+            if name and name.lower() not in self.ids:
+                missing.setdefault(name.lower(), name)
+        if missing:
+            self.model.objects.bulk_create(
+                [self.model(name=name) for name in missing.values()],
+                ignore_conflicts=True,
+            )
+            for pk, name in self.model.objects.filter(
+                name__in=missing.values()
+            ).values_list("pk", "name"):
+                self.ids[name.lower()] = pk
+
+    def get(self, name):
+        return self.ids.get(name.lower()) if name else None
+
+
+def _clean(record):
+    def text(field):
+        return str(record.get(field) or "").strip()
+
+    row = {
+        "barcode": text("barcode") or None,
+        "name": text("name"),
+        "brand": text("brand"),
+        "category": text("category"),
+        "strength": text("strength") or None,
+        "pack_type": text("pack_type"),
+        "hsn_code": text("hsn_code"),
+        "is_active": text("is_active").lower() not in ("0", "false", "no"),
+    }
+    errors = []
+    for field in ("name", "pack_type", "hsn_code"):
+        if not row[field]:
+            errors.append(f"{field} is required")
+    try:
+        row["pack_size"] = int(text("pack_size"))
+        if row["pack_size"] <= 0:
+            raise ValueError
+    except ValueError:
+        errors.append("pack_size must be a positive whole number")
+    try:
+        row["gst_percent"] = Decimal(text("gst_percent") or "0").quantize(
+            Decimal("0.01")
+        )
+        if not 0 <= row["gst_percent"] < 100:
+            raise InvalidOperation
+    except InvalidOperation:
+        errors.append("gst_percent must be between 0 and 100")
+    return row, errors
+
+
+def _variant_key(values):
+    # What unique_medicine_variant_if_no_barcode compares
+    return (
+        values["name"],
+        values["brand_id"],
+        values["strength"] or None,
+        values["pack_size"],
+        values["pack_type_id"],
+    )
+
+
+def _upsert_chunk(chunk, lookups, result):
+    rows = []
+    for line_no, record in chunk:
+        if not isinstance(record, dict):
+            result["errors"].append((line_no, "record is not an object"))
+            continue
+        row, errors = _clean(record)
+        if errors:
+            result["errors"].append((line_no, "; ".join(errors)))
+        else:
+            rows.append(row)
+
+    brands, categories, pack_types = lookups
+    brands.resolve(row["brand"] for row in rows)
+    categories.resolve(row["category"] for row in rows)
+    pack_types.resolve(row["pack_type"] for row in rows)
+
+    # Last line wins when the file lists the same medicine twice
+    by_barcode = {}
+    by_variant = {}
+    for row in rows:
+        values = {
+            "name": row["name"],
+            "brand_id": brands.get(row["brand"]),
+            "category_id": categories.get(row["category"]),
+            "strength": row["strength"],
+            "pack_size": row["pack_size"],
+            "pack_type_id": pack_types.get(row["pack_type"]),
+            "hsn_code": row["hsn_code"],
+            "gst_percent": row["gst_percent"],
+            "is_active": row["is_active"],
+        }
+        if row["barcode"]:
+            by_barcode[row["barcode"]] = values
+        else:
+            by_variant[_variant_key(values)] = values
+
+    existing_barcodes = {
+        values["barcode"]: values
+        for values in Medicine.objects.filter(barcode__in=by_barcode).values(
+            "id", "barcode", *FIELDS
+        )
+    }
+    # Barcode-less medicines, for variant lines and for barcode lines that
+    # give an existing medicine its first barcode
+    existing_variants = {
+        _variant_key(values): values
+        for values in Medicine.objects.filter(
+            barcode__isnull=True,
+            name__in={values["name"] for values in by_barcode.values()}
+            | {key[0] for key in by_variant},
+        ).values("id", *FIELDS)
+    }
+
+    now = timezone.now()
+    inserts = []
+    updates = []
+    for barcode, values in by_barcode.items():
+        current = existing_barcodes.get(barcode)
+        if current is None:
+            current = existing_variants.pop(_variant_key(values), None)
+            if current is None:
+                inserts.append(Medicine(barcode=barcode, **values))
+            else:
+                updates.append(
+                    Medicine(
+                        id=current["id"], barcode=barcode, updated_at=now, **values
+                    )
+                )
+        elif any(current[field] != values[field] for field in FIELDS):
+            updates.append(
+                Medicine(id=current["id"], barcode=barcode, updated_at=now, **values)
+            )
+        else:
+            result["unchanged"] += 1
+    for key, values in by_variant.items():
+        current = existing_variants.get(key)
+        if current is None:
+            inserts.append(Medicine(**values))
+        elif any(current[field] != values[field] for field in FIELDS):
+            updates.append(Medicine(id=current["id"], updated_at=now, **values))
+        else:
+            result["unchanged"] += 1
+
+    with transaction.atomic():
+        # A barcode inserted concurrently since the lookup becomes an update
+        # instead of failing the chunk. The variant index is partial, which
+        # ON CONFLICT can't target, so variant lines rely on the lookup.
+        Medicine.objects.bulk_create(
+            [medicine for medicine in inserts if medicine.barcode],
+            update_conflicts=True,
+            unique_fields=["barcode"],
+            update_fields=[*FIELDS, "updated_at"],
+        )
+        Medicine.objects.bulk_create(
+            [medicine for medicine in inserts if not medicine.barcode]
+        )
+        Medicine.objects.bulk_update(updates, ["barcode", *FIELDS, "updated_at"])
+        changed = {medicine.id for medicine in [*inserts, *updates] if medicine.id}
+        # Bulk writes send no post_save, so the stock summaries and alerts a
+        # new line needs, or an edited threshold or active flag changes, are
+        # refreshed here, in every store
+        for store_id in Store.objects.values_list("id", flat=True):
+            refresh_medicine_stock(changed, store_id)
+        notify_batches_changed(changed)
+    result["inserted"] += len(inserts)
+    result["updated"] += len(updates)
+
+
+def upsert_catalogue(records):
+    """
+    Insert or update a Medicine for every line of a catalogue file, matched
+    on barcode or, for lines without one, on the variant key. `records`
+    yields (line number, dict) pairs; they are handled CHUNK_SIZE at a time,
+    each chunk in its own transaction. Brands, categories and pack types are
+    kept in memory and missing ones created in bulk.
+
+    Returns a report: lines, inserted, updated, unchanged, errors
+    [(line, message)], seconds and lines_per_second.
+    """
+    started = time.perf_counter()
+    result = {"lines": 0, "inserted": 0, "updated": 0, "unchanged": 0, "errors": []}
+    lookups = (_Lookup(Brand), _Lookup(Category), _Lookup(PackType))
+    chunk = []
+    try:
+        for record in records:
+            chunk.append(record)
+            if len(chunk) >= CHUNK_SIZE:
+                _upsert_chunk(chunk, lookups, result)
+                result["lines"] += len(chunk)
+                chunk = []
+    except ValueError as exc:
+        result["errors"].append((None, f"Could not read the file: {exc}"))
+    if chunk:
+        _upsert_chunk(chunk, lookups, result)
+        result["lines"] += len(chunk)
+
+    result["seconds"] = time.perf_counter() - started
+    result["lines_per_second"] = (
+        result["lines"] / result["seconds"] if result["seconds"] else 0
+    )
+    return result
@@ -0,0 +1,33 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from inventory.receipts import read_delivery
+from medicines.catalogue import upsert_catalogue
+
+
+class Command(BaseCommand):
+    help = (
+        "Insert or update medicines from a distributor's catalogue file (CSV "
+        "or JSON), matched on barcode or on the variant key."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="Catalogue file (.csv, .json, .jsonl).")
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        with open(options["path"], "rb") as catalogue:
+            report = upsert_catalogue(read_delivery(catalogue, options["path"]))
+
+        for line, error in report["errors"]:
+            self.stderr.write(f"line {line or '-'}: {error}")
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"{report['lines']} lines: {report['inserted']} inserted, "
+                f"{report['updated']} updated, {report['unchanged']} unchanged, "
+                f"{len(report['errors'])} failed in "
+                f"{time.perf_counter() - started:.2f}s "
+                f"({report['lines_per_second']:.0f} lines/s)"
+            )
+        )
@@ -0,0 +1,23 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from medicines.search import has_search_index, rebuild_search_index
+
+
+class Command(BaseCommand):
+    help = "Rebuild the full-text medicine search index from the catalogue."
+
+    def handle(self, *args, **options):
+        if not has_search_index():
+            raise CommandError("The medicine search index needs an SQLite database.")
+
+        started = time.perf_counter()
+        with transaction.atomic():
+            count = rebuild_search_index()
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Indexed {count} medicines in {time.perf_counter() - started:.2f}s"
+            )
+        )
@@ -0,0 +1,84 @@
+# Full-text index over the medicine catalogue (SQLite FTS5), kept in sync by
+# triggers so bulk writes that skip model signals are covered too.
+
+from django.db import migrations
+
+CREATE_SQL = [
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS medicines_medicine_fts USING fts5(
+        name, strength, brand, barcode,
+        tokenize = "unicode61 remove_diacritics 2"
+    )
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS medicines_medicine_fts_insert
+    AFTER INSERT ON medicines_medicine BEGIN
+        INSERT INTO medicines_medicine_fts (rowid, name, strength, brand, barcode)
+        VALUES (
+            new.id, new.name, new.strength,
+            (SELECT name FROM medicines_brand WHERE id = new.brand_id),
+            new.barcode
+        );
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS medicines_medicine_fts_update
+    AFTER UPDATE OF name, strength, brand_id, barcode ON medicines_medicine BEGIN
+        DELETE FROM medicines_medicine_fts WHERE rowid = old.id;
+        INSERT INTO medicines_medicine_fts (rowid, name, strength, brand, barcode)
+        VALUES (
+            new.id, new.name, new.strength,
+            (SELECT name FROM medicines_brand WHERE id = new.brand_id),
+            new.barcode
+        );
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS medicines_medicine_fts_delete
+    AFTER DELETE ON medicines_medicine BEGIN
+        DELETE FROM medicines_medicine_fts WHERE rowid = old.id;
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS medicines_brand_fts_update
+    AFTER UPDATE OF name ON medicines_brand BEGIN
+        UPDATE medicines_medicine_fts SET brand = new.name
+        WHERE rowid IN (SELECT id FROM medicines_medicine WHERE brand_id = new.id);
+    END
+    """,
+    """
+    INSERT INTO medicines_medicine_fts (rowid, name, strength, brand, barcode)
+    SELECT m.id, m.name, m.strength, b.name, m.barcode
+    FROM medicines_medicine m LEFT JOIN medicines_brand b ON b.id = m.brand_id
+    """,
+]
+
+DROP_SQL = [
+    "DROP TRIGGER IF EXISTS medicines_brand_fts_update",
+    "DROP TRIGGER IF EXISTS medicines_medicine_fts_delete",
+    "DROP TRIGGER IF EXISTS medicines_medicine_fts_update",
+    "DROP TRIGGER IF EXISTS medicines_medicine_fts_insert",
+    "DROP TABLE IF EXISTS medicines_medicine_fts",
+]
+
+
+def run_on_sqlite(statements):
+    def run(apps, schema_editor):
+        # Other databases fall back to icontains search (see medicines.search)
+        if schema_editor.connection.vendor != "sqlite":
+            return
+        for statement in statements:
+            schema_editor.execute(statement)
+
+    return run
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("medicines", "0002_supplier_batch"),
+    ]
+
+    operations = [
+        migrations.RunPython(run_on_sqlite(CREATE_SQL), run_on_sqlite(DROP_SQL)),
+    ]
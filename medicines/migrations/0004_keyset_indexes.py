@@ -0,0 +1,23 @@
+# Generated by Django 5.2.10 on 2026-10-17 23:06
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("medicines", "0003_medicine_search_index"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="batch",
+            index=models.Index(
+                fields=["expiration_date", "id"], name="batch_expiry_id_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="medicine",
+            index=models.Index(fields=["name", "id"], name="medicine_name_id_idx"),
+        ),
+    ]
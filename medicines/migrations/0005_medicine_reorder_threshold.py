@@ -0,0 +1,31 @@
+# Generated by Django 5.2.10 on 2026-10-17 23:15
+
+from importlib import import_module
+
+from django.db import migrations, models
+
+# SQLite adds the column by rebuilding medicines_medicine, which the
+# full-text triggers reference: drop them around the rebuild. The index
+# table itself keeps its rows, as ids don't change.
+search_index = import_module("medicines.migrations.0003_medicine_search_index")
+TRIGGER_SQL = [sql for sql in search_index.CREATE_SQL if "CREATE TRIGGER" in sql]
+DROP_TRIGGER_SQL = [sql for sql in search_index.DROP_SQL if "DROP TRIGGER" in sql]
+drop_triggers = search_index.run_on_sqlite(DROP_TRIGGER_SQL)
+create_triggers = search_index.run_on_sqlite(TRIGGER_SQL)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("medicines", "0004_keyset_indexes"),
+    ]
+
+    operations = [
+        migrations.RunPython(drop_triggers, create_triggers),
+        migrations.AddField(
+            model_name="medicine",
+            name="reorder_threshold",
+            field=models.PositiveIntegerField(default=10),
+        ),
+        migrations.RunPython(create_triggers, drop_triggers),
+    ]
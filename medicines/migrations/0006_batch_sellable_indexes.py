@@ -0,0 +1,29 @@
+# Generated by Django 5.2.10 on 2026-10-17 23:17
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("medicines", "0005_medicine_reorder_threshold"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="batch",
+            index=models.Index(
+                condition=models.Q(("current_quantity__gt", 0), ("is_active", True)),
+                fields=["medicine", "expiration_date", "id"],
+                name="batch_sellable_fefo_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="batch",
+            index=models.Index(
+                condition=models.Q(("current_quantity__gt", 0), ("is_active", True)),
+                fields=["expiration_date"],
+                name="batch_sellable_expiry_idx",
+            ),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.10 on 2026-10-17 23:26
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("medicines", "0006_batch_sellable_indexes"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="supplier",
+            name="lead_time_days",
+            field=models.PositiveIntegerField(default=7),
+        ),
+    ]
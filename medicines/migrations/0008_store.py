@@ -0,0 +1,98 @@
+# Generated by Django 5.2.10 on 2026-10-17 23:39
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+import medicines.models
+
+
+def create_current_store(apps, schema_editor):
+    # Existing batches (and invoices and movements) belong to this install
+    Store = apps.get_model("medicines", "Store")
+    Store.objects.get_or_create(
+        code=settings.POS_STORE_CODE, defaults={"name": settings.POS_STORE_CODE}
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("medicines", "0007_supplier_lead_time_days"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="Store",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("code", models.CharField(max_length=20, unique=True)),
+                ("name", models.CharField(max_length=100)),
+                ("is_active", models.BooleanField(default=True)),
+            ],
+        ),
+        migrations.RunPython(create_current_store, migrations.RunPython.noop),
+        migrations.RemoveConstraint(
+            model_name="batch",
+            name="unique_by_medicine_with_batch_number",
+        ),
+        migrations.RemoveIndex(
+            model_name="batch",
+            name="batch_expiry_id_idx",
+        ),
+        migrations.RemoveIndex(
+            model_name="batch",
+            name="batch_sellable_fefo_idx",
+        ),
+        migrations.RemoveIndex(
+            model_name="batch",
+            name="batch_sellable_expiry_idx",
+        ),
+        migrations.AddField(
+            model_name="batch",
+            name="store",
+            field=models.ForeignKey(
+                default=medicines.models.current_store_id,
+                on_delete=django.db.models.deletion.PROTECT,
+                related_name="+",
+                to="medicines.store",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="batch",
+            index=models.Index(
+                fields=["store", "expiration_date", "id"], name="batch_expiry_id_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="batch",
+            index=models.Index(
+                condition=models.Q(("current_quantity__gt", 0), ("is_active", True)),
+                fields=["store", "medicine", "expiration_date", "id"],
+                name="batch_sellable_fefo_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="batch",
+            index=models.Index(
+                condition=models.Q(("current_quantity__gt", 0), ("is_active", True)),
+                fields=["store", "expiration_date"],
+                name="batch_sellable_expiry_idx",
+            ),
+        ),
+        migrations.AddConstraint(
+            model_name="batch",
+            constraint=models.UniqueConstraint(
+                fields=("store", "medicine", "batch_number"),
+                name="unique_by_store_medicine_with_batch_number",
+            ),
+        ),
+    ]
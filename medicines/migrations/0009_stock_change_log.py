@@ -0,0 +1,29 @@
+# Generated by Django 5.2.10 on 2026-10-18 00:06
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("medicines", "0008_store"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="StockChange",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("medicine_id", models.BigIntegerField()),
+                ("changed_at", models.DateTimeField(auto_now_add=True, db_index=True)),
+            ],
+        ),
+    ]
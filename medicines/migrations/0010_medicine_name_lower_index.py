@@ -0,0 +1,21 @@
+# Generated by Django 5.2.10 on 2026-10-18 00:29
+
+import django.db.models.functions.text
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("medicines", "0009_stock_change_log"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="medicine",
+            index=models.Index(
+                django.db.models.functions.text.Lower("name"),
+                name="medicine_name_lower_idx",
+            ),
+        ),
+    ]
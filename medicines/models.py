@@ -1,5 +1,7 @@
-from django.db import models
+from django.conf import settings
+from django.db import models, transaction
 from django.db.models import Q
+from django.db.models.functions import Lower
 from django.utils import timezone
 
 
@@ -43,6 +45,8 @@ class Medicine(models.Model):
     gst_percent = models.DecimalField(max_digits=4, decimal_places=2)
     barcode = models.CharField(unique=True, null=True, blank=True)
     is_active = models.BooleanField(default=True)
+    # Sellable stock below this raises a low-stock alert; 0 turns it off
+    reorder_threshold = models.PositiveIntegerField(default=10)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
@@ -54,6 +58,12 @@ class Medicine(models.Model):
                 name="unique_medicine_variant_if_no_barcode",
             )
         ]
+        indexes = [
+            # Keyset pagination of the inventory medicine list
+            models.Index(fields=["name", "id"], name="medicine_name_id_idx"),
+            # Delivery lines naming a medicine, in any case
+            models.Index(Lower("name"), name="medicine_name_lower_idx"),
+        ]
 
     def __str__(self):
         parts = [self.name]
@@ -75,11 +85,57 @@ class Supplier(models.Model):
     phone_number = models.CharField(max_length=20, null=True, blank=True)
     email_id = models.CharField(max_length=100, null=True, blank=True)
     place = models.CharField(max_length=100, null=True, blank=True)
+    # Days from order to delivery, used by the reorder suggestions
+    lead_time_days = models.PositiveIntegerField(default=7)
 
     def __str__(self):
         return f"{self.name}"
 
 
+# A branch of the pharmacy. Each install sells from one of them, named by
+# settings.POS_STORE_CODE.
+class Store(models.Model):
+    code = models.CharField(max_length=20, unique=True)
+    name = models.CharField(max_length=100)
+    is_active = models.BooleanField(default=True)
+
+    def __str__(self):
+        return f"{self.name}"
+
+
+_store_cache = {}
+
+
+def current_store():
+    """This install's Store, created on first use."""
+    code = settings.POS_STORE_CODE
+    store = _store_cache.get(code)
+    if store is None:
+        store, _ = Store.objects.get_or_create(code=code, defaults={"name": code})
+        if transaction.get_connection().in_atomic_block:
+            # Only cache it once it is sure to exist
+            transaction.on_commit(lambda: _store_cache.setdefault(code, store))
+        else:
+            _store_cache[code] = store
+    return store
+
+
+def current_store_id():
+    return current_store().id
+
+
+class StoreQuerySet(models.QuerySet):
+    def for_store(self, store=None):
+        """Rows of `store` (default: this install's), the partition the
+        store-leading indexes are built for."""
+        return self.filter(store_id=store.id if store else current_store_id())
+
+
+# Active batches with stock left. Whether they are expired depends on the
+# day, so it can't be part of an index condition.
+SELLABLE = Q(is_active=True, current_quantity__gt=0)
+
+
 # Batch Model
 class Batch(models.Model):
     batch_number = models.CharField(max_length=100, null=False)
@@ -94,6 +150,11 @@ class Batch(models.Model):
     is_active = models.BooleanField(default=True)
     supplier = models.ForeignKey(Supplier, on_delete=models.PROTECT)
     created_on = models.DateTimeField(auto_now_add=True)
+    store = models.ForeignKey(
+        Store, on_delete=models.PROTECT, related_name="+", default=current_store_id
+    )
+
+    objects = StoreQuerySet.as_manager()
 
     @property
     def is_expired(self):
@@ -101,8 +162,42 @@ class Batch(models.Model):
 
     class Meta:
         constraints = [
+            # A transfer brings the same batch number into another store
             models.UniqueConstraint(
-                fields=["medicine", "batch_number"],
-                name="unique_by_medicine_with_batch_number",
+                fields=["store", "medicine", "batch_number"],
+                name="unique_by_store_medicine_with_batch_number",
             )
         ]
+        # Every index leads with the store, so a store's reads (for_store())
+        # stay inside its own partition however many stores share the table
+        indexes = [
+            # Keyset pagination of the inventory batch and alert lists
+            models.Index(
+                fields=["store", "expiration_date", "id"], name="batch_expiry_id_idx"
+            ),
+            # Partial indexes over batches with stock to sell, a small slice
+            # of the table once old batches run out. Queries must repeat the
+            # condition (see billing.services.sellable_batches_fefo). FEFO
+            # allocation, POS search and stock summaries go by medicine...
+            models.Index(
+                fields=["store", "medicine", "expiration_date", "id"],
+                condition=SELLABLE,
+                name="batch_sellable_fefo_idx",
+            ),
+            # ...and expiry alerts by date
+            models.Index(
+                fields=["store", "expiration_date"],
+                condition=SELLABLE,
+                name="batch_sellable_expiry_idx",
+            ),
+        ]
+
+
+# Medicines whose stock or catalogue data changed: a row per medicine, written
+# by medicines.signals in the transaction that made the change. Processes that
+# cache medicine data read the rows past the last id they saw, so they learn of
+# a change whichever process made it. SQLite serialises writers, so ids become
+# visible in order. Rows older than a day are pruned.
+class StockChange(models.Model):
+    medicine_id = models.BigIntegerField()
+    changed_at = models.DateTimeField(auto_now_add=True, db_index=True)
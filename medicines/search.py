@@ -0,0 +1,136 @@
+import re
+
+from django.db import DatabaseError, connection
+from django.db.models import Case, IntegerField, Q, Value, When
+from django.db.models.expressions import RawSQL
+
+FTS_TABLE = "medicines_medicine_fts"
+
+
+def has_search_index():
+    return connection.vendor == "sqlite"
+
+
+# "amox 500" -> "amox"* AND "500"*: every word must start some indexed word
+def fts_query(text):
+    words = re.findall(r"\w+", text.lower())
+    return " AND ".join(f'"{word}"*' for word in words)
+
+
+def search_medicine_ids(text, limit=None):
+    """
+    Ids of medicines whose name, strength, brand or barcode contain a word
+    starting with each word of `text`, best match first. Returns None when
+    there is no full-text index to ask, so callers can fall back to icontains.
+    """
+    if not has_search_index():
+        return None
+    query = fts_query(text)
+    if not query:
+        return []
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s "
+                "ORDER BY rank LIMIT %s",
+                [query, limit if limit is not None else -1],
+            )
+            return [row[0] for row in cursor.fetchall()]
+    except DatabaseError:
+        return None
+
+
+def medicine_search_q(text, prefix=""):
+    """
+    Q limiting a queryset to medicines matching `text`. `prefix` is the path
+    from the queried model to the medicine, e.g. "medicine__" for batches.
+    The match runs inside the index as a subquery, however many rows match.
+    """
+    query = fts_query(text)
+    if has_search_index() and query:
+        return Q(
+            **{
+                f"{prefix}id__in": RawSQL(
+                    f"SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s",
+                    [query],
+                )
+            }
+        )
+    return (
+        Q(**{f"{prefix}name__icontains": text})
+        | Q(**{f"{prefix}brand__name__icontains": text})
+        | Q(**{f"{prefix}barcode__icontains": text})
+    )
+
+
+def rank_expression(ids, field="id"):
+    # Orders rows by the position of `field` in the ranked id list
+    return Case(
+        *(When(**{field: pk}, then=Value(position)) for position, pk in enumerate(ids)),
+        default=Value(len(ids)),
+        output_field=IntegerField(),
+    )
+
+
+# The index and the triggers keeping it in sync, as migration 0003 created
+# them, for rebuild_search_index() to restore whatever went missing
+SCHEMA_SQL = [
+    f"""
+    CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5(
+        name, strength, brand, barcode,
+        tokenize = "unicode61 remove_diacritics 2"
+    )
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS medicines_medicine_fts_insert
+    AFTER INSERT ON medicines_medicine BEGIN
+        INSERT INTO {FTS_TABLE} (rowid, name, strength, brand, barcode)
+        VALUES (
+            new.id, new.name, new.strength,
+            (SELECT name FROM medicines_brand WHERE id = new.brand_id),
+            new.barcode
+        );
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS medicines_medicine_fts_update
+    AFTER UPDATE OF name, strength, brand_id, barcode ON medicines_medicine BEGIN
+        DELETE FROM {FTS_TABLE} WHERE rowid = old.id;
+        INSERT INTO {FTS_TABLE} (rowid, name, strength, brand, barcode)
+        VALUES (
+            new.id, new.name, new.strength,
+            (SELECT name FROM medicines_brand WHERE id = new.brand_id),
+            new.barcode
+        );
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS medicines_medicine_fts_delete
+    AFTER DELETE ON medicines_medicine BEGIN
+        DELETE FROM {FTS_TABLE} WHERE rowid = old.id;
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS medicines_brand_fts_update
+    AFTER UPDATE OF name ON medicines_brand BEGIN
+        UPDATE {FTS_TABLE} SET brand = new.name
+        WHERE rowid IN (SELECT id FROM medicines_medicine WHERE brand_id = new.id);
+    END
+    """,
+]
+
+
+def rebuild_search_index():
+    with connection.cursor() as cursor:
+        for statement in SCHEMA_SQL:
+            cursor.execute(statement)
+        cursor.execute(f"DELETE FROM {FTS_TABLE}")
+        cursor.execute(
+            f"INSERT INTO {FTS_TABLE} (rowid, name, strength, brand, barcode) "
+            "SELECT m.id, m.name, m.strength, b.name, m.barcode "
+            "FROM medicines_medicine m "
+            "LEFT JOIN medicines_brand b ON b.id = m.brand_id"
+        )
+        cursor.execute(f"INSERT INTO {FTS_TABLE} ({FTS_TABLE}) VALUES ('optimize')")
+        cursor.execute(f"SELECT count(*) FROM {FTS_TABLE}")
+        return cursor.fetchone()[0]
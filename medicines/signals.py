@@ -0,0 +1,62 @@
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import Max
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import Signal, receiver
+from django.utils import timezone
+
+from .models import Batch, Medicine, StockChange
+
+# Sent once the stock or catalogue data of some medicines has changed and the
+# change is committed. Receivers get `medicine_ids`, a set of Medicine ids.
+# It only reaches this process: caches that other processes must see the
+# change in read the StockChange log instead.
+batches_changed = Signal()
+
+_pruned_on = None
+
+
+def notify_batches_changed(medicine_ids):
+    global _pruned_on
+    medicine_ids = set(medicine_ids)
+    if medicine_ids:
+        # Logged in the caller's transaction, so it commits with the change
+        StockChange.objects.bulk_create(
+            [StockChange(medicine_id=medicine_id) for medicine_id in medicine_ids]
+        )
+        transaction.on_commit(
+            lambda: batches_changed.send(sender=Batch, medicine_ids=medicine_ids)
+        )
+        if _pruned_on != timezone.localdate():
+            StockChange.objects.filter(
+                changed_at__lt=timezone.now() - timedelta(days=1)
+            ).delete()
+            _pruned_on = timezone.localdate()
+
+
+def last_stock_change():
+    """Id of the latest committed StockChange, 0 when there is none."""
+    return StockChange.objects.aggregate(last=Max("id"))["last"] or 0
+
+
+def stock_changes_since(change_id):
+    """(latest change id, ids of the medicines changed after `change_id`)."""
+    rows = list(
+        StockChange.objects.filter(id__gt=change_id).values_list("id", "medicine_id")
+    )
+    if not rows:
+        return change_id, set()
+    return max(pk for pk, _ in rows), {medicine_id for _, medicine_id in rows}
+
+
+@receiver(post_save, sender=Batch)
+@receiver(post_delete, sender=Batch)
+def batch_saved(sender, instance, **kwargs):
+    notify_batches_changed([instance.medicine_id])
+
+
+@receiver(post_save, sender=Medicine)
+@receiver(post_delete, sender=Medicine)
+def medicine_saved(sender, instance, **kwargs):
+    notify_batches_changed([instance.pk])
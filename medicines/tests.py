@@ -1,3 +1,107 @@
-from django.test import TestCase
+from datetime import timedelta
 
-# Create your tests here.
+from django.db import connection
+from django.utils import timezone
+
+from inventory.models import MedicineStock, StockAlert
+from medicines.catalogue import upsert_catalogue
+from medicines.models import Batch, Brand, Medicine, PackType, Supplier
+from medicines.search import FTS_TABLE, medicine_search_q, rebuild_search_index
+from pharmacy_project.query_plans import QueryPlanTestCase
+
+
+def line(**values):
+    return {
+        "barcode": "8902000000017",
+        "name": "Paracetamol",
+        "brand": "Cipla",
+        "category": "Analgesic",
+        "strength": "500mg",
+        "pack_size": "10",
+        "pack_type": "Strip",
+        "hsn_code": "3004",
+        "gst_percent": "12",
+        **values,
+    }
+
+
+class CatalogueUpsertTests(QueryPlanTestCase):
+    def test_upsert_keeps_stock_summary_and_alerts(self):
+        report = upsert_catalogue(
+            [
+                (2, line()),
+                (3, line(barcode="8902000000024", name="Ibuprofen", brand="CIPLA")),
+            ]
+        )
+        self.assertEqual((report["inserted"], report["errors"]), (2, []))
+        # Brands differing only in case are one brand
+        self.assertEqual(list(Brand.objects.values_list("name", flat=True)), ["Cipla"])
+
+        paracetamol = Medicine.objects.get(barcode="8902000000017")
+        stock = MedicineStock.objects.for_store().get(medicine=paracetamol)
+        self.assertEqual(stock.sellable_quantity, 0)
+        Batch.objects.create(
+            batch_number="P1",
+            medicine=paracetamol,
+            initial_quantity=4,
+            current_quantity=4,
+            purchase_price="1.00",
+            sale_price="2.00",
+            expiration_date=timezone.localdate() + timedelta(days=365),
+            supplier=Supplier.objects.create(name="Medline"),
+        )
+        low_stock = StockAlert.objects.for_store().filter(
+            kind=StockAlert.LOW_STOCK, medicine=paracetamol
+        )
+        self.assertTrue(low_stock.exists())
+
+        # Deactivated by a bulk update: its low-stock alert goes with it
+        report = upsert_catalogue([(2, line(is_active="no"))])
+        self.assertEqual(report["updated"], 1)
+        self.assertFalse(low_stock.exists())
+
+
+class SearchIndexTests(QueryPlanTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.brand = Brand.objects.create(name="Cipla")
+        cls.pack_type = PackType.objects.create(name="Strip")
+
+    def found(self, text):
+        return list(
+            Medicine.objects.filter(medicine_search_q(text)).values_list(
+                "name", flat=True
+            )
+        )
+
+    def add(self, name):
+        return Medicine.objects.create(
+            name=name,
+            brand=self.brand,
+            pack_size=10,
+            pack_type=self.pack_type,
+            hsn_code="3004",
+            gst_percent="12.00",
+        )
+
+    def test_writes_reach_the_index(self):
+        medicine = self.add("Paracetamol")
+        self.assertEqual(self.found("parac"), ["Paracetamol"])
+        medicine.name = "Ibuprofen"
+        medicine.save()
+        self.assertEqual(self.found("parac"), [])
+        self.assertEqual(self.found("ibu"), ["Ibuprofen"])
+        # Bulk writes skip the signals, not the triggers
+        Medicine.objects.filter(pk=medicine.pk).update(name="Aspirin")
+        Brand.objects.filter(pk=self.brand.pk).update(name="Sun Pharma")
+        self.assertEqual(self.found("aspirin sun"), ["Aspirin"])
+
+    def test_rebuild_restores_a_dropped_index(self):
+        self.add("Paracetamol")
+        with connection.cursor() as cursor:
+            cursor.execute("DROP TRIGGER medicines_medicine_fts_insert")
+            cursor.execute(f"DROP TABLE {FTS_TABLE}")
+        self.assertEqual(rebuild_search_index(), 1)
+        self.assertEqual(self.found("parac"), ["Paracetamol"])
+        self.add("Ibuprofen")
+        self.assertEqual(self.found("ibu"), ["Ibuprofen"])
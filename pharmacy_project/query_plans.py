@@ -0,0 +1,133 @@
+import re
+from datetime import timedelta
+from decimal import Decimal
+
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from inventory.services import _action_cache
+from medicines.models import _store_cache
+
+# A plan step reading every row of a table. "SCAN t USING INDEX i" walks an
+# index in order (and stops at LIMIT), "SEARCH ..." is a range read, and
+# virtual tables (the full-text index) plan their own access.
+_FULL_SCAN = re.compile(r"^SCAN (\w+)$")
+# Django's table aliases in subqueries and repeated joins: "table" U0
+_ALIAS = re.compile(r'"(\w+)" ([UT]\d+)\b')
+
+
+def query_plan(sql):
+    """The EXPLAIN QUERY PLAN steps of `sql`, one string per step."""
+    with connection.cursor() as cursor:
+        cursor.execute(f"EXPLAIN QUERY PLAN {sql}")
+        return [row[-1] for row in cursor.fetchall()]
+
+
+def full_scans(sql):
+    """Names of the tables `sql` reads in full."""
+    aliases = {alias: table for table, alias in _ALIAS.findall(sql)}
+    return {
+        aliases.get(match[1], match[1])
+        for step in query_plan(sql)
+        if (match := _FULL_SCAN.match(step.strip()))
+    }
+
+
+class QueryPlanTestCase(TestCase):
+    """
+    Runs a view or function, captures its SELECTs and fails if any of them
+    reads a whole table not named in `allow`. The plans don't depend on
+    the row counts (nothing is ANALYZEd), so small fixtures are enough.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        # Rows cached by an earlier class went with its rollback
+        _action_cache.clear()
+        _store_cache.clear()
+        super().setUpClass()
+
+    def assertNoFullScans(self, run, allow=()):
+        with CaptureQueriesContext(connection) as captured:
+            result = run()
+        selects = [
+            query["sql"]
+            for query in captured.captured_queries
+            if query["sql"].lstrip().upper().startswith(("SELECT", "WITH"))
+        ]
+        self.assertTrue(selects, "nothing was queried")
+        for sql in selects:
+            scanned = full_scans(sql) - set(allow)
+            self.assertFalse(
+                scanned,
+                f"full scan of {', '.join(sorted(scanned))}:\n{sql}\n"
+                + "\n".join(query_plan(sql)),
+            )
+        return result
+
+
+def make_sample_stock():
+    """
+    A small shop for the plan tests: medicines with sellable, expiring and
+    expired batches, a customer and one invoice.
+    """
+    from billing.models import Customer, Staff
+    from billing.services import create_invoice
+    from medicines.models import Batch, Brand, Category, Medicine, PackType, Supplier
+
+    today = timezone.localdate()
+    staff = Staff.objects.create(id=1, name="Counter", position="Pharmacist")
+    supplier = Supplier.objects.create(name="Medline")
+    pack_type = PackType.objects.create(name="Strip")
+    brand = Brand.objects.create(name="Cipla")
+    category = Category.objects.create(name="Antibiotic")
+    medicines = [
+        Medicine.objects.create(
+            name=name,
+            brand=brand,
+            category=category,
+            pack_size=10,
+            pack_type=pack_type,
+            hsn_code="3004",
+            gst_percent=Decimal("12.00"),
+            barcode=barcode,
+        )
+        for name, barcode in [
+            ("Amoxicillin", "8901000000011"),
+            ("Azithromycin", "8901000000028"),
+            ("Cetirizine", None),
+        ]
+    ]
+    for number, (medicine, quantity, days) in enumerate(
+        [
+            (medicines[0], 40, 200),
+            (medicines[0], 5, 20),
+            (medicines[1], 3, 100),
+            (medicines[1], 8, -5),
+            (medicines[2], 60, 400),
+        ]
+    ):
+        Batch.objects.create(
+            batch_number=f"B{number}",
+            medicine=medicine,
+            initial_quantity=quantity,
+            current_quantity=quantity,
+            purchase_price=Decimal("6.00"),
+            sale_price=Decimal("10.00"),
+            expiration_date=today + timedelta(days=days),
+            supplier=supplier,
+        )
+    customer = Customer.objects.create(
+        name="Asha", phone_number="9800000001", email="asha@example.com"
+    )
+    invoice, _ = create_invoice(
+        staff, {str(medicines[0].id): {"quantity": 2}}, customer=customer
+    )
+    return {
+        "staff": staff,
+        "medicines": medicines,
+        "customer": customer,
+        "invoice": invoice,
+    }
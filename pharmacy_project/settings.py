@@ -88,6 +88,21 @@ DATABASES = {
 }
 
 
+# Cache
+# https://docs.djangoproject.com/en/5.2/topics/cache/
+# POS search results are cached in each process's memory. They are keyed by
+# the latest medicines.StockChange id, read from the database, so a stock
+# change made by any process (web worker, journal drain, import) retires
+# them in all processes at once; nothing needs a shared cache server.
+
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        "LOCATION": "pos-search",
+    }
+}
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 
@@ -125,6 +140,43 @@ STATIC_ROOT = BASE_DIR / "staticfiles"
 STATIC_URL = "static/"
 STATICFILES_DIRS = [BASE_DIR / "static"]
 
+# Store (branch) this install belongs to. Its batches, invoices and stock
+# movements are stamped with it and the POS, inventory and reports read only
+# its rows. When several stores share one database, terminal ids must be
+# unique across them, as invoice numbers are.
+POS_STORE_CODE = getenv("POS_STORE_CODE", "MAIN")
+
+# Databases the head-office stock view aggregates, one per branch whose
+# file it can read (configure them in DATABASES). "default" alone covers
+# every store kept in this database.
+POS_STORE_DATABASES = ["default"]
+
+# POS terminal billed by this process. It is part of every invoice number
+# (INV<yyyymmdd>-<terminal>-<sequence>), so give each till its own two-character id.
+POS_TERMINAL_ID = getenv("POS_TERMINAL_ID", "01")
+
+# How many invoice numbers a terminal reserves from the counter table at a time
+INVOICE_NUMBER_BLOCK_SIZE = 20
+
+# Where POS carts live between clicks. The LRU store keeps them in process
+# memory and writes changes to the database in the background.
+POS_CART_STORE = {
+    "BACKEND": "billing.cart.LRUCartStore",
+    "OPTIONS": {"capacity": 500, "flush_interval": 2.0},
+}
+
+# How the POS posts a checkout. "direct" writes the invoice and stock changes
+# in the request. "journal" appends the sale to a durable local journal and
+# answers with a provisional invoice at once; run
+# `python manage.py drain_checkout_journal --follow` to post journaled sales.
+POS_CHECKOUT_MODE = getenv("POS_CHECKOUT_MODE", "direct")
+
+POS_CHECKOUT_JOURNAL = {
+    "DIR": BASE_DIR / "checkout_journal",
+    # Sales posted per database transaction by the committer
+    "BATCH_SIZE": 50,
+}
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
@@ -7,6 +7,7 @@ For more information on this file, see
 https://docs.djangoproject.com/en/5.2/howto/deployment/wsgi/
 """
 
+import atexit
 import os
 
 from django.core.wsgi import get_wsgi_application
@@ -14,3 +15,13 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "pharmacy_project.settings")
 
 application = get_wsgi_application()
+
+# The server process is stopping: write out the carts changed since the last
+# flush and give back the invoice numbers it reserved but never used.
+# Registered here rather than where the cart store and allocator are made,
+# so tests and management commands never write to the database on exit.
+from billing.cart import close_cart_store  # noqa: E402
+from billing.numbering import close_allocator  # noqa: E402
+
+atexit.register(close_allocator)
+atexit.register(close_cart_store)
@@ -0,0 +1,133 @@
+from decimal import Decimal
+
+from django.db.models import DecimalField, F, Q, Sum
+from django.utils import timezone
+
+from billing.models import InvoiceItem
+from billing.services import invoices_between
+
+CENT = Decimal("0.01")
+CHUNK_SIZE = 2000  # invoices per query of the streamed register
+
+HSN_COLUMNS = [
+    "hsn_code",
+    "gst_rate",
+    "units",
+    "taxable_value",
+    "cgst",
+    "sgst",
+    "total_tax",
+    "invoice_value",
+]
+REGISTER_COLUMNS = [
+    "invoice_number",
+    "invoice_date",
+    "gst_rate",
+    "taxable_value",
+    "cgst",
+    "sgst",
+    "total_tax",
+    "invoice_value",
+]
+
+# The summed columns of every row of the summary
+AMOUNTS = ["units", "taxable_value", "cgst", "sgst", "total_tax", "invoice_value"]
+
+_TOTALS = {
+    "units": Sum("quantity"),
+    "taxable_value": Sum(
+        F("unit_price") * F("quantity"),
+        output_field=DecimalField(max_digits=14, decimal_places=2),
+    ),
+    "total_tax": Sum("gst_amount"),
+    "invoice_value": Sum("total_amount"),
+}
+
+
+def _split(row):
+    # SQLite sums decimals as floats: back to paise
+    for amount in ("taxable_value", "total_tax", "invoice_value"):
+        row[amount] = Decimal(row[amount]).quantize(CENT)
+    # Sales over the counter are intra-state: the tax is half central, half
+    # state. The odd paisa goes to the state share so the halves add up.
+    row["cgst"] = (row["total_tax"] / 2).quantize(CENT)
+    row["sgst"] = row["total_tax"] - row["cgst"]
+    return row
+
+
+def gst_summary(first, last):
+    """
+    This store's GST on the sales of the days first..last, from one grouped
+    pass over their invoice lines at the rate charged on each line:
+
+    - hsn: a row per HSN code and rate (units, taxable value, CGST,
+      SGST, total tax, invoice value), the HSN-wise summary of the return
+    - slabs: the same per rate
+    - totals: the same over every line
+    """
+    hsn = [
+        _split(row)
+        for row in InvoiceItem.objects.filter(invoice__in=invoices_between(first, last))
+        .values(hsn_code=F("medicine__hsn_code"), gst_rate=F("gst_percent"))
+        .annotate(**_TOTALS)
+        .order_by("hsn_code", "gst_rate")
+    ]
+    slabs = {}
+    totals = dict.fromkeys(AMOUNTS, 0)
+    for row in hsn:
+        slab = slabs.setdefault(
+            row["gst_rate"], {"gst_rate": row["gst_rate"], **dict.fromkeys(AMOUNTS, 0)}
+        )
+        for amount in AMOUNTS:
+            slab[amount] += row[amount]
+            totals[amount] += row[amount]
+    return {
+        "hsn": hsn,
+        "slabs": sorted(slabs.values(), key=lambda slab: slab["gst_rate"]),
+        "totals": totals,
+    }
+
+
+def hsn_rows(summary):
+    return ([row[column] for column in HSN_COLUMNS] for row in summary["hsn"])
+
+
+def register_rows(first, last, chunk_size=CHUNK_SIZE):
+    """
+    Export rows of the invoices of first..last, one per invoice and GST
+    rate, oldest first. Invoices are read `chunk_size` at a time, each
+    chunk continuing from the last one's (created_at, id), and their lines
+    summed in one grouped query per chunk, so a year streams out in flat
+    memory.
+    """
+    invoices = invoices_between(first, last).order_by("created_at", "id")
+    after = None
+    while True:
+        chunk = invoices
+        if after is not None:
+            # Keyset cursor: the invoices past (created_at, id)
+            created_at, last_id = after
+            chunk = chunk.filter(
+                Q(created_at__gt=created_at) | Q(id__gt=last_id),
+                created_at__gte=created_at,
+            )
+        chunk = list(
+            chunk.values_list("id", "invoice_number", "created_at")[:chunk_size]
+        )
+        if not chunk:
+            return
+        rates = {}
+        for row in (
+            InvoiceItem.objects.filter(invoice_id__in=[pk for pk, _, _ in chunk])
+            .values("invoice_id", gst_rate=F("gst_percent"))
+            .annotate(**_TOTALS)
+            .order_by("invoice_id", "gst_rate")
+        ):
+            rates.setdefault(row["invoice_id"], []).append(_split(row))
+        for pk, number, created_at in chunk:
+            day = timezone.localdate(created_at)
+            for row in rates.get(pk, []):
+                yield [number, day] + [row[column] for column in REGISTER_COLUMNS[2:]]
+        if len(chunk) < chunk_size:
+            return
+        after = chunk[-1][2], chunk[-1][0]
@@ -0,0 +1,67 @@
+from decimal import Decimal
+
+from django.db.models import F, Sum
+
+from .models import DailyBatchSales
+from .rollups import CENT, rollup_between
+
+# Each breakdown of the margin: the DailyBatchSales field rows are grouped
+# on, their label, and the breakdown a row drills down into
+DIMENSIONS = {
+    "category": ("medicine__category_id", "medicine__category__name", "medicine"),
+    "brand": ("medicine__brand_id", "medicine__brand__name", "medicine"),
+    "supplier": ("batch__supplier_id", "batch__supplier__name", "medicine"),
+    "day": ("day", "day", "medicine"),
+    "medicine": ("medicine_id", "medicine__name", "batch"),
+    "batch": ("batch_id", "batch__batch_number", None),
+}
+
+
+def _margin(row):
+    # SQLite sums decimals as floats: back to paise first
+    row["revenue"] = Decimal(row["revenue"]).quantize(CENT)
+    row["cost"] = Decimal(row["cost"]).quantize(CENT)
+    row["margin"] = row["revenue"] - row["cost"]
+    row["margin_percent"] = (
+        (row["margin"] * 100 / row["revenue"]).quantize(Decimal("0.1"))
+        if row["revenue"]
+        else None
+    )
+    return row
+
+
+def margin_report(first, last, by="category", **filters):
+    """
+    Revenue before GST, cost of goods at the batches' purchase prices,
+    gross margin and margin % of this store's sales on the days
+    first..last, per `by` (a DIMENSIONS key), highest revenue first (days
+    in order). `filters` ({dimension: key}) narrow it to the rows drilled
+    into.
+
+    One grouped query over the daily batch rollup, whose size follows the
+    days and the batches sold each day, never the invoices. Returns (rows,
+    totals); each row has key, label, units, revenue, cost, margin and
+    margin_percent.
+    """
+    key, label, _ = DIMENSIONS[by]
+    sales = rollup_between(DailyBatchSales, first, last).filter(
+        **{DIMENSIONS[name][0]: value for name, value in filters.items()}
+    )
+    rows = [
+        _margin(row)
+        for row in sales.values(key=F(key), label=F(label))
+        .annotate(
+            units=Sum("quantity"),
+            revenue=Sum("taxable_value"),
+            cost=Sum("cost_amount"),
+        )
+        .order_by("key" if by == "day" else "-revenue")
+    ]
+    totals = _margin(
+        {
+            "units": sum(row["units"] for row in rows),
+            "revenue": sum((row["revenue"] for row in rows), Decimal(0)),
+            "cost": sum((row["cost"] for row in rows), Decimal(0)),
+        }
+    )
+    return rows, totals
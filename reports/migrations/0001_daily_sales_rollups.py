@@ -0,0 +1,255 @@
+# Generated by Django 5.2.10 on 2026-10-17 23:44
+
+import django.db.models.deletion
+import django.db.models.functions.comparison
+from django.db import migrations, models
+from django.db.models import Count, DecimalField, F, Sum
+from django.db.models.functions import TruncDate
+
+
+def _money(expression):
+    return Sum(expression, output_field=DecimalField(max_digits=14, decimal_places=2))
+
+
+def roll_up_sales(apps, schema_editor):
+    Invoice = apps.get_model("billing", "Invoice")
+    InvoiceItem = apps.get_model("billing", "InvoiceItem")
+    DailySales = apps.get_model("reports", "DailySales")
+    DailyCategorySales = apps.get_model("reports", "DailyCategorySales")
+    DailyMedicineSales = apps.get_model("reports", "DailyMedicineSales")
+
+    DailySales.objects.bulk_create(
+        [
+            DailySales(
+                store_id=row["store_id"],
+                day=row["day"],
+                payment_method=row["payment_method"],
+                invoices=row["invoices"],
+                taxable_value=row["taxable_value"],
+                gst_amount=row["gst"],
+                total_amount=row["total"],
+            )
+            for row in Invoice.objects.annotate(day=TruncDate("created_at"))
+            .values("store_id", "day", "payment_method")
+            .annotate(
+                invoices=Count("id"),
+                taxable_value=_money("total_amount"),
+                gst=_money("gst_amount"),
+                total=_money("grand_total"),
+            )
+            .order_by()
+        ],
+        batch_size=1000,
+    )
+    lines = InvoiceItem.objects.annotate(
+        day=TruncDate("invoice__created_at"), store_id=F("invoice__store_id")
+    ).order_by()
+    totals = {
+        "sold": Sum("quantity"),
+        "taxable_value": _money(F("unit_price") * F("quantity")),
+        "gst": _money("gst_amount"),
+        "total": _money("total_amount"),
+    }
+    DailyCategorySales.objects.bulk_create(
+        [
+            DailyCategorySales(
+                store_id=row["store_id"],
+                day=row["day"],
+                category_id=row["medicine__category_id"],
+                payment_method=row["invoice__payment_method"],
+                quantity=row["sold"],
+                taxable_value=row["taxable_value"],
+                gst_amount=row["gst"],
+                total_amount=row["total"],
+            )
+            for row in lines.values(
+                "store_id", "day", "medicine__category_id", "invoice__payment_method"
+            ).annotate(**totals)
+        ],
+        batch_size=1000,
+    )
+    DailyMedicineSales.objects.bulk_create(
+        [
+            DailyMedicineSales(
+                store_id=row["store_id"],
+                day=row["day"],
+                medicine_id=row["medicine_id"],
+                quantity=row["sold"],
+                taxable_value=row["taxable_value"],
+                gst_amount=row["gst"],
+                total_amount=row["total"],
+            )
+            for row in lines.values("store_id", "day", "medicine_id").annotate(**totals)
+        ],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        ("billing", "0008_invoice_store"),
+        ("medicines", "0008_store"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="DailyCategorySales",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("day", models.DateField()),
+                ("payment_method", models.CharField(max_length=30)),
+                ("quantity", models.IntegerField(default=0)),
+                (
+                    "taxable_value",
+                    models.DecimalField(decimal_places=2, default=0, max_digits=14),
+                ),
+                (
+                    "gst_amount",
+                    models.DecimalField(decimal_places=2, default=0, max_digits=14),
+                ),
+                (
+                    "total_amount",
+                    models.DecimalField(decimal_places=2, default=0, max_digits=14),
+                ),
+                (
+                    "category",
+                    models.ForeignKey(
+                        null=True,
+                        on_delete=django.db.models.deletion.PROTECT,
+                        related_name="+",
+                        to="medicines.category",
+                    ),
+                ),
+                (
+                    "store",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.PROTECT,
+                        related_name="+",
+                        to="medicines.store",
+                    ),
+                ),
+            ],
+            options={
+                "constraints": [
+                    models.UniqueConstraint(
+                        models.F("store"),
+                        models.F("day"),
+                        django.db.models.functions.comparison.Coalesce(
+                            "category", models.Value(0)
+                        ),
+                        models.F("payment_method"),
+                        name="unique_daily_category_sales",
+                    )
+                ],
+            },
+        ),
+        migrations.CreateModel(
+            name="DailyMedicineSales",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("day", models.DateField()),
+                ("quantity", models.IntegerField(default=0)),
+                (
+                    "taxable_value",
+                    models.DecimalField(decimal_places=2, default=0, max_digits=14),
+                ),
+                (
+                    "gst_amount",
+                    models.DecimalField(decimal_places=2, default=0, max_digits=14),
+                ),
+                (
+                    "total_amount",
+                    models.DecimalField(decimal_places=2, default=0, max_digits=14),
+                ),
+                (
+                    "medicine",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.PROTECT,
+                        related_name="+",
+                        to="medicines.medicine",
+                    ),
+                ),
+                (
+                    "store",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.PROTECT,
+                        related_name="+",
+                        to="medicines.store",
+                    ),
+                ),
+            ],
+            options={
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("store", "day", "medicine"),
+                        name="unique_daily_medicine_sales",
+                    )
+                ],
+            },
+        ),
+        migrations.CreateModel(
+            name="DailySales",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("day", models.DateField()),
+                ("payment_method", models.CharField(max_length=30)),
+                ("invoices", models.IntegerField(default=0)),
+                (
+                    "taxable_value",
+                    models.DecimalField(decimal_places=2, default=0, max_digits=14),
+                ),
+                (
+                    "gst_amount",
+                    models.DecimalField(decimal_places=2, default=0, max_digits=14),
+                ),
+                (
+                    "total_amount",
+                    models.DecimalField(decimal_places=2, default=0, max_digits=14),
+                ),
+                (
+                    "store",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.PROTECT,
+                        related_name="+",
+                        to="medicines.store",
+                    ),
+                ),
+            ],
+            options={
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("store", "day", "payment_method"),
+                        name="unique_daily_sales",
+                    )
+                ],
+            },
+        ),
+        migrations.RunPython(roll_up_sales, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,108 @@
+# Generated by Django 5.2.10 on 2026-10-17 23:49
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import DecimalField, F, Sum
+from django.db.models.functions import TruncDate
+
+
+def _money(expression):
+    return Sum(expression, output_field=DecimalField(max_digits=14, decimal_places=2))
+
+
+def roll_up_batch_sales(apps, schema_editor):
+    InvoiceItem = apps.get_model("billing", "InvoiceItem")
+    DailyBatchSales = apps.get_model("reports", "DailyBatchSales")
+    DailyBatchSales.objects.bulk_create(
+        [
+            DailyBatchSales(
+                store_id=row["store_id"],
+                day=row["day"],
+                batch_id=row["batch_id"],
+                medicine_id=row["medicine_id"],
+                quantity=row["sold"],
+                taxable_value=row["taxable_value"],
+                cost_amount=row["cost"],
+            )
+            for row in InvoiceItem.objects.annotate(
+                day=TruncDate("invoice__created_at"), store_id=F("invoice__store_id")
+            )
+            .values("store_id", "day", "batch_id", "medicine_id")
+            .annotate(
+                sold=Sum("quantity"),
+                taxable_value=_money(F("unit_price") * F("quantity")),
+                cost=_money(F("batch__purchase_price") * F("quantity")),
+            )
+            .order_by()
+        ],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("billing", "0008_invoice_store"),
+        ("medicines", "0008_store"),
+        ("reports", "0001_daily_sales_rollups"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="DailyBatchSales",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("day", models.DateField()),
+                ("quantity", models.IntegerField(default=0)),
+                (
+                    "taxable_value",
+                    models.DecimalField(decimal_places=2, default=0, max_digits=14),
+                ),
+                (
+                    "cost_amount",
+                    models.DecimalField(decimal_places=2, default=0, max_digits=14),
+                ),
+                (
+                    "batch",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.PROTECT,
+                        related_name="+",
+                        to="medicines.batch",
+                    ),
+                ),
+                (
+                    "medicine",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.PROTECT,
+                        related_name="+",
+                        to="medicines.medicine",
+                    ),
+                ),
+                (
+                    "store",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.PROTECT,
+                        related_name="+",
+                        to="medicines.store",
+                    ),
+                ),
+            ],
+            options={
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("store", "day", "batch"),
+                        name="unique_daily_batch_sales",
+                    )
+                ],
+            },
+        ),
+        migrations.RunPython(roll_up_batch_sales, migrations.RunPython.noop),
+    ]
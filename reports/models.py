@@ -1,3 +1,94 @@
 from django.db import models
+from django.db.models import F, Value
+from django.db.models.functions import Coalesce
 
-# Create your models here.
+from medicines.models import Batch, Category, Medicine, Store
+
+
+# Sales rolled up by day, kept by reports.rollups inside the transaction that
+# posts the invoices they count. Reports read these rather than the invoices,
+# so their cost follows the number of days in the range, not of sales.
+# Amounts: taxable_value before GST, gst_amount, total_amount with GST.
+
+
+# Invoices per store, day and payment method
+class DailySales(models.Model):
+    store = models.ForeignKey(Store, on_delete=models.PROTECT, related_name="+")
+    day = models.DateField()
+    payment_method = models.CharField(max_length=30)
+    invoices = models.IntegerField(default=0)
+    taxable_value = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    gst_amount = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    total_amount = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["store", "day", "payment_method"], name="unique_daily_sales"
+            )
+        ]
+
+
+# Invoice lines per store, day, medicine category and payment method
+class DailyCategorySales(models.Model):
+    store = models.ForeignKey(Store, on_delete=models.PROTECT, related_name="+")
+    day = models.DateField()
+    category = models.ForeignKey(
+        Category, on_delete=models.PROTECT, null=True, related_name="+"
+    )
+    payment_method = models.CharField(max_length=30)
+    quantity = models.IntegerField(default=0)
+    taxable_value = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    gst_amount = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    total_amount = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    class Meta:
+        constraints = [
+            # Medicines without a category share one row: NULLs would never
+            # conflict, so the key uses 0 for them
+            models.UniqueConstraint(
+                F("store"),
+                F("day"),
+                Coalesce("category", Value(0)),
+                F("payment_method"),
+                name="unique_daily_category_sales",
+            )
+        ]
+
+
+# Invoice lines per store, day and medicine
+class DailyMedicineSales(models.Model):
+    store = models.ForeignKey(Store, on_delete=models.PROTECT, related_name="+")
+    day = models.DateField()
+    medicine = models.ForeignKey(Medicine, on_delete=models.PROTECT, related_name="+")
+    quantity = models.IntegerField(default=0)
+    taxable_value = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    gst_amount = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    total_amount = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["store", "day", "medicine"], name="unique_daily_medicine_sales"
+            )
+        ]
+
+
+# Invoice lines per store, day and batch, with what they cost at the batch's
+# purchase price: the margin report's source. The medicine is kept on the row
+# so per-medicine totals need no join.
+class DailyBatchSales(models.Model):
+    store = models.ForeignKey(Store, on_delete=models.PROTECT, related_name="+")
+    day = models.DateField()
+    batch = models.ForeignKey(Batch, on_delete=models.PROTECT, related_name="+")
+    medicine = models.ForeignKey(Medicine, on_delete=models.PROTECT, related_name="+")
+    quantity = models.IntegerField(default=0)
+    taxable_value = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    cost_amount = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["store", "day", "batch"], name="unique_daily_batch_sales"
+            )
+        ]
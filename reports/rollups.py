@@ -0,0 +1,292 @@
+import time
+from collections import defaultdict
+from datetime import timedelta
+from decimal import Decimal
+
+from django.db import connection, transaction
+from django.db.models import Count, DecimalField, F, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from billing.models import Invoice, InvoiceItem
+from inventory.ledger import month_start, next_month, start_of_day
+from medicines.models import Store, current_store_id
+
+from .models import (
+    DailyBatchSales,
+    DailyCategorySales,
+    DailyMedicineSales,
+    DailySales,
+)
+
+CENT = Decimal("0.01")
+
+# Each rollup: model, key columns, the conflict target of its unique
+# constraint, summed columns
+ROLLUPS = {
+    "sales": (
+        DailySales,
+        ["store_id", "day", "payment_method"],
+        "store_id, day, payment_method",
+        ["invoices", "taxable_value", "gst_amount", "total_amount"],
+    ),
+    "category": (
+        DailyCategorySales,
+        ["store_id", "day", "category_id", "payment_method"],
+        "store_id, day, COALESCE(category_id, 0), payment_method",
+        ["quantity", "taxable_value", "gst_amount", "total_amount"],
+    ),
+    "medicine": (
+        DailyMedicineSales,
+        ["store_id", "day", "medicine_id"],
+        "store_id, day, medicine_id",
+        ["quantity", "taxable_value", "gst_amount", "total_amount"],
+    ),
+    "batch": (
+        DailyBatchSales,
+        ["store_id", "day", "batch_id", "medicine_id"],
+        "store_id, day, batch_id",
+        ["quantity", "taxable_value", "cost_amount"],
+    ),
+}
+
+
+def rollup_between(model, first, last):
+    # This store's rows of a rollup for the days first..last, read through
+    # the index of its unique constraint
+    return model.objects.filter(store_id=current_store_id(), day__range=(first, last))
+
+
+def _add(totals, key, values):
+    row = totals[key]
+    for i, value in enumerate(values):
+        row[i] += value
+
+
+def _upsert(name, totals):
+    # One statement per rollup: new keys are inserted, existing ones added to
+    model, keys, target, sums = ROLLUPS[name]
+    if not totals:
+        return
+    quote = connection.ops.quote_name
+    table = quote(model._meta.db_table)
+    columns = keys + sums
+    fields = [model._meta.get_field(column) for column in columns]
+    sql = (
+        f"INSERT INTO {table} ({', '.join(map(quote, columns))}) "
+        f"VALUES ({', '.join(['%s'] * len(columns))}) "
+        f"ON CONFLICT ({target}) DO UPDATE SET "
+        + ", ".join(
+            f"{quote(column)} = {table}.{quote(column)} + excluded.{quote(column)}"
+            for column in sums
+        )
+    )
+    params = [
+        [
+            field.get_db_prep_save(value, connection)
+            for field, value in zip(fields, key + tuple(values))
+        ]
+        for key, values in totals.items()
+    ]
+    with connection.cursor() as cursor:
+        cursor.executemany(sql, params)
+
+
+def record_sales(sales, sign=1):
+    """
+    Add posted invoices to the daily rollups. `sales` is an iterable of
+    (invoice, lines) with invoice.created_at set and each line's medicine
+    and batch loaded. Call it in the transaction that saves them, so the
+    rollups commit or roll back with the sale; sign=-1 takes sales back
+    out, for a void or return. One statement per rollup however many
+    invoices there are.
+    """
+    sales_totals = defaultdict(lambda: [0, Decimal(0), Decimal(0), Decimal(0)])
+    category_totals = defaultdict(lambda: [0, Decimal(0), Decimal(0), Decimal(0)])
+    medicine_totals = defaultdict(lambda: [0, Decimal(0), Decimal(0), Decimal(0)])
+    batch_totals = defaultdict(lambda: [0, Decimal(0), Decimal(0)])
+    for invoice, lines in sales:
+        day = timezone.localdate(invoice.created_at)
+        method = invoice.payment_method
+        _add(
+            sales_totals,
+            (invoice.store_id, day, method),
+            [
+                sign,
+                sign * Decimal(invoice.total_amount).quantize(CENT),
+                sign * Decimal(invoice.gst_amount).quantize(CENT),
+                sign * Decimal(invoice.grand_total).quantize(CENT),
+            ],
+        )
+        for line in lines:
+            # As the line is stored: amounts rounded to the cent
+            values = [
+                sign * line.quantity,
+                sign * (line.unit_price * line.quantity).quantize(CENT),
+                sign * Decimal(line.gst_amount).quantize(CENT),
+                sign * Decimal(line.total_amount).quantize(CENT),
+            ]
+            category = line.medicine.category_id
+            _add(category_totals, (invoice.store_id, day, category, method), values)
+            _add(medicine_totals, (invoice.store_id, day, line.medicine_id), values)
+            _add(
+                batch_totals,
+                (invoice.store_id, day, line.batch_id, line.medicine_id),
+                [
+                    values[0],
+                    values[1],
+                    sign * line.batch.purchase_price * line.quantity,
+                ],
+            )
+    _upsert("sales", sales_totals)
+    _upsert("category", category_totals)
+    _upsert("medicine", medicine_totals)
+    _upsert("batch", batch_totals)
+
+
+def _money(expression):
+    return Sum(expression, output_field=DecimalField(max_digits=14, decimal_places=2))
+
+
+def _rebuild(store_id, first, last):
+    # Recompute one store's rollups for first..last from its invoices
+    invoices = Invoice.objects.filter(
+        store_id=store_id,
+        created_at__gte=start_of_day(first),
+        created_at__lt=start_of_day(last + timedelta(days=1)),
+    )
+    sales = (
+        invoices.annotate(day=TruncDate("created_at"))
+        .values("day", "payment_method")
+        .annotate(
+            invoices=Count("id"),
+            taxable_value=_money("total_amount"),
+            gst=_money("gst_amount"),
+            total=_money("grand_total"),
+        )
+        .order_by()
+    )
+    lines = (
+        InvoiceItem.objects.filter(invoice__in=invoices)
+        .annotate(day=TruncDate("invoice__created_at"))
+        .order_by()
+    )
+    line_totals = {
+        "sold": Sum("quantity"),
+        "taxable_value": _money(F("unit_price") * F("quantity")),
+        "gst": _money("gst_amount"),
+        "total": _money("total_amount"),
+    }
+    by_category = lines.values(
+        "day", "medicine__category_id", "invoice__payment_method"
+    ).annotate(**line_totals)
+    by_medicine = lines.values("day", "medicine_id").annotate(**line_totals)
+    by_batch = lines.values("day", "batch_id", "medicine_id").annotate(
+        sold=Sum("quantity"),
+        taxable_value=_money(F("unit_price") * F("quantity")),
+        cost=_money(F("batch__purchase_price") * F("quantity")),
+    )
+
+    with transaction.atomic():
+        for model in (
+            DailySales,
+            DailyCategorySales,
+            DailyMedicineSales,
+            DailyBatchSales,
+        ):
+            model.objects.filter(store_id=store_id, day__range=(first, last)).delete()
+        rows = [
+            DailySales(
+                store_id=store_id,
+                day=row["day"],
+                payment_method=row["payment_method"],
+                invoices=row["invoices"],
+                taxable_value=row["taxable_value"],
+                gst_amount=row["gst"],
+                total_amount=row["total"],
+            )
+            for row in sales
+        ]
+        DailySales.objects.bulk_create(rows, batch_size=1000)
+        categories = DailyCategorySales.objects.bulk_create(
+            [
+                DailyCategorySales(
+                    store_id=store_id,
+                    day=row["day"],
+                    category_id=row["medicine__category_id"],
+                    payment_method=row["invoice__payment_method"],
+                    quantity=row["sold"],
+                    taxable_value=row["taxable_value"],
+                    gst_amount=row["gst"],
+                    total_amount=row["total"],
+                )
+                for row in by_category
+            ],
+            batch_size=1000,
+        )
+        medicines = DailyMedicineSales.objects.bulk_create(
+            [
+                DailyMedicineSales(
+                    store_id=store_id,
+                    day=row["day"],
+                    medicine_id=row["medicine_id"],
+                    quantity=row["sold"],
+                    taxable_value=row["taxable_value"],
+                    gst_amount=row["gst"],
+                    total_amount=row["total"],
+                )
+                for row in by_medicine
+            ],
+            batch_size=1000,
+        )
+        batches = DailyBatchSales.objects.bulk_create(
+            [
+                DailyBatchSales(
+                    store_id=store_id,
+                    day=row["day"],
+                    batch_id=row["batch_id"],
+                    medicine_id=row["medicine_id"],
+                    quantity=row["sold"],
+                    taxable_value=row["taxable_value"],
+                    cost_amount=row["cost"],
+                )
+                for row in by_batch
+            ],
+            batch_size=1000,
+        )
+    return len(rows) + len(categories) + len(medicines) + len(batches)
+
+
+def rebuild_sales_rollups(first=None, last=None):
+    """
+    Recompute the rollups of every store in this database for the days
+    first..last (default: from its first invoice to today) from the
+    invoices themselves, a month per transaction. Use it to fill the
+    rollups for sales posted before they existed, or to repair them.
+    Returns a report: stores, months, rows and seconds.
+    """
+    started = time.perf_counter()
+    last = last or timezone.localdate()
+    report = {"stores": 0, "months": 0, "rows": 0}
+    for store_id in Store.objects.order_by("id").values_list("id", flat=True):
+        start = first
+        if start is None:
+            created_at = (
+                Invoice.objects.filter(store_id=store_id)
+                .order_by("created_at")
+                .values_list("created_at", flat=True)
+                .first()
+            )
+            if created_at is None:
+                continue
+            start = timezone.localdate(created_at)
+        report["stores"] += 1
+        month = month_start(start)
+        while month <= last:
+            report["rows"] += _rebuild(
+                store_id, max(month, start), min(next_month(month) - timedelta(1), last)
+            )
+            report["months"] += 1
+            month = next_month(month)
+    report["seconds"] = time.perf_counter() - started
+    return report
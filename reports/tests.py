@@ -1,3 +1,99 @@
-from django.test import TestCase
+from decimal import Decimal
 
-# Create your tests here.
+from billing.services import create_invoice
+from pharmacy_project.query_plans import QueryPlanTestCase, make_sample_stock
+from reports.models import (
+    DailyBatchSales,
+    DailyCategorySales,
+    DailyMedicineSales,
+    DailySales,
+)
+from reports.rollups import rebuild_sales_rollups
+
+
+class HotQueryPlanTests(QueryPlanTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        make_sample_stock()
+
+    def test_report_dashboard(self):
+        response = self.assertNoFullScans(lambda: self.client.get("/reports"))
+        self.assertEqual(response.context["cat_labels"], ["Antibiotic"])
+
+    def test_gst_report(self):
+        response = self.assertNoFullScans(lambda: self.client.get("/reportsgst/"))
+        [row] = response.context["hsn"]
+        self.assertEqual(
+            (row["hsn_code"], row["gst_rate"], row["taxable_value"], row["cgst"]),
+            ("3004", Decimal("12.00"), Decimal("20.00"), Decimal("1.20")),
+        )
+        self.assertEqual(response.context["totals"]["total_tax"], Decimal("2.40"))
+
+        for export in ("hsn", "register"):
+            content = self.assertNoFullScans(
+                lambda export=export: b"".join(
+                    self.client.get(
+                        "/reportsgst/", {"export": export}
+                    ).streaming_content
+                )
+            )
+            self.assertEqual(len(content.decode().splitlines()), 2)
+
+    def test_margin_report(self):
+        response = self.assertNoFullScans(lambda: self.client.get("/reportsmargin/"))
+        [row] = response.context["rows"]
+        self.assertEqual(
+            (row["label"], row["revenue"], row["cost"], row["margin_percent"]),
+            ("Antibiotic", Decimal("20.00"), Decimal("12.00"), Decimal("40.0")),
+        )
+        # Drill down to the medicine, then to the batch sold
+        for label in ("Amoxicillin", "B1"):
+            response = self.assertNoFullScans(
+                lambda row=row: self.client.get("/reportsmargin/" + row["drill_url"])
+            )
+            [row] = response.context["rows"]
+            self.assertEqual(row["label"], label)
+        for by in ("brand", "supplier", "day"):
+            response = self.assertNoFullScans(
+                lambda by=by: self.client.get("/reportsmargin/", {"by": by})
+            )
+            self.assertEqual(response.context["totals"]["margin"], Decimal("8.00"))
+
+
+class RollupTests(QueryPlanTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.sample = make_sample_stock()
+
+    def rollups(self):
+        return [
+            sorted(
+                model.objects.values_list(
+                    *(field.attname for field in model._meta.concrete_fields[1:])
+                )
+            )
+            for model in (
+                DailySales,
+                DailyCategorySales,
+                DailyMedicineSales,
+                DailyBatchSales,
+            )
+        ]
+
+    def test_checkout_matches_rebuild(self):
+        amoxicillin, azithromycin, _ = self.sample["medicines"]
+        create_invoice(
+            self.sample["staff"],
+            {
+                str(amoxicillin.id): {"quantity": 3},
+                str(azithromycin.id): {"quantity": 1},
+            },
+            payment_method="UPI",
+        )
+        create_invoice(self.sample["staff"], {str(amoxicillin.id): {"quantity": 1}})
+
+        sales = DailySales.objects.get(payment_method="CASH")
+        self.assertEqual((sales.invoices, sales.total_amount), (2, Decimal("33.60")))
+        kept = self.rollups()
+        rebuild_sales_rollups()
+        self.assertEqual(self.rollups(), kept)
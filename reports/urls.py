@@ -3,4 +3,6 @@ from . import views
 
 urlpatterns = [
     path("", views.report_dashboard, name="report_dashboard"),
+    path("gst/", views.gst_report, name="gst_report"),
+    path("margin/", views.margin_view, name="margin_report"),
 ]
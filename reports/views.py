@@ -1,62 +1,66 @@
+from django.http import HttpResponseBadRequest, StreamingHttpResponse
 from django.shortcuts import render
-from django.db.models import Sum, Count, F, Avg
-from django.db.models.functions import TruncDate
+from django.db.models import Sum
 from django.utils import timezone
-from datetime import timedelta
+from datetime import date, timedelta
 
-# Replace with your actual app name if different
-from billing.models import Invoice, InvoiceItem
+from medicines.models import Brand, Category, Medicine, Supplier
+from pharmacy_project.streaming import CSV_TYPE, stream_csv
+
+from .gst import HSN_COLUMNS, REGISTER_COLUMNS, gst_summary, hsn_rows, register_rows
+from .margins import DIMENSIONS, margin_report
+from .models import DailyCategorySales, DailySales
+from .rollups import rollup_between
 
 
 def report_dashboard(request):
     # 1. Date Range (Default: Last 30 Days)
-    end_date = timezone.now().date()
+    end_date = timezone.localdate()
     start_date = end_date - timedelta(days=30)
 
-    # Base Queryset: Invoices from last 30 days
-    recent_invoices = Invoice.objects.filter(created_at__date__gte=start_date)
+    # Read from the daily rollups: the cost follows the days, not the sales
+    daily_sales = rollup_between(DailySales, start_date, end_date)
+    totals = daily_sales.aggregate(
+        revenue=Sum("total_amount"), tax=Sum("gst_amount"), invoices=Sum("invoices")
+    )
 
     # --- KPI CARD 1: GROSS REVENUE ---
-    total_revenue = recent_invoices.aggregate(sum=Sum("grand_total"))["sum"] or 0
+    total_revenue = totals["revenue"] or 0
 
     # --- KPI CARD 2: TAX LIABILITY (GST) ---
-    # Assuming 'tax_amount' exists on Invoice. If not, we calculate it from items.
-    # Logic: Sum of all (item_total - (item_total / 1.12)) roughly, or use your exact field
-    # For now, I will assume you store tax. If not, I'll use a flat estimate based on your screenshot context.
-    # precise_tax = InvoiceItem.objects.filter(invoice__in=recent_invoices).aggregate(tax=Sum('tax_amount'))['tax'] or 0
-    # Let's use a safe fallback if you don't have a direct tax field:
-    estimated_tax = float(total_revenue) * 0.12  # Placeholder 12% estimate
+    # GST charged on the invoices, from the same rollup read
+    tax_liability = totals["tax"] or 0
 
     # --- KPI CARD 3: AVG ORDER VALUE ---
-    avg_order_value = recent_invoices.aggregate(avg=Avg("grand_total"))["avg"] or 0
+    avg_order_value = total_revenue / totals["invoices"] if totals["invoices"] else 0
 
     # --- CHART 1: REVENUE TREND (Line Chart) ---
     # Group by Day and Sum Revenue
     daily_revenue = (
-        recent_invoices.annotate(date=TruncDate("created_at"))
-        .values("date")
-        .annotate(daily_sum=Sum("grand_total"))
-        .order_by("date")
+        daily_sales.values("day")
+        .annotate(daily_sum=Sum("total_amount"))
+        .order_by("day")
     )
 
-    chart_dates = [entry["date"].strftime("%d/%m") for entry in daily_revenue]
+    chart_dates = [entry["day"].strftime("%d/%m") for entry in daily_revenue]
     chart_values = [float(entry["daily_sum"]) for entry in daily_revenue]
 
     # --- CHART 2: SALES BY CATEGORY (Doughnut Chart) ---
-    # We need to join Invoice -> InvoiceItem -> Medicine -> Category
     category_sales = (
-        InvoiceItem.objects.filter(invoice__in=recent_invoices)
-        .values("medicine__category__name")
+        rollup_between(DailyCategorySales, start_date, end_date)
+        .values("category__name")
         .annotate(total=Sum("total_amount"))
         .order_by("-total")[:5]
     )
 
-    cat_labels = [entry["medicine__category__name"] for entry in category_sales]
+    cat_labels = [entry["category__name"] for entry in category_sales]
     cat_values = [float(entry["total"]) for entry in category_sales]
 
     context = {
         "total_revenue": total_revenue,
-        "tax_liability": estimated_tax,
+        "tax_liability": tax_liability,
+        "start_date": start_date,
+        "end_date": end_date,
         "avg_order_value": avg_order_value,
         "chart_dates": chart_dates,
         "chart_values": chart_values,
@@ -65,3 +69,128 @@ def report_dashboard(request):
     }
 
     return render(request, "reports/report_dashboard.html", context)
+
+
+def _date_range(params, default_start):
+    # The from/to days of a report, both included
+    start_date = date.fromisoformat(params.get("from") or default_start.isoformat())
+    end_date = date.fromisoformat(params.get("to") or timezone.localdate().isoformat())
+    if start_date > end_date:
+        raise ValueError("The from date can't be after the to date.")
+    return start_date, end_date
+
+
+# GST on the sales of a date range (default: this month so far): by tax
+# slab and HSN code, or streamed as CSV, the HSN summary (export=hsn) or
+# the rate-wise invoice register (export=register)
+def gst_report(request):
+    try:
+        start_date, end_date = _date_range(
+            request.GET, timezone.localdate().replace(day=1)
+        )
+    except ValueError:
+        return HttpResponseBadRequest(
+            "Give from and to dates as YYYY-MM-DD, from before to."
+        )
+
+    export = request.GET.get("export")
+    if export in ("hsn", "register"):
+        if export == "hsn":
+            content = stream_csv(
+                HSN_COLUMNS, hsn_rows(gst_summary(start_date, end_date))
+            )
+        else:
+            content = stream_csv(REGISTER_COLUMNS, register_rows(start_date, end_date))
+        response = StreamingHttpResponse(content, content_type=CSV_TYPE)
+        response["Content-Disposition"] = (
+            f'attachment; filename="gst-{export}-{start_date:%Y-%m-%d}'
+            f'-{end_date:%Y-%m-%d}.csv"'
+        )
+        return response
+
+    context = {
+        "start_date": start_date,
+        "end_date": end_date,
+        **gst_summary(start_date, end_date),
+    }
+    return render(request, "reports/gst_report.html", context)
+
+
+# Models naming the rows a margin report is drilled into
+DRILL_LABELS = {
+    "category": Category,
+    "brand": Brand,
+    "supplier": Supplier,
+    "medicine": Medicine,
+}
+
+
+def _drill_key(name, value):
+    # A row's key as it travels in the URL: "none" for rows without one
+    if value == "none":
+        return None
+    return date.fromisoformat(value) if name == "day" else int(value)
+
+
+# Revenue, cost of goods and margin of a date range (default: last 30 days)
+# by category, brand, supplier, day, medicine or batch (by=...). Each row
+# links to the next breakdown down, narrowed to it.
+def margin_view(request):
+    by = request.GET.get("by", "category")
+    try:
+        start_date, end_date = _date_range(
+            request.GET, timezone.localdate() - timedelta(days=30)
+        )
+        if by not in DIMENSIONS:
+            raise ValueError(by)
+        filters = {
+            name: _drill_key(name, request.GET[name])
+            for name in DIMENSIONS
+            if name != "batch" and request.GET.get(name)
+        }
+    except ValueError:
+        return HttpResponseBadRequest(
+            "Give from and to dates as YYYY-MM-DD, from before to, and a "
+            "breakdown of " + ", ".join(DIMENSIONS) + "."
+        )
+
+    rows, totals = margin_report(start_date, end_date, by, **filters)
+    drill_into = DIMENSIONS[by][2]
+    for row in rows:
+        if drill_into:
+            params = request.GET.copy()
+            params[by] = "none" if row["key"] is None else str(row["key"])
+            params["by"] = drill_into
+            row["drill_url"] = "?" + params.urlencode()
+
+    drilled = []
+    for name, key in filters.items():
+        if key is None:
+            label = "None"
+        elif name == "day":
+            label = key.strftime("%d %b %Y")
+        else:
+            label = (
+                DRILL_LABELS[name]
+                .objects.filter(pk=key)
+                .values_list("name", flat=True)
+                .first()
+            )
+        drilled.append({"name": name, "label": label})
+
+    breakdowns = []
+    for name in DIMENSIONS:
+        params = request.GET.copy()
+        params["by"] = name
+        breakdowns.append({"name": name, "url": "?" + params.urlencode()})
+
+    context = {
+        "start_date": start_date,
+        "end_date": end_date,
+        "by": by,
+        "rows": rows,
+        "totals": totals,
+        "drilled": drilled,
+        "breakdowns": breakdowns,
+    }
+    return render(request, "reports/margin_report.html", context)